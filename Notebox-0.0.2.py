@@ -1,14 +1,17 @@
 import sys
 import os
-import json
 import math
+import bisect
 import random
 import time
 import re
 import uuid
 import ctypes
+import logging
+from collections import deque
 from datetime import datetime
-from functools import partial
+from contextlib import contextmanager
+from functools import partial, lru_cache
 
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                            QLabel, QPushButton, QToolBar, QAction, QFileDialog, QMessageBox,
@@ -18,10 +21,14 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
                            QListWidget, QListWidgetItem, QGraphicsDropShadowEffect, QGridLayout, QShortcut,
                            QWidgetAction)
 from PyQt5.QtCore import (Qt, QPoint, QRect, QSize, QTimer, QEvent, QMimeData, QByteArray, QBuffer, QIODevice,
-                        pyqtSignal, QPropertyAnimation, QEasingCurve, QRectF, QPointF, QLineF, QTime)
+                        pyqtSignal, QPropertyAnimation, QEasingCurve, QRectF, QPointF, QLineF, QTime,
+                        QObject, QRunnable, QThreadPool)
 from PyQt5.QtGui import (QColor, QPainter, QPen, QBrush, QFont, QPixmap, QDrag, QCursor, QPolygon, 
-                        QBrush, QPolygon, QPainterPath, QPalette, QIcon, QRadialGradient, QLinearGradient, QKeySequence, QFontMetrics)
-from PyQt5.QtSvg import QSvgGenerator
+                        QBrush, QPolygon, QPainterPath, QPalette, QIcon, QRadialGradient, QLinearGradient, QKeySequence, QFontMetrics,
+                        QPixmapCache, QImage, QStaticText, QTransform)
+
+# Diagnostics go through logging so hot paths skip message formatting unless DEBUG is enabled
+logger = logging.getLogger("notebox")
 
 # Dark mode colors
 DARK_BG = QColor(45, 45, 45)
@@ -33,613 +40,1055 @@ DARK_SELECTION = QColor(0, 120, 215)
 ARROW_COLOR = QColor(100, 150, 255, 180)  # Faint blue color for arrows
 DARK_BORDER = QColor(100, 100, 100)
 ELEMENT_TEXT_COLOR = QColor(0, 0, 0)  # Black color for element text
+CANVAS_BG_COLOR = QColor(40, 40, 40)
 
-# Windows-specific dark mode constants
-DWMWA_USE_IMMERSIVE_DARK_MODE = 20
+# Shared pens for painting. QPen is a value type, so building these once here
+# avoids allocating identical pens on every paint of every element
+ELEMENT_TEXT_PEN = QPen(ELEMENT_TEXT_COLOR)
+GRID_PEN = QPen(DARK_GRID, 1, Qt.SolidLine)
+ARROW_PEN = QPen(ARROW_COLOR, 1, Qt.SolidLine)
+CONNECTION_GLOW_PEN = QPen(QColor(0, 160, 255, 56), 5, Qt.SolidLine)  # 80 * 0.7 = 56
+CONNECTION_HIGHLIGHT_PEN = QPen(QColor(0, 160, 255, 178), 2, Qt.SolidLine)  # 255 * 0.7 = 178
+HIGHLIGHT_PEN = QPen(QColor(0, 160, 255, 178), 2.5)  # 255 * 0.7 = 178
+HIGHLIGHT_GLOW_PEN = QPen(QColor(0, 160, 255, 56), 1.5, Qt.DashLine)  # 80 * 0.7 = 56
+CONTAINER_PEN = QPen(QColor(100, 150, 100), 1.5, Qt.SolidLine)
+CONTAINER_TITLE_PEN = QPen(QColor(220, 240, 220))
+CONTAINER_INDICATOR_COLOR = QColor(100, 200, 100)
+CONNECTION_PREVIEW_PEN = QPen(QColor(200, 200, 200), 2, Qt.DashLine)
+NESTING_PREVIEW_PEN = QPen(QColor(100, 200, 100), 2, Qt.DashLine)
+CUT_LINE_PEN = QPen(QColor(255, 100, 100), 2, Qt.DashLine)
+RUBBER_BAND_PEN = QPen(QColor(100, 150, 255), 1, Qt.DashLine)
+RUBBER_BAND_COLOR = QColor(100, 150, 255, 50)
 
-def set_window_dark_mode(hwnd):
-    """Enable dark mode for a window (Windows 10/11 only)"""
-    try:
-        # Check if running on Windows
-        if sys.platform == "win32":
-            # Try to set dark mode for the window
-            dwmapi = ctypes.WinDLL("dwmapi")
-            value = ctypes.c_int(1)  # 1 = dark mode
-            dwmapi.DwmSetWindowAttribute(
-                hwnd,
-                DWMWA_USE_IMMERSIVE_DARK_MODE,
-                ctypes.byref(value),
-                ctypes.sizeof(value)
-            )
-            return True
-    except Exception as e:
-        print(f"Failed to set dark mode for window: {e}")
-        return False
+# Size of the shared pixmap cache that holds rendered elements, in KB. Qt's 10 MB
+# default only fits a handful of elements at high zoom; set to None to keep it
+PIXMAP_CACHE_LIMIT_KB = 64 * 1024
 
-class DiagramElement:
-    """Base class for all diagram elements"""
-    def __init__(self, x, y, width, height, label=""):
-        self.x = x
-        self.y = y
-        self.label = label
-        
-        # Calculate minimum size based on text content
-        min_width, min_height = self._calculate_min_size_for_text(label)
-        
-        # Use the larger of the provided size or the minimum required size
-        self.width = max(width, min_width)
-        self.height = max(height, min_height)
-        
-        self.id = id(self)
-        self.color = QColor(180, 180, 180)  # Lighter default color for elements
-        self.border_color = QColor(120, 120, 120)  # Darker border for contrast
-        self.selected = False
-        self.connections = []  # List of connected elements
-        self.parent = None  # Parent element for nesting
-        self.children = []  # Child elements nested inside this element
-        self.container_title = ""  # Initialize with empty string for custom container title
+# Application-wide stylesheet for the window frame, scrollbars, toolbars, tooltips and menus
+APP_STYLESHEET = """
+    /* Custom window frame styling */
+    QMainWindow {
+        border: 1px solid #505050;
+    }
     
-    def _calculate_min_size_for_text(self, text):
-        """Calculate the minimum size needed to display the text comfortably"""
-        if not text:
-            return 100, 60  # Default minimum size
-        
-        # Create a temporary QFontMetrics to measure text
-        font = QFont()
-        # Make the font slightly larger to ensure text fits
-        font.setPointSize(10)  # Default size is usually 8 or 9
-        font_metrics = QFontMetrics(font)
-        
-        # Get text dimensions - use horizontalAdvance if available (newer PyQt5), fall back to width
-        try:
-            text_width = font_metrics.horizontalAdvance(text)
-        except AttributeError:
-            # Fall back to width for older PyQt5 versions
-            text_width = font_metrics.width(text)
-            
-        text_height = font_metrics.height()
-        
-        # Add generous padding around the text (40px on each side horizontally, 30px vertically)
-        min_width = text_width + 80
-        min_height = text_height + 60
-        
-        # Ensure minimum dimensions
-        min_width = max(min_width, 100)
-        min_height = max(min_height, 60)
-        
-        print(f"Text: '{text}', Calculated min size: {min_width}x{min_height}")
-        
-        return min_width, min_height
+    /* Title bar styling */
+    QWidget#titleBar {
+        background-color: #2a2a2a;
+        color: #e0e0e0;
+        border-bottom: 1px solid #505050;
+        min-height: 28px;
+        max-height: 28px;
+    }
     
-    def contains(self, point):
-        return (self.x <= point.x() <= self.x + self.width and 
-                self.y <= point.y() <= self.y + self.height)
+    /* Title bar buttons */
+    QPushButton#titleMinButton, QPushButton#titleMaxButton, QPushButton#titleCloseButton {
+        background-color: transparent;
+        color: #e0e0e0;
+        border: none;
+        font-size: 14px;
+    }
+    QPushButton#titleMinButton:hover, QPushButton#titleMaxButton:hover {
+        background-color: #505050;
+    }
+    QPushButton#titleCloseButton:hover {
+        background-color: #e04040;
+        color: white;
+    }
     
-    def overlaps_with(self, other, padding=10):
-        """Check if this element overlaps with another element, considering padding"""
-        # Add padding to both elements
-        this_rect = QRectF(self.x - padding, self.y - padding, 
-                          self.width + 2 * padding, self.height + 2 * padding)
-        other_rect = QRectF(other.x, other.y, other.width, other.height)
-        
-        # Check if the rectangles intersect
-        return this_rect.intersects(other_rect)
+    /* Improved scrollbar styling; shared rules are grouped so only the
+       orientation-specific sizes are repeated */
+    QScrollBar {
+        background: #2a2a2a;
+        margin: 0px;
+        border-radius: 5px;
+    }
+    QScrollBar:vertical {
+        width: 10px;
+    }
+    QScrollBar:horizontal {
+        height: 10px;
+    }
+    QScrollBar::handle {
+        background: #505050;
+        border-radius: 5px;
+    }
+    QScrollBar::handle:vertical {
+        min-height: 20px;
+    }
+    QScrollBar::handle:horizontal {
+        min-width: 20px;
+    }
+    QScrollBar::handle:hover {
+        background: #606060;
+    }
+    QScrollBar::add-line, QScrollBar::sub-line {
+        width: 0px;
+        height: 0px;
+    }
+    QScrollBar::add-page, QScrollBar::sub-page {
+        background: none;
+    }
     
-    def draw(self, painter):
-        # To be implemented by subclasses
-        pass
+    QToolBar {
+        background-color: #2d2d2d;
+        border-bottom: 1px solid #3c3c3c;
+    }
+    QToolButton {
+        background-color: #3c3c3c;
+        color: #e0e0e0;
+        border: 1px solid #505050;
+        padding: 4px;
+    }
+    QToolButton:hover {
+        background-color: #505050;
+    }
+    QSplitter::handle {
+        background-color: #3c3c3c;
+    }
+    QMainWindow::separator {
+        background-color: #3c3c3c;
+        width: 1px;
+        height: 1px;
+    }
+    QToolTip {
+        background-color: #3d3d3d;
+        color: #ffffff;
+        border: 1px solid #505050;
+        padding: 2px;
+    }
+    QMenu {
+        background-color: #2d2d2d;
+        color: #e0e0e0;
+        border: 1px solid #505050;
+    }
+    QMenu::item:selected {
+        background-color: #3a6ea5;
+    }
+"""
+
+# Page written by the HTML export; filled in with str.format (svg_content, d2_code),
+# so literal braces in the CSS and JavaScript are doubled
+HTML_EXPORT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <title>D2 Diagram</title>
+    <meta charset="utf-8">
+    <style>
+        body {{ background-color: #2d2d2d; color: #e0e0e0; font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
+        body.fullscreen {{ padding: 0; }}
+        .container {{ display: flex; flex-direction: column; max-width: 1200px; margin: 0 auto; }}
+        .container.fullscreen {{ max-width: 100%; height: 100vh; margin: 0; }}
+        .diagram-container {{ background-color: #3c3c3c; padding: 20px; border-radius: 5px; margin-bottom: 20px; min-height: 400px; position: relative; overflow: hidden; }}
+        .container.fullscreen .diagram-container {{ height: 100%; margin-bottom: 0; border-radius: 0; }}
+        .diagram-controls {{ position: absolute; top: 10px; right: 10px; z-index: 10; background-color: rgba(60, 60, 60, 0.7); padding: 5px; border-radius: 5px; }}
+        .diagram-controls button {{ background-color: #555; color: white; border: none; border-radius: 3px; margin: 2px; padding: 5px 10px; cursor: pointer; display: flex; align-items: center; justify-content: center; }}
+        .diagram-controls button:hover {{ background-color: #666; }}
+        .diagram-controls button svg {{ width: 16px; height: 16px; }}
+        .diagram-controls button svg path {{ fill: #e0e0e0; }}
+        .diagram-wrapper {{ width: 100%; height: 100%; overflow: hidden; position: relative; }}
+        .diagram {{ position: relative; transform-origin: 0 0; }}
+        .code-container {{ background-color: #1e1e1e; padding: 20px; border-radius: 5px; position: relative; }}
+        .container.fullscreen .code-container {{ display: none; }}
+        .code {{ white-space: pre-wrap; font-family: monospace; margin: 0; }}
+        .copy-button {{ position: absolute; top: 10px; right: 10px; background-color: #555; border: none; border-radius: 3px; width: 32px; height: 32px; cursor: pointer; display: flex; align-items: center; justify-content: center; padding: 0; z-index: 5; }}
+        .copy-button:hover {{ background-color: #666; }}
+        .copy-button svg {{ width: 16px; height: 16px; }}
+        .copy-button svg path {{ fill: #e0e0e0; }}
+        .copy-tooltip {{ position: absolute; top: 15px; right: 50px; background-color: #333; color: white; padding: 5px 10px; border-radius: 3px; display: none; font-size: 12px; }}
+        h1, h2 {{ color: #e0e0e0; }}
+        .container.fullscreen h1 {{ display: none; }}
+        .container.fullscreen h2 {{ display: none; }}
+        svg {{ max-width: 100%; height: auto; display: block; }}
+    </style>
+</head>
+<body>
+    <div class="container" id="main-container">
+        <h1>D2 Diagram</h1>
+        <div class="diagram-container">
+            <div class="diagram-controls">
+                <button id="zoom-in" title="Zoom In">
+                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
+                        <path d="M19 13h-6v6h-2v-6H5v-2h6V5h2v6h6v2z"/>
+                    </svg>
+                </button>
+                <button id="zoom-out" title="Zoom Out">
+                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
+                        <path d="M19 13H5v-2h14v2z"/>
+                    </svg>
+                </button>
+                <button id="zoom-fit" title="Zoom to Fit">
+                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
+                        <path d="M18 4H6c-1.1 0-2 .9-2 2v12c0 1.1.9 2 2 2h12c1.1 0 2-.9 2-2V6c0-1.1-.9-2-2-2zm0 14H6V6h12v12z"/>
+                    </svg>
+                </button>
+                <button id="fullscreen" title="Toggle Fullscreen">
+                    <svg id="fullscreen-icon" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
+                        <path d="M7 14H5v5h5v-2H7v-3zm-2-4h2V7h3V5H5v5zm12 7h-3v2h5v-5h-2v3zM14 5v2h3v3h2V5h-5z"/>
+                    </svg>
+                    <svg id="exit-fullscreen-icon" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg" style="display: none;">
+                        <path d="M5 16h3v3h2v-5H5v2zm3-8H5v2h5V5H8v3zm6 11h2v-3h3v-2h-5v5zm2-11V5h-2v5h5V8h-3z"/>
+                    </svg>
+                </button>
+            </div>
+            <div class="diagram-wrapper">
+                <div class="diagram" id="diagram">
+                    {svg_content}
+                </div>
+            </div>
+        </div>
+        <h2>D2 Code</h2>
+        <div class="code-container">
+            <button class="copy-button" id="copy-button" title="Copy to clipboard">
+                <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
+                    <path d="M16 1H4C2.9 1 2 1.9 2 3v14h2V3h12V1zm3 4H8C6.9 5 6 5.9 6 7v14c0 1.1.9 2 2 2h11c1.1 0 2-.9 2-2V7c0-1.1-.9-2-2-2zm0 16H8V7h11v14z"/>
+                </svg>
+            </button>
+            <div class="copy-tooltip" id="copy-tooltip">Copied!</div>
+            <pre class="code" id="d2-code">{d2_code}</pre>
+        </div>
+    </div>
     
-    def to_d2(self):
-        # Base implementation for D2 code generation
-        d2_code = f"{self.label}: {{\n  style.fill: \"#{self.color.red():02x}{self.color.green():02x}{self.color.blue():02x}\"\n"
-        
-        # Add container information if this element has children
-        if self.children:
-            # Add container title if available
-            container_title = self.container_title if self.container_title else f"{self.label}"
-            d2_code += f"  # Container: {container_title}\n"
+    <script>
+        // Pan and zoom functionality
+        (function() {{
+            const container = document.getElementById('main-container');
+            const diagramContainer = document.querySelector('.diagram-container');
+            const diagramWrapper = document.querySelector('.diagram-wrapper');
+            const diagram = document.getElementById('diagram');
+            const zoomInBtn = document.getElementById('zoom-in');
+            const zoomOutBtn = document.getElementById('zoom-out');
+            const zoomFitBtn = document.getElementById('zoom-fit');
+            const fullscreenBtn = document.getElementById('fullscreen');
+            const fullscreenIcon = document.getElementById('fullscreen-icon');
+            const exitFullscreenIcon = document.getElementById('exit-fullscreen-icon');
             
-            # Add child elements with unique IDs to avoid conflicts
-            for i, child in enumerate(self.children):
-                child_id = f"{self.label}_{child.label}_{i}"
-                d2_code += f"  {child_id}: {{\n"
-                d2_code += f"    label: {child.label}\n"
-                if isinstance(child, CircleElement):
-                    d2_code += f"    shape: circle\n"
-                elif isinstance(child, DiamondElement):
-                    d2_code += f"    shape: diamond\n"
-                elif isinstance(child, HexagonElement):
-                    d2_code += f"    shape: hexagon\n"
-                else:  # Default to box/rectangle
-                    d2_code += f"    shape: rectangle\n"
-                d2_code += f"    style.fill: \"#{child.color.red():02x}{child.color.green():02x}{child.color.blue():02x}\"\n"
-                d2_code += f"  }}\n"
-        
-        d2_code += "}"
-        return d2_code
-    
-    def move(self, dx, dy):
-        self.x += dx
-        self.y += dy
-        
-        # Move all children with the parent
-        for child in self.children:
-            child.move(dx, dy)
-        
-    def resize(self, width, height):
-        # Calculate minimum size based on text content
-        min_width, min_height = self._calculate_min_size_for_text(self.label)
-        
-        # Use the larger of the provided size or the minimum required size
-        self.width = max(width, min_width)
-        self.height = max(height, min_height)
-
-
-class BoxElement(DiagramElement):
-    """A rectangular box element"""
-    def __init__(self, x, y, width=100, height=60, label="Box"):
-        super().__init__(x, y, width, height, label)
-        
-    def draw(self, painter):
-        if self.selected:
-            painter.setPen(QPen(DARK_SELECTION, 2, Qt.SolidLine))
-        else:
-            painter.setPen(QPen(self.border_color, 1, Qt.SolidLine))
+            let scale = 1;
+            let translateX = 0;
+            let translateY = 0;
+            let isDragging = false;
+            let startX, startY;
+            let lastTranslateX = 0;
+            let lastTranslateY = 0;
+            let isFullscreen = false;
             
-        painter.setBrush(QBrush(self.color))
-        painter.drawRect(self.x, self.y, self.width, self.height)
-        
-        # Draw label with black text color
-        painter.setPen(QPen(ELEMENT_TEXT_COLOR))
-        
-        # Save the current font
-        original_font = painter.font()
-        
-        # Create a larger font for the text
-        font = QFont(original_font)
-        font.setPointSize(10)  # Larger font size
-        painter.setFont(font)
-        
-        # Draw the text centered in the element
-        painter.drawText(QRect(self.x, self.y, self.width, self.height), 
-                         Qt.AlignCenter, self.label)
-        
-        # Restore the original font
-        painter.setFont(original_font)
-    
-    def to_d2(self):
-        # Directly formatted D2 code for box elements
-        d2_code = f"{self.label}: {{\n  shape: rectangle\n  style.fill: \"#{self.color.red():02x}{self.color.green():02x}{self.color.blue():02x}\"\n  style.stroke: \"#000000\"\n"
-        
-        # Add position and size information as comments
-        d2_code += f"  # position: {self.x},{self.y},{self.width},{self.height}\n"
-        
-        # Add container information if this element has children
-        if self.children:
-            # Add container title if available
-            container_title = self.container_title if self.container_title else f"{self.label}"
-            d2_code += f"  # Container: {container_title}\n"
+            // Apply transform
+            function applyTransform() {{
+                diagram.style.transform = `translate(${{translateX}}px, ${{translateY}}px) scale(${{scale}})`;
+            }}
             
-            # Add child elements with unique IDs to avoid conflicts
-            for i, child in enumerate(self.children):
-                child_id = f"{self.label}_{child.label}_{i}"
-                d2_code += f"  {child_id}: {{\n"
-                d2_code += f"    label: {child.label}\n"
-                if isinstance(child, CircleElement):
-                    d2_code += f"    shape: circle\n"
-                elif isinstance(child, DiamondElement):
-                    d2_code += f"    shape: diamond\n"
-                elif isinstance(child, HexagonElement):
-                    d2_code += f"    shape: hexagon\n"
-                else:  # Default to box/rectangle
-                    d2_code += f"    shape: rectangle\n"
-                d2_code += f"    style.fill: \"#{child.color.red():02x}{child.color.green():02x}{child.color.blue():02x}\"\n"
-                # Add position and size information for child elements
-                d2_code += f"    # position: {child.x},{child.y},{child.width},{child.height}\n"
-                d2_code += f"  }}\n"
-        
-        d2_code += "}"
-        return d2_code
-
-
-class CircleElement(DiagramElement):
-    """A circular element"""
-    def __init__(self, x, y, width=80, height=80, label="Circle"):
-        super().__init__(x, y, width, height, label)
-        
-    def draw(self, painter):
-        if self.selected:
-            painter.setPen(QPen(DARK_SELECTION, 2, Qt.SolidLine))
-        else:
-            painter.setPen(QPen(self.border_color, 1, Qt.SolidLine))
+            // Reset transform
+            function resetTransform() {{
+                scale = 1;
+                translateX = 0;
+                translateY = 0;
+                applyTransform();
+            }}
             
-        painter.setBrush(QBrush(self.color))
-        painter.drawEllipse(self.x, self.y, self.width, self.height)
-        
-        # Draw label with black text color
-        painter.setPen(QPen(ELEMENT_TEXT_COLOR))
-        
-        # Save the current font
-        original_font = painter.font()
-        
-        # Create a larger font for the text
-        font = QFont(original_font)
-        font.setPointSize(10)  # Larger font size
-        painter.setFont(font)
-        
-        # Draw the text centered in the element
-        painter.drawText(QRect(self.x, self.y, self.width, self.height), 
-                         Qt.AlignCenter, self.label)
-        
-        # Restore the original font
-        painter.setFont(original_font)
-    
-    def to_d2(self):
-        # Directly formatted D2 code for circle elements
-        d2_code = f"{self.label}: {{\n  shape: circle\n  style.fill: \"#{self.color.red():02x}{self.color.green():02x}{self.color.blue():02x}\"\n  style.stroke: \"#000000\"\n"
-        
-        # Add position and size information as comments
-        d2_code += f"  # position: {self.x},{self.y},{self.width},{self.height}\n"
-        
-        # Add container information if this element has children
-        if self.children:
-            # Add container title if available
-            container_title = self.container_title if self.container_title else f"{self.label}"
-            d2_code += f"  # Container: {container_title}\n"
+            // Zoom to fit
+            function zoomToFit() {{
+                const svgElement = diagram.querySelector('svg');
+                if (svgElement) {{
+                    // Get container dimensions
+                    const containerWidth = diagramWrapper.clientWidth;
+                    const containerHeight = diagramWrapper.clientHeight;
+                    
+                    // Find diagram bounds by examining actual elements
+                    // This is more precise than using SVG dimensions which may have empty space
+                    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+                    
+                    // Check all diagram elements (shapes, text, etc)
+                    const elements = svgElement.querySelectorAll('rect, circle, ellipse, polygon, path, text, g');
+                    elements.forEach(el => {{
+                        // Try to get element bounding box
+                        try {{
+                            const bbox = el.getBBox();
+                            minX = Math.min(minX, bbox.x);
+                            minY = Math.min(minY, bbox.y);
+                            maxX = Math.max(maxX, bbox.x + bbox.width);
+                            maxY = Math.max(maxY, bbox.y + bbox.height);
+                        }} catch (e) {{
+                            // Some elements might not have bbox, ignore them
+                        }}
+                    }});
+                    
+                    // Fallback to SVG dimensions if we couldn't find elements
+                    if (minX === Infinity || maxX === -Infinity) {{
+                        minX = 0;
+                        minY = 0;
+                        maxX = svgElement.width.baseVal.value;
+                        maxY = svgElement.height.baseVal.value;
+                    }}
+                    
+                    // Calculate the actual content width and height
+                    const contentWidth = maxX - minX;
+                    const contentHeight = maxY - minY;
+                    
+                    // Add padding (5% on each side)
+                    const padding = 0.1;
+                    const paddedWidth = contentWidth * (1 + padding);
+                    const paddedHeight = contentHeight * (1 + padding);
+                    
+                    // Calculate scale to fit the padded content
+                    const scaleX = containerWidth / paddedWidth;
+                    const scaleY = containerHeight / paddedHeight;
+                    scale = Math.min(scaleX, scaleY);
+                    
+                    // Calculate center of content
+                    const contentCenterX = minX + contentWidth / 2;
+                    const contentCenterY = minY + contentHeight / 2;
+                    
+                    // Center the diagram - translate to container center, then offset by scaled content center
+                    translateX = containerWidth / 2 - contentCenterX * scale;
+                    translateY = containerHeight / 2 - contentCenterY * scale;
+                    
+                    applyTransform();
+                }}
+            }}
             
-            # Add child elements with unique IDs to avoid conflicts
-            for i, child in enumerate(self.children):
-                child_id = f"{self.label}_{child.label}_{i}"
-                d2_code += f"  {child_id}: {{\n"
-                d2_code += f"    label: {child.label}\n"
-                if isinstance(child, CircleElement):
-                    d2_code += f"    shape: circle\n"
-                elif isinstance(child, DiamondElement):
-                    d2_code += f"    shape: diamond\n"
-                elif isinstance(child, HexagonElement):
-                    d2_code += f"    shape: hexagon\n"
-                else:  # Default to box/rectangle
-                    d2_code += f"    shape: rectangle\n"
-                d2_code += f"    style.fill: \"#{child.color.red():02x}{child.color.green():02x}{child.color.blue():02x}\"\n"
-                # Add position and size information for child elements
-                d2_code += f"    # position: {child.x},{child.y},{child.width},{child.height}\n"
-                d2_code += f"  }}\n"
-        
-        d2_code += "}"
-        return d2_code
-
-
-class DiamondElement(DiagramElement):
-    """A diamond element"""
-    def __init__(self, x, y, width=100, height=80, label="Diamond"):
-        super().__init__(x, y, width, height, label)
-        
-    def draw(self, painter):
-        if self.selected:
-            painter.setPen(QPen(DARK_SELECTION, 2, Qt.SolidLine))
-        else:
-            painter.setPen(QPen(self.border_color, 1, Qt.SolidLine))
+            // Toggle fullscreen
+            function toggleFullscreen() {{
+                isFullscreen = !isFullscreen;
+                
+                if (isFullscreen) {{
+                    container.classList.add('fullscreen');
+                    document.body.classList.add('fullscreen');
+                    fullscreenIcon.style.display = 'none';
+                    exitFullscreenIcon.style.display = 'block';
+                }} else {{
+                    container.classList.remove('fullscreen');
+                    document.body.classList.remove('fullscreen');
+                    fullscreenIcon.style.display = 'block';
+                    exitFullscreenIcon.style.display = 'none';
+                }}
+                
+                // Adjust view when toggling fullscreen
+                setTimeout(zoomToFit, 100);
+            }}
             
-        painter.setBrush(QBrush(self.color))
-        
-        # Create a diamond shape using a polygon
-        points = [
-            QPoint(self.x + self.width // 2, self.y),  # Top
-            QPoint(self.x + self.width, self.y + self.height // 2),  # Right
-            QPoint(self.x + self.width // 2, self.y + self.height),  # Bottom
-            QPoint(self.x, self.y + self.height // 2)  # Left
-        ]
-        painter.drawPolygon(QPolygon(points))
-        
-        # Draw label with black text color
-        painter.setPen(QPen(ELEMENT_TEXT_COLOR))
-        
-        # Save the current font
-        original_font = painter.font()
-        
-        # Create a larger font for the text
-        font = QFont(original_font)
-        font.setPointSize(10)  # Larger font size
-        painter.setFont(font)
-        
-        # Draw the text centered in the element
-        painter.drawText(QRect(self.x, self.y, self.width, self.height), 
-                         Qt.AlignCenter, self.label)
-        
-        # Restore the original font
-        painter.setFont(original_font)
-    
-    def to_d2(self):
-        # Directly formatted D2 code for diamond elements
-        d2_code = f"{self.label}: {{\n  shape: diamond\n  style.fill: \"#{self.color.red():02x}{self.color.green():02x}{self.color.blue():02x}\"\n  style.stroke: \"#000000\"\n"
-        
-        # Add position and size information as comments
-        d2_code += f"  # position: {self.x},{self.y},{self.width},{self.height}\n"
-        
-        # Add container information if this element has children
-        if self.children:
-            # Add container title if available
-            container_title = self.container_title if self.container_title else f"{self.label}"
-            d2_code += f"  # Container: {container_title}\n"
+            // Zoom in
+            zoomInBtn.addEventListener('click', function() {{
+                scale += 0.1;
+                applyTransform();
+            }});
             
-            # Add child elements with unique IDs to avoid conflicts
-            for i, child in enumerate(self.children):
-                child_id = f"{self.label}_{child.label}_{i}"
-                d2_code += f"  {child_id}: {{\n"
-                d2_code += f"    label: {child.label}\n"
-                if isinstance(child, CircleElement):
-                    d2_code += f"    shape: circle\n"
-                elif isinstance(child, DiamondElement):
-                    d2_code += f"    shape: diamond\n"
-                elif isinstance(child, HexagonElement):
-                    d2_code += f"    shape: hexagon\n"
-                else:  # Default to box/rectangle
-                    d2_code += f"    shape: rectangle\n"
-                d2_code += f"    style.fill: \"#{child.color.red():02x}{child.color.green():02x}{child.color.blue():02x}\"\n"
-                # Add position and size information for child elements
-                d2_code += f"    # position: {child.x},{child.y},{child.width},{child.height}\n"
-                d2_code += f"  }}\n"
-        
-        d2_code += "}"
-        return d2_code
-
-
-class HexagonElement(DiagramElement):
-    """A hexagon element"""
-    def __init__(self, x, y, width=100, height=80, label="Hexagon"):
-        super().__init__(x, y, width, height, label)
-        
-    def draw(self, painter):
-        if self.selected:
-            painter.setPen(QPen(DARK_SELECTION, 2, Qt.SolidLine))
-        else:
-            painter.setPen(QPen(self.border_color, 1, Qt.SolidLine))
+            // Zoom out
+            zoomOutBtn.addEventListener('click', function() {{
+                if (scale > 0.2) {{
+                    scale -= 0.1;
+                    applyTransform();
+                }}
+            }});
             
-        painter.setBrush(QBrush(self.color))
-        
-        # Create a hexagon shape using a polygon
-        # Calculate points for a regular hexagon
-        w, h = self.width, self.height
-        points = [
-            QPoint(self.x + w // 4, self.y),  # Top left
-            QPoint(self.x + w * 3 // 4, self.y),  # Top right
-            QPoint(self.x + w, self.y + h // 2),  # Right
-            QPoint(self.x + w * 3 // 4, self.y + h),  # Bottom right
-            QPoint(self.x + w // 4, self.y + h),  # Bottom left
-            QPoint(self.x, self.y + h // 2)  # Left
-        ]
-        painter.drawPolygon(QPolygon(points))
-        
-        # Draw label with black text color
-        painter.setPen(QPen(ELEMENT_TEXT_COLOR))
-        
-        # Save the current font
-        original_font = painter.font()
-        
-        # Create a larger font for the text
-        font = QFont(original_font)
-        font.setPointSize(10)  # Larger font size
-        painter.setFont(font)
-        
-        # Draw the text centered in the element
-        painter.drawText(QRect(self.x, self.y, self.width, self.height), 
-                         Qt.AlignCenter, self.label)
-        
-        # Restore the original font
-        painter.setFont(original_font)
-    
-    def to_d2(self):
-        # Directly formatted D2 code for hexagon elements
-        d2_code = f"{self.label}: {{\n  shape: hexagon\n  style.fill: \"#{self.color.red():02x}{self.color.green():02x}{self.color.blue():02x}\"\n  style.stroke: \"#000000\"\n"
-        
-        # Add position and size information as comments
-        d2_code += f"  # position: {self.x},{self.y},{self.width},{self.height}\n"
-        
-        # Add container information if this element has children
-        if self.children:
-            # Add container title if available
-            container_title = self.container_title if self.container_title else f"{self.label}"
-            d2_code += f"  # Container: {container_title}\n"
+            // Zoom to fit
+            zoomFitBtn.addEventListener('click', zoomToFit);
             
-            # Add child elements with unique IDs to avoid conflicts
-            for i, child in enumerate(self.children):
-                child_id = f"{self.label}_{child.label}_{i}"
-                d2_code += f"  {child_id}: {{\n"
-                d2_code += f"    label: {child.label}\n"
-                if isinstance(child, CircleElement):
-                    d2_code += f"    shape: circle\n"
-                elif isinstance(child, DiamondElement):
-                    d2_code += f"    shape: diamond\n"
-                elif isinstance(child, HexagonElement):
-                    d2_code += f"    shape: hexagon\n"
-                else:  # Default to box/rectangle
-                    d2_code += f"    shape: rectangle\n"
-                d2_code += f"    style.fill: \"#{child.color.red():02x}{child.color.green():02x}{child.color.blue():02x}\"\n"
-                # Add position and size information for child elements
-                d2_code += f"    # position: {child.x},{child.y},{child.width},{child.height}\n"
-                d2_code += f"  }}\n"
-        
-        d2_code += "}"
-        return d2_code
-
-
-class ArrowConnection:
-    """A connection between two elements"""
-    def __init__(self, source, target, label=""):
-        # Store references to the source and target elements
-        if source is None or target is None:
-            print("ERROR: Attempted to create connection with None element")
-        
-        self.source = source
-        self.target = target
-        self.label = label
-        self.id = id(self)
-        self.selected = False
-        
-        # Debug print
-        print(f"Created connection from {self.source.label} to {self.target.label}")
-        
-    def draw(self, painter):
-        # Calculate connection points
-        source_center = QPoint(self.source.x + self.source.width//2, 
-                              self.source.y + self.source.height//2)
-        target_center = QPoint(self.target.x + self.target.width//2, 
-                              self.target.y + self.target.height//2)
-        
-        # Calculate intersection points with shape boundaries
-        source_edge = self._find_intersection_point(self.source, source_center, target_center)
-        target_edge = self._find_intersection_point(self.target, target_center, source_center)
-        
-        # Draw line between edge points instead of centers
-        if source_edge and target_edge:
-            if self.selected:
-                # Draw a thicker, brighter line for selected connections
-                # First draw a wider, semi-transparent glow effect (70% opacity)
-                glow_pen = QPen(QColor(0, 160, 255, 56), 5, Qt.SolidLine)  # 80 * 0.7 = 56
-                painter.setPen(glow_pen)
-                painter.drawLine(source_edge, target_edge)
-                
-                # Then draw the main line on top (70% opacity)
-                highlight_pen = QPen(QColor(0, 160, 255, 178), 2, Qt.SolidLine)  # 255 * 0.7 = 178
-                painter.setPen(highlight_pen)
-                painter.drawLine(source_edge, target_edge)
+            // Fullscreen
+            fullscreenBtn.addEventListener('click', toggleFullscreen);
+            
+            // Keyboard shortcuts
+            document.addEventListener('keydown', function(e) {{
+                if (e.key === 'f' || e.key === 'F') {{
+                    toggleFullscreen();
+                }} else if (e.key === '0') {{
+                    zoomToFit();
+                }} else if (e.key === 'Escape' && isFullscreen) {{
+                    toggleFullscreen();
+                }}
+            }});
+            
+            // Mouse wheel zoom
+            diagramContainer.addEventListener('wheel', function(e) {{
+                e.preventDefault();
                 
-                # Draw arrowhead with highlight color
-                self._draw_arrow_head(painter, target_edge, self._calculate_angle(source_edge, target_edge))
-            else:
-                # Draw normal connection
-                painter.setPen(QPen(ARROW_COLOR, 1, Qt.SolidLine))
-                painter.drawLine(source_edge, target_edge)
+                // Get mouse position relative to diagram
+                const rect = diagramWrapper.getBoundingClientRect();
+                const mouseX = e.clientX - rect.left;
+                const mouseY = e.clientY - rect.top;
                 
-                # Draw arrowhead
-                angle = self._calculate_angle(source_edge, target_edge)
-                self._draw_arrow_head(painter, target_edge, angle)
-        
-        # Draw label with black text color
-        if self.label:
-            # Make sure the label doesn't contain any ID information
-            display_label = self.label
-            if '#' in display_label:
-                display_label = display_label.split('#')[0].strip()
+                // Calculate zoom
+                const delta = e.deltaY > 0 ? -0.1 : 0.1;
+                const newScale = Math.max(0.2, scale + delta);
+                
+                // Calculate new translate to zoom at mouse position
+                const scaleRatio = newScale / scale;
+                const newTranslateX = mouseX - (mouseX - translateX) * scaleRatio;
+                const newTranslateY = mouseY - (mouseY - translateY) * scaleRatio;
                 
-            mid_point = QPoint((source_center.x() + target_center.x()) // 2,
-                               (source_center.y() + target_center.y()) // 2)
+                // Apply new values
+                scale = newScale;
+                translateX = newTranslateX;
+                translateY = newTranslateY;
+                
+                applyTransform();
+            }});
             
-            # Set text color
-            painter.setPen(QPen(ELEMENT_TEXT_COLOR))
+            // Mouse drag
+            diagramContainer.addEventListener('mousedown', function(e) {{
+                if (e.button === 0) {{ // Left mouse button
+                    isDragging = true;
+                    startX = e.clientX;
+                    startY = e.clientY;
+                    lastTranslateX = translateX;
+                    lastTranslateY = translateY;
+                    diagramContainer.style.cursor = 'grabbing';
+                }}
+            }});
             
-            # Calculate text rectangle for positioning
-            text_rect = painter.fontMetrics().boundingRect(display_label)
-            text_rect.moveCenter(mid_point)
+            document.addEventListener('mousemove', function(e) {{
+                if (isDragging) {{
+                    translateX = lastTranslateX + (e.clientX - startX);
+                    translateY = lastTranslateY + (e.clientY - startY);
+                    applyTransform();
+                }}
+            }});
             
-            # Draw text directly without background
-            painter.drawText(text_rect, Qt.AlignCenter, display_label)
-    
-    def _find_intersection_point(self, element, from_point, to_point):
-        """Find the point where the line from from_point to to_point intersects the element's boundary"""
-        # Calculate direction vector
-        dx = to_point.x() - from_point.x()
-        dy = to_point.y() - from_point.y()
-        
-        # Normalize the direction vector
-        length = (dx**2 + dy**2)**0.5
-        if length < 0.001:  # Avoid division by zero
-            return from_point
+            document.addEventListener('mouseup', function() {{
+                isDragging = false;
+                diagramContainer.style.cursor = 'default';
+            }});
             
-        dx /= length
-        dy /= length
+            // Touch support for mobile devices
+            diagramContainer.addEventListener('touchstart', function(e) {{
+                if (e.touches.length === 1) {{
+                    isDragging = true;
+                    startX = e.touches[0].clientX;
+                    startY = e.touches[0].clientY;
+                    lastTranslateX = translateX;
+                    lastTranslateY = translateY;
+                    e.preventDefault();
+                }}
+            }});
+            
+            diagramContainer.addEventListener('touchmove', function(e) {{
+                if (isDragging && e.touches.length === 1) {{
+                    translateX = lastTranslateX + (e.touches[0].clientX - startX);
+                    translateY = lastTranslateY + (e.touches[0].clientY - startY);
+                    applyTransform();
+                    e.preventDefault();
+                }}
+            }});
+            
+            diagramContainer.addEventListener('touchend', function() {{
+                isDragging = false;
+            }});
+            
+            // Initialize with a slight delay to ensure SVG is loaded
+            setTimeout(zoomToFit, 100);
+        }})();
         
-        # For different shape types, calculate intersection differently
-        if isinstance(element, CircleElement):
-            # For circles, use parametric equation
-            cx = element.x + element.width / 2
-            cy = element.y + element.height / 2
-            radius = min(element.width, element.height) / 2
+        // Copy to clipboard functionality
+        (function() {{
+            const copyButton = document.getElementById('copy-button');
+            const codeElement = document.getElementById('d2-code');
+            const tooltip = document.getElementById('copy-tooltip');
             
-            # Calculate intersection with circle
-            t = self._ray_circle_intersection(from_point.x(), from_point.y(), dx, dy, cx, cy, radius)
-            if t > 0:
-                return QPoint(int(from_point.x() + dx * t), int(from_point.y() + dy * t))
+            copyButton.addEventListener('click', function() {{
+                // Create a temporary textarea element to copy the text
+                const textarea = document.createElement('textarea');
+                textarea.value = codeElement.textContent;
+                document.body.appendChild(textarea);
+                textarea.select();
+                
+                try {{
+                    // Execute the copy command
+                    const successful = document.execCommand('copy');
+                    
+                    // Show the tooltip
+                    if (successful) {{
+                        tooltip.style.display = 'block';
+                        
+                        // Hide the tooltip after 2 seconds
+                        setTimeout(function() {{
+                            tooltip.style.display = 'none';
+                        }}, 2000);
+                    }}
+                }} catch (err) {{
+                    console.error('Unable to copy', err);
+                }}
+                
+                // Remove the temporary textarea
+                document.body.removeChild(textarea);
+            }});
+        }})();
+    </script>
+</body>
+</html>"""
+
+# Windows-specific dark mode constants
+DWMWA_USE_IMMERSIVE_DARK_MODE = 20
+
+def set_window_dark_mode(hwnd):
+    """Enable dark mode for a window (Windows 10/11 only)"""
+    try:
+        # Check if running on Windows
+        if sys.platform == "win32":
+            # Try to set dark mode for the window
+            dwmapi = ctypes.WinDLL("dwmapi")
+            value = ctypes.c_int(1)  # 1 = dark mode
+            dwmapi.DwmSetWindowAttribute(
+                hwnd,
+                DWMWA_USE_IMMERSIVE_DARK_MODE,
+                ctypes.byref(value),
+                ctypes.sizeof(value)
+            )
+            return True
+    except Exception as e:
+        logger.warning("Failed to set dark mode for window: %s", e)
+        return False
+
+# Font metrics for sizing elements around their labels. Created lazily on first use,
+# since QFont needs a QApplication, and then shared by every element.
+_label_font_metrics = None
+
+def get_label_font_metrics():
+    """Return the shared QFontMetrics for element labels, creating it on first use"""
+    global _label_font_metrics
+    if _label_font_metrics is None:
+        font = QFont()
+        # Make the font slightly larger to ensure text fits
+        font.setPointSize(10)  # Default size is usually 8 or 9
+        _label_font_metrics = QFontMetrics(font)
+    return _label_font_metrics
+
+@contextmanager
+def signals_blocked(*objects):
+    """Block the signals of the given QObjects for the duration of a with-block"""
+    # Restore each object's previous state, even if the block raises
+    previous = [obj.blockSignals(True) for obj in objects]
+    try:
+        yield
+    finally:
+        for obj, was_blocked in zip(objects, previous):
+            obj.blockSignals(was_blocked)
+
+@contextmanager
+def updates_suspended(widget):
+    """Hold back repaints of a widget and its children for the duration of a with-block"""
+    # setUpdatesEnabled(True) repaints the whole widget once, so a bulk change
+    # shows up in a single paint instead of one per intermediate step
+    was_enabled = widget.updatesEnabled()
+    widget.setUpdatesEnabled(False)
+    try:
+        yield
+    finally:
+        widget.setUpdatesEnabled(was_enabled)
+
+@lru_cache(maxsize=1024)
+def label_min_size(text):
+    """Return the minimum (width, height) an element needs to display text comfortably"""
+    if not text:
+        return 100, 60  # Default minimum size
+    
+    # Reuse the shared label font metrics instead of building a QFont per call
+    font_metrics = get_label_font_metrics()
+    
+    # Get text dimensions - use horizontalAdvance if available (newer PyQt5), fall back to width
+    try:
+        text_width = font_metrics.horizontalAdvance(text)
+    except AttributeError:
+        # Fall back to width for older PyQt5 versions
+        text_width = font_metrics.width(text)
         
-        elif isinstance(element, DiamondElement):
-            # For diamonds, check intersection with each edge
-            points = [
-                QPoint(int(element.x + element.width / 2), int(element.y)),  # Top
-                QPoint(int(element.x + element.width), int(element.y + element.height / 2)),  # Right
-                QPoint(int(element.x + element.width / 2), int(element.y + element.height)),  # Bottom
-                QPoint(int(element.x), int(element.y + element.height / 2))  # Left
-            ]
-            
-            # Check intersection with each edge
-            for i in range(4):
-                p1 = points[i]
-                p2 = points[(i + 1) % 4]
-                intersection = self._line_intersection(from_point, to_point, p1, p2)
-                if intersection:
-                    return intersection
+    text_height = font_metrics.height()
+    
+    # Add generous padding around the text (40px on each side horizontally, 30px vertically)
+    min_width = text_width + 80
+    min_height = text_height + 60
+    
+    # Ensure minimum dimensions
+    min_width = max(min_width, 100)
+    min_height = max(min_height, 60)
+    
+    logger.debug("Text: %r, calculated min size: %dx%d", text, min_width, min_height)
+    
+    return min_width, min_height
+
+
+def make_static_text(text, font):
+    """Lay out plain text once for repeated drawing with QPainter.drawStaticText"""
+    static_text = QStaticText(text)
+    static_text.setTextFormat(Qt.PlainText)
+    static_text.prepare(QTransform(), font)
+    return static_text
+
+
+@lru_cache(maxsize=128)
+def _parsed_rgba(name):
+    """Parse a color name once into an RGBA int (None if the name is not a valid color);
+    diagrams reuse a small palette across many elements"""
+    color = QColor(name)
+    return color.rgba() if color.isValid() else None
+
+
+def color_from_name(name):
+    """Return a new QColor for a color name, parsing each distinct name only once"""
+    # Building a QColor from the cached int is much cheaper than parsing the name, and
+    # every caller gets its own color to modify
+    rgba = _parsed_rgba(name)
+    return QColor() if rgba is None else QColor.fromRgba(rgba)
+
+
+class DiagramElement:
+    """Base class for all diagram elements"""
+    # D2 shape name used when generating code; set per subclass so no isinstance ladder is needed
+    d2_shape = "rectangle"
+    
+    def __init__(self, x, y, width, height, label=""):
+        self.x = x
+        self.y = y
+        self.label = label
         
-        elif isinstance(element, HexagonElement):
-            # For hexagons, check intersection with each edge
-            w = element.width
-            h = element.height
-            x = element.x
-            y = element.y
-            
-            points = [
-                QPoint(int(x + w * 0.25), int(y)),  # Top left
-                QPoint(int(x + w * 0.75), int(y)),  # Top right
-                QPoint(int(x + w), int(y + h * 0.5)),  # Middle right
-                QPoint(int(x + w * 0.75), int(y + h)),  # Bottom right
-                QPoint(int(x + w * 0.25), int(y + h)),  # Bottom left
-                QPoint(int(x), int(y + h * 0.5))  # Middle left
-            ]
-            
-            # Check intersection with each edge
-            for i in range(6):
-                p1 = points[i]
-                p2 = points[(i + 1) % 6]
-                intersection = self._line_intersection(from_point, to_point, p1, p2)
-                if intersection:
-                    return intersection
+        # Calculate minimum size based on text content
+        min_width, min_height = self._calculate_min_size_for_text(label)
         
-        else:  # Default for BoxElement and other rectangular shapes
-            # Check intersection with each edge of the rectangle
-            rect_points = [
-                QPoint(int(element.x), int(element.y)),  # Top-left
-                QPoint(int(element.x + element.width), int(element.y)),  # Top-right
-                QPoint(int(element.x + element.width), int(element.y + element.height)),  # Bottom-right
-                QPoint(int(element.x), int(element.y + element.height))  # Bottom-left
-            ]
-            
-            # Check intersection with each edge
-            for i in range(4):
-                p1 = rect_points[i]
-                p2 = rect_points[(i + 1) % 4]
-                intersection = self._line_intersection(from_point, to_point, p1, p2)
-                if intersection:
-                    return intersection
+        # Use the larger of the provided size or the minimum required size
+        self.width = max(width, min_width)
+        self.height = max(height, min_height)
         
-        # If no intersection found, return the center point
-        return QPoint(int(element.x + element.width / 2), int(element.y + element.height / 2))
+        # Stable identifier, written to the "# connection:" comments and kept across
+        # undo/redo, shape changes and save/load (unlike id(), which is per process)
+        self.id = uuid.uuid4().hex
+        self.color = QColor(180, 180, 180)  # Lighter default color for elements
+        self.border_color = QColor(120, 120, 120)  # Darker border for contrast
+        self.connections = []  # List of connected elements
+        self.parent = None  # Parent element for nesting
+        self.children = []  # Child elements nested inside this element
+        self.container_title = ""  # Initialize with empty string for custom container title
+        self._last_render = None  # (look key, device scale, cache key) of the most recent cached render
+        self._title_text = None  # ((title, font), QStaticText) for the container header
     
-    def _ray_circle_intersection(self, x, y, dx, dy, cx, cy, r):
-        """Calculate intersection of ray with circle"""
-        # Vector from ray origin to circle center
-        ocx = cx - x
-        ocy = cy - y
+    def _calculate_min_size_for_text(self, text):
+        """Calculate the minimum size needed to display the text comfortably"""
+        # Measuring text goes through QFontMetrics; the result only depends on the text,
+        # so it is memoized and resize()/+/- clicks reuse it until the label changes
+        return label_min_size(text)
+    
+    def contains(self, point):
+        return (self.x <= point.x() <= self.x + self.width and 
+                self.y <= point.y() <= self.y + self.height)
+    
+    def overlaps_with(self, other, padding=10):
+        """Check if this element overlaps with another element, considering padding"""
+        # Add padding to both elements
+        this_rect = QRectF(self.x - padding, self.y - padding, 
+                          self.width + 2 * padding, self.height + 2 * padding)
+        other_rect = QRectF(other.x, other.y, other.width, other.height)
         
-        # Quadratic equation coefficients
-        a = dx * dx + dy * dy
-        b = 2 * (dx * ocx + dy * ocy)
-        c = ocx * ocx + ocy * ocy - r * r
+        # Check if the rectangles intersect
+        return this_rect.intersects(other_rect)
+    
+    def container_bounds(self, padding=20):
+        """Return (min_x, min_y, max_x, max_y) of this element and its children, grown by padding"""
+        min_x = self.x
+        min_y = self.y
+        max_x = self.x + self.width
+        max_y = self.y + self.height
+        
+        # Single pass over the children with plain comparisons
+        for child in self.children:
+            if child.x < min_x:
+                min_x = child.x
+            if child.y < min_y:
+                min_y = child.y
+            right = child.x + child.width
+            if right > max_x:
+                max_x = right
+            bottom = child.y + child.height
+            if bottom > max_y:
+                max_y = bottom
+        
+        return min_x - padding, min_y - padding, max_x + padding, max_y + padding
+    
+    # Round shapes are hit by connection lines on an ellipse rather than on outline_points()
+    round_outline = False
+    
+    def outline_points(self):
+        """Return the corners of the element's outline, used to end connection lines on its edge"""
+        return [
+            QPoint(int(self.x), int(self.y)),  # Top-left
+            QPoint(int(self.x + self.width), int(self.y)),  # Top-right
+            QPoint(int(self.x + self.width), int(self.y + self.height)),  # Bottom-right
+            QPoint(int(self.x), int(self.y + self.height))  # Bottom-left
+        ]
+    
+    def draw(self, painter):
+        # To be implemented by subclasses
+        pass
+    
+    def _apply_shape_style(self, painter):
+        """Set the outline pen and fill used by every shape"""
+        # Selection is drawn by the canvas as a glow on top, not by the shape itself
+        painter.setPen(QPen(self.border_color, 1, Qt.SolidLine))
+        painter.setBrush(self.color)
+    
+    def _draw_label(self, painter):
+        """Draw the label centered in the element"""
+        # Draw label with black text color
+        painter.setPen(ELEMENT_TEXT_PEN)
         
-        # Discriminant
-        discriminant = b * b - 4 * a * c
+        # Save the current font
+        original_font = painter.font()
         
-        if discriminant < 0:
-            return -1  # No intersection
+        # Create a larger font for the text
+        font = QFont(original_font)
+        font.setPointSize(10)  # Larger font size
+        painter.setFont(font)
         
-        # Calculate the two solutions
+        # Draw the text centered in the element
+        painter.drawText(QRect(self.x, self.y, self.width, self.height), 
+                         Qt.AlignCenter, self.label)
+        
+        # Restore the original font
+        painter.setFont(original_font)
+    
+    # Extra space around cached pixmaps so the border pen is not clipped
+    CACHE_MARGIN = 2
+    
+    def paint_cached(self, painter, scale, resample=False):
+        """Draw the element from a pixmap rendered once per look and zoom level
+        
+        With resample=True (during a wheel-zoom gesture) the last rendered pixmap is
+        stretched instead of re-rendering shape and text at every intermediate zoom.
+        """
+        # Render at device resolution so the cached pixmap stays sharp when zoomed
+        device_scale = scale * painter.device().devicePixelRatioF()
+        
+        # The look key only holds what changes the look, so dragging keeps hitting the cache
+        look = "%s:%d:%d:%s:%s:%s" % (
+            self.__class__.__name__, self.width, self.height,
+            self.color.rgba(), self.border_color.rgba(), self.label)
+        
+        margin = self.CACHE_MARGIN
+        pixmap = None
+        if self._last_render is not None and self._last_render[0] == look and (
+                resample or self._last_render[1] == device_scale):
+            # Same look (and, unless resampling, same zoom) as the last paint: reuse that
+            # cache key instead of building it again. Only the key is kept here, so the
+            # pixmap itself stays under QPixmapCache's limit and can be evicted
+            _, render_scale, key = self._last_render
+            pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            key = "element:%s:%.3f" % (look, device_scale)
+            pixmap = QPixmapCache.find(key)
+            if pixmap is None:
+                pixmap = QPixmap(math.ceil((self.width + 2 * margin) * device_scale),
+                                 math.ceil((self.height + 2 * margin) * device_scale))
+                pixmap.fill(Qt.transparent)
+                
+                pixmap_painter = QPainter(pixmap)
+                pixmap_painter.setRenderHint(QPainter.Antialiasing)
+                pixmap_painter.setFont(painter.font())
+                pixmap_painter.scale(device_scale, device_scale)
+                pixmap_painter.translate(margin - self.x, margin - self.y)
+                self.draw(pixmap_painter)
+                pixmap_painter.end()
+                
+                QPixmapCache.insert(key, pixmap)
+            
+            render_scale = device_scale
+            self._last_render = (look, device_scale, key)
+        
+        # Map the pixmap back onto scene coordinates at the scale it was rendered for
+        painter.drawPixmap(QRectF(self.x - margin, self.y - margin,
+                                  pixmap.width() / render_scale, pixmap.height() / render_scale),
+                           pixmap, QRectF(pixmap.rect()))
+    
+    def to_d2(self):
+        # Shared D2 code generation; subclasses only differ in their d2_shape.
+        # Lines are collected and joined once rather than grown by repeated +=, and
+        # QColor.name() gives the same lowercase "#rrggbb" as formatting each channel
+        lines = [
+            f"{self.label}: {{",
+            f"  shape: {self.d2_shape}",
+            f"  style.fill: \"{self.color.name()}\"",
+            "  style.stroke: \"#000000\"",
+            # Add position and size information as comments
+            f"  # position: {self.x},{self.y},{self.width},{self.height}",
+            # Stable id, so the element keeps its identity across save/load
+            f"  # id: {self.id}",
+        ]
+        
+        # Add container information if this element has children
+        if self.children:
+            # Add container title if available
+            container_title = self.container_title if self.container_title else f"{self.label}"
+            lines.append(f"  # Container: {container_title}")
+            
+            # Add child elements with unique IDs to avoid conflicts
+            for i, child in enumerate(self.children):
+                lines += (
+                    f"  {self.label}_{child.label}_{i}: {{",
+                    f"    label: {child.label}",
+                    f"    shape: {child.d2_shape}",
+                    f"    style.fill: \"{child.color.name()}\"",
+                    # Add position and size information for child elements
+                    f"    # position: {child.x},{child.y},{child.width},{child.height}",
+                    f"    # id: {child.id}",
+                    "  }",
+                )
+        
+        lines.append("}")
+        return "\n".join(lines)
+    
+    def move(self, dx, dy):
+        self.x += dx
+        self.y += dy
+        
+        # Move all children with the parent
+        for child in self.children:
+            child.move(dx, dy)
+        
+    def resize(self, width, height):
+        # Calculate minimum size based on text content
+        min_width, min_height = self._calculate_min_size_for_text(self.label)
+        
+        # Use the larger of the provided size or the minimum required size
+        self.width = max(width, min_width)
+        self.height = max(height, min_height)
+
+
+class BoxElement(DiagramElement):
+    """A rectangular box element"""
+    d2_shape = "rectangle"
+    
+    def __init__(self, x, y, width=100, height=60, label="Box"):
+        super().__init__(x, y, width, height, label)
+        
+    def draw(self, painter):
+        self._apply_shape_style(painter)
+        painter.drawRect(self.x, self.y, self.width, self.height)
+        
+        self._draw_label(painter)
+
+
+class CircleElement(DiagramElement):
+    """A circular element"""
+    d2_shape = "circle"
+    round_outline = True
+    
+    def __init__(self, x, y, width=80, height=80, label="Circle"):
+        super().__init__(x, y, width, height, label)
+        
+    def draw(self, painter):
+        self._apply_shape_style(painter)
+        painter.drawEllipse(self.x, self.y, self.width, self.height)
+        
+        self._draw_label(painter)
+
+
+class DiamondElement(DiagramElement):
+    """A diamond element"""
+    d2_shape = "diamond"
+    
+    def __init__(self, x, y, width=100, height=80, label="Diamond"):
+        super().__init__(x, y, width, height, label)
+        
+    def outline_points(self):
+        return [
+            QPoint(int(self.x + self.width / 2), int(self.y)),  # Top
+            QPoint(int(self.x + self.width), int(self.y + self.height / 2)),  # Right
+            QPoint(int(self.x + self.width / 2), int(self.y + self.height)),  # Bottom
+            QPoint(int(self.x), int(self.y + self.height / 2))  # Left
+        ]
+        
+    def draw(self, painter):
+        self._apply_shape_style(painter)
+        
+        # Create a diamond shape using a polygon
+        points = [
+            QPoint(self.x + self.width // 2, self.y),  # Top
+            QPoint(self.x + self.width, self.y + self.height // 2),  # Right
+            QPoint(self.x + self.width // 2, self.y + self.height),  # Bottom
+            QPoint(self.x, self.y + self.height // 2)  # Left
+        ]
+        painter.drawPolygon(QPolygon(points))
+        
+        self._draw_label(painter)
+
+
+class HexagonElement(DiagramElement):
+    """A hexagon element"""
+    d2_shape = "hexagon"
+    
+    def __init__(self, x, y, width=100, height=80, label="Hexagon"):
+        super().__init__(x, y, width, height, label)
+        
+    def outline_points(self):
+        x, y, w, h = self.x, self.y, self.width, self.height
+        return [
+            QPoint(int(x + w * 0.25), int(y)),  # Top left
+            QPoint(int(x + w * 0.75), int(y)),  # Top right
+            QPoint(int(x + w), int(y + h * 0.5)),  # Middle right
+            QPoint(int(x + w * 0.75), int(y + h)),  # Bottom right
+            QPoint(int(x + w * 0.25), int(y + h)),  # Bottom left
+            QPoint(int(x), int(y + h * 0.5))  # Middle left
+        ]
+        
+    def draw(self, painter):
+        self._apply_shape_style(painter)
+        
+        # Create a hexagon shape using a polygon
+        # Calculate points for a regular hexagon
+        w, h = self.width, self.height
+        points = [
+            QPoint(self.x + w // 4, self.y),  # Top left
+            QPoint(self.x + w * 3 // 4, self.y),  # Top right
+            QPoint(self.x + w, self.y + h // 2),  # Right
+            QPoint(self.x + w * 3 // 4, self.y + h),  # Bottom right
+            QPoint(self.x + w // 4, self.y + h),  # Bottom left
+            QPoint(self.x, self.y + h // 2)  # Left
+        ]
+        painter.drawPolygon(QPolygon(points))
+        
+        self._draw_label(painter)
+
+
+class ArrowConnection:
+    """A connection between two elements"""
+    def __init__(self, source, target, label=""):
+        # Store references to the source and target elements
+        if source is None or target is None:
+            logger.error("Attempted to create connection with None element")
+        
+        self.source = source
+        self.target = target
+        self.label = label
+        self.id = uuid.uuid4().hex
+        self._label_text = None  # ((label, font), QStaticText) laid out for the last paint
+        self._geometry = None  # (endpoint key, source edge, target edge, arrow head) from the last draw
+        
+        # Debug print
+        logger.debug("Created connection from %s to %s", self.source.label, self.target.label)
+        
+    def _edge_geometry(self):
+        """Return (source_edge, target_edge, arrow_head) for the current endpoint geometry"""
+        source, target = self.source, self.target
+        key = (source, source.x, source.y, source.width, source.height,
+               target, target.x, target.y, target.width, target.height)
+        
+        # Only recompute the shape intersections when an endpoint moved, was resized or replaced
+        if self._geometry is None or self._geometry[0] != key:
+            source_center = QPoint(source.x + source.width//2, source.y + source.height//2)
+            target_center = QPoint(target.x + target.width//2, target.y + target.height//2)
+            
+            # Calculate intersection points with shape boundaries
+            source_edge = self._find_intersection_point(source, source_center, target_center)
+            target_edge = self._find_intersection_point(target, target_center, source_center)
+            
+            arrow_head = None
+            if source_edge and target_edge:
+                arrow_head = self._arrow_head_polygon(target_edge, self._calculate_angle(source_edge, target_edge))
+            
+            self._geometry = (key, source_edge, target_edge, arrow_head)
+        
+        return self._geometry[1:]
+    
+    def draw(self, painter, selected=False):
+        # Edge points and arrow head, reused across paints while the endpoints stay put
+        source_edge, target_edge, arrow_head = self._edge_geometry()
+        
+        # Draw line between edge points instead of centers
+        if source_edge and target_edge:
+            if selected:
+                # Draw a thicker, brighter line for selected connections
+                # First draw a wider, semi-transparent glow effect (70% opacity)
+                painter.setPen(CONNECTION_GLOW_PEN)
+                painter.drawLine(source_edge, target_edge)
+                
+                # Then draw the main line on top (70% opacity)
+                painter.setPen(CONNECTION_HIGHLIGHT_PEN)
+                painter.drawLine(source_edge, target_edge)
+            else:
+                # Draw normal connection
+                painter.setPen(ARROW_PEN)
+                painter.drawLine(source_edge, target_edge)
+            
+            # Draw arrowhead
+            painter.setBrush(ARROW_COLOR)
+            painter.drawPolygon(arrow_head)
+        
+        # Draw label with black text color
+        if self.label:
+            # Make sure the label doesn't contain any ID information
+            display_label = self.label
+            if '#' in display_label:
+                display_label = display_label.split('#')[0].strip()
+                
+            source, target = self.source, self.target
+            mid_point = QPoint((source.x + source.width//2 + target.x + target.width//2) // 2,
+                               (source.y + source.height//2 + target.y + target.height//2) // 2)
+            
+            # Set text color
+            painter.setPen(ELEMENT_TEXT_PEN)
+            
+            # Lay the label out once and reuse it until the text or font changes
+            key = (display_label, painter.font())
+            if self._label_text is None or self._label_text[0] != key:
+                self._label_text = (key, make_static_text(display_label, painter.font()))
+            static_text = self._label_text[1]
+            
+            # Draw text directly without background, centered on the midpoint
+            size = static_text.size()
+            painter.drawStaticText(QPointF(mid_point.x() - size.width() / 2,
+                                           mid_point.y() - size.height() / 2), static_text)
+    
+    def _find_intersection_point(self, element, from_point, to_point):
+        """Find the point where the line from from_point to to_point intersects the element's boundary"""
+        # Calculate direction vector
+        dx = to_point.x() - from_point.x()
+        dy = to_point.y() - from_point.y()
+        
+        # Normalize the direction vector
+        length = (dx**2 + dy**2)**0.5
+        if length < 0.001:  # Avoid division by zero
+            return from_point
+            
+        dx /= length
+        dy /= length
+        
+        # Elements describe their own outline, so no isinstance ladder is needed here
+        if element.round_outline:
+            # For circles, use parametric equation
+            cx = element.x + element.width / 2
+            cy = element.y + element.height / 2
+            radius = min(element.width, element.height) / 2
+            
+            # Calculate intersection with circle
+            t = self._ray_circle_intersection(from_point.x(), from_point.y(), dx, dy, cx, cy, radius)
+            if t > 0:
+                return QPoint(int(from_point.x() + dx * t), int(from_point.y() + dy * t))
+        else:
+            # For polygonal shapes, check intersection with each edge of the outline
+            points = element.outline_points()
+            count = len(points)
+            for i in range(count):
+                p1 = points[i]
+                p2 = points[(i + 1) % count]
+                intersection = self._line_intersection(from_point, to_point, p1, p2)
+                if intersection:
+                    return intersection
+        
+        # If no intersection found, return the center point
+        return QPoint(int(element.x + element.width / 2), int(element.y + element.height / 2))
+    
+    def _ray_circle_intersection(self, x, y, dx, dy, cx, cy, r):
+        """Calculate intersection of ray with circle"""
+        # Vector from ray origin to circle center
+        ocx = cx - x
+        ocy = cy - y
+        
+        # Quadratic equation coefficients
+        a = dx * dx + dy * dy
+        b = 2 * (dx * ocx + dy * ocy)
+        c = ocx * ocx + ocy * ocy - r * r
+        
+        # Discriminant
+        discriminant = b * b - 4 * a * c
+        
+        if discriminant < 0:
+            return -1  # No intersection
+        
+        # Calculate the two solutions
         t1 = (-b + (discriminant)**0.5) / (2 * a)
         t2 = (-b - (discriminant)**0.5) / (2 * a)
         
@@ -679,11 +1128,9 @@ class ArrowConnection:
         return None
     
     def _calculate_angle(self, p1, p2):
-        import math
         return math.atan2(p2.y() - p1.y(), p2.x() - p1.x())
     
-    def _draw_arrow_head(self, painter, point, angle):
-        import math
+    def _arrow_head_polygon(self, point, angle):
         arrow_size = 10
         angle_adjustment = math.pi / 6  # 30 degrees
         
@@ -693,13 +1140,11 @@ class ArrowConnection:
         p2 = QPoint(int(point.x() - arrow_size * math.cos(angle + angle_adjustment)),
                     int(point.y() - arrow_size * math.sin(angle + angle_adjustment)))
         
-        # Draw the arrow head with faint blue color
         arrow_head = QPolygon()
         arrow_head.append(point)
         arrow_head.append(p1)
         arrow_head.append(p2)
-        painter.setBrush(QBrush(ARROW_COLOR))
-        painter.drawPolygon(arrow_head)
+        return arrow_head
     
     def to_d2(self):
         # Always use one-way arrow since we're using separate arrows for bidirectional connections
@@ -714,6 +1159,8 @@ class ArrowConnection:
 
 class ToolboxItem(QToolButton):
     """Items in the toolbox that can be dragged onto the canvas"""
+    _icon_cache = {}  # element_type -> QIcon, painted on first use
+    
     def __init__(self, element_type, tooltip=""):
         super().__init__()
         self.element_type = element_type
@@ -741,23 +1188,11 @@ class ToolboxItem(QToolButton):
         """)
         
         self._drag_start_position = None
-        self.designer = None  # Reference to the DiagramDesigner
-        
-        # Find the DiagramDesigner parent
-        self.find_designer_parent()
+        self.designer = None  # Reference to the DiagramDesigner, set by the designer when it adds the item
         
         # Connect the clicked signal
         self.clicked.connect(self.on_clicked)
     
-    def find_designer_parent(self):
-        """Find the DiagramDesigner parent to access the canvas and selected elements"""
-        parent = self.parent()
-        while parent and not isinstance(parent, DiagramDesigner):
-            parent = parent.parent()
-        
-        if parent and isinstance(parent, DiagramDesigner):
-            self.designer = parent
-    
     def on_clicked(self):
         """Handle click events - change shape if element is selected"""
         if self.element_type in ["new", "save", "export"]:
@@ -793,6 +1228,9 @@ class ToolboxItem(QToolButton):
             new_element = HexagonElement(x, y, width, height, label)
         
         if new_element:
+            # Keep the element's identity across the shape change
+            new_element.id = selected_element.id
+            
             # Copy color properties
             new_element.color = selected_element.color
             new_element.border_color = selected_element.border_color
@@ -803,10 +1241,14 @@ class ToolboxItem(QToolButton):
             new_element.container_title = selected_element.container_title
             
             # Update parent's reference to this element if it has a parent
+            # (a single index() lookup instead of an "in" scan followed by index())
             if new_element.parent:
                 parent_element = new_element.parent
-                if selected_element in parent_element.children:
+                try:
                     parent_index = parent_element.children.index(selected_element)
+                except ValueError:
+                    pass
+                else:
                     parent_element.children[parent_index] = new_element
             
             # Update children's parent reference to the new element
@@ -817,10 +1259,10 @@ class ToolboxItem(QToolButton):
             index = canvas.elements.index(selected_element)
             
             # Update connections to point to the new element
-            for conn in canvas.connections[:]:
-                if conn.source == selected_element:
+            for conn in canvas.connections:
+                if conn.source is selected_element:
                     conn.source = new_element
-                if conn.target == selected_element:
+                if conn.target is selected_element:
                     conn.target = new_element
             
             # Replace the element in the list
@@ -835,11 +1277,18 @@ class ToolboxItem(QToolButton):
             # Update the properties panel
             self.designer.show_element_properties(new_element)
             
-            # Trigger a redraw and update the D2 code
+            # Trigger a redraw; the D2 code refresh was already queued by diagram_changed
             canvas.update()
-            self.designer.update_d2_code()
     
     def createCustomIcon(self, element_type):
+        # Icons are painted once per type and shared by every button that shows them
+        icon = ToolboxItem._icon_cache.get(element_type)
+        if icon is None:
+            icon = QIcon(self._paint_icon_pixmap(element_type))
+            ToolboxItem._icon_cache[element_type] = icon
+        self.setIcon(icon)
+    
+    def _paint_icon_pixmap(self, element_type):
         pixmap = QPixmap(40, 40)  # Double size (from 20x20 to 40x40)
         pixmap.fill(Qt.transparent)
         painter = QPainter(pixmap)
@@ -887,9 +1336,16 @@ class ToolboxItem(QToolButton):
             painter.drawRect(8, 8, 24, 24)      # Double size (from 4,4,12,12 to 8,8,24,24)
             painter.drawLine(16, 16, 24, 16)    # Double position (from 8,8,12,8 to 16,16,24,16)
             painter.drawLine(20, 12, 20, 20)    # Double position (from 10,6,10,10 to 20,12,20,20)
+        elif element_type == "save":
+            # Draw a floppy disk icon
+            painter.setPen(QPen(icon_color, 3))  # Double line width (from 1.5 to 3)
+            painter.drawRect(6, 6, 28, 28)  # Double size (from 3,3,14,14 to 6,6,28,28)
+            painter.drawRect(24, 6, 10, 10)  # Double size (from 12,3,5,5 to 24,6,10,10)
+            painter.drawLine(12, 20, 28, 20)  # Double position (from 6,10,14,10 to 12,20,28,20)
+            painter.drawLine(12, 26, 28, 26)  # Double position (from 6,13,14,13 to 12,26,28,26)
         
         painter.end()
-        self.setIcon(QIcon(pixmap))
+        return pixmap
     
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton and self.element_type != "new":
@@ -927,15 +1383,15 @@ class ToolboxItem(QToolButton):
             drag.setPixmap(pixmap)
             
             # Execute the drag operation
-            print(f"Starting drag for element type: {self.element_type}")
+            logger.debug("Starting drag for element type: %s", self.element_type)
             result = drag.exec_(Qt.CopyAction)
-            print(f"Drag result: {result}")
+            logger.debug("Drag result: %s", result)
             
             # Clear the drag start position
             self._drag_start_position = None
             
         except Exception as e:
-            print(f"Error during drag: {str(e)}")
+            logger.exception("Error during drag: %s", e)
     
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and self.element_type != "new":
@@ -1141,3352 +1597,2852 @@ class ElementPropertiesDialog(QDialog):
             }
             QSlider::sub-page:horizontal {
                 background: #3a6ea5;
-                border: 1px solid #555555;
-                height: 8px;
-                border-radius: 4px;
-            }
-        """)
-        self.width_value_label = QLabel(f"{self.element.width}px")
-        self.width_value_label.setStyleSheet("color: #e0e0e0; min-width: 45px; font-weight: bold;")
-        self.width_value_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        self.width_slider.valueChanged.connect(self.update_width_label)
-        
-        width_layout.addWidget(width_label)
-        width_layout.addWidget(self.width_slider)
-        width_layout.addWidget(self.width_value_label)
-        slider_layout.addLayout(width_layout)
-        
-        # Add a small spacer between sliders
-        spacer = QFrame()
-        spacer.setFrameShape(QFrame.HLine)
-        spacer.setFrameShadow(QFrame.Sunken)
-        spacer.setStyleSheet("background-color: #333333; max-height: 1px;")
-        slider_layout.addWidget(spacer)
-        
-        # Height slider
-        height_layout = QHBoxLayout()
-        height_label = QLabel("Height:")
-        height_label.setStyleSheet("color: #e0e0e0; font-weight: bold;")
-        self.height_slider = QSlider(Qt.Horizontal)
-        self.height_slider.setMinimum(20)  # Minimum height
-        self.height_slider.setMaximum(300)  # Maximum height
-        self.height_slider.setValue(self.element.height)
-        self.height_slider.setTickInterval(15)  # 5% of range (300-20)
-        self.height_slider.setTickPosition(QSlider.TicksBelow)
-        self.height_slider.setStyleSheet("""
-            QSlider::groove:horizontal {
-                border: 1px solid #555555;
-                height: 8px;
-                background: #2a2a2a;
-                margin: 2px 0;
-                border-radius: 4px;
-            }
-            QSlider::handle:horizontal {
-                background: #00BFFF;
-                border: 1px solid #00BFFF;
-                width: 18px;
-                margin: -2px 0;
-                border-radius: 9px;
-            }
-            QSlider::handle:horizontal:hover {
-                background: #33CCFF;
-            }
-            QSlider::sub-page:horizontal {
-                background: #3a6ea5;
-                border: 1px solid #555555;
-                height: 8px;
-                border-radius: 4px;
-            }
-        """)
-        self.height_value_label = QLabel(f"{self.element.height}px")
-        self.height_value_label.setStyleSheet("color: #e0e0e0; min-width: 45px; font-weight: bold;")
-        self.height_value_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        self.height_slider.valueChanged.connect(self.update_height_label)
-        
-        height_layout.addWidget(height_label)
-        height_layout.addWidget(self.height_slider)
-        height_layout.addWidget(self.height_value_label)
-        slider_layout.addLayout(height_layout)
-        
-        # Add the slider background to the main size layout
-        size_layout.addWidget(slider_bg)
-        
-        layout.addRow("", size_group_box)
-        
-        # OK/Cancel buttons
-        buttons_layout = QHBoxLayout()
-        buttons_layout.setContentsMargins(0, 10, 0, 0)  # Add top margin
-        
-        ok_button = QPushButton("OK")
-        ok_button.setStyleSheet("""
-            QPushButton {
-                background-color: #2c5aa0;
-                color: #ffffff;
-                border: none;
-                border-radius: 4px;
-                padding: 8px 16px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #3a6ea5;
-            }
-            QPushButton:pressed {
-                background-color: #1c4a90;
-            }
-        """)
-        ok_button.clicked.connect(self.accept)
-        
-        cancel_button = QPushButton("Cancel")
-        cancel_button.setStyleSheet("""
-            QPushButton {
-                background-color: #505050;
-                color: #e0e0e0;
-                border: none;
-                border-radius: 4px;
-                padding: 8px 16px;
-            }
-            QPushButton:hover {
-                background-color: #606060;
-            }
-            QPushButton:pressed {
-                background-color: #404040;
-            }
-        """)
-        cancel_button.clicked.connect(self.reject)
-        
-        buttons_layout.addStretch()
-        buttons_layout.addWidget(cancel_button)
-        buttons_layout.addWidget(ok_button)
-        
-        layout.addRow("", buttons_layout)
-    
-    def update_width_label(self, value):
-        self.width_value_label.setText(f"{value}px")
-    
-    def update_height_label(self, value):
-        self.height_value_label.setText(f"{value}px")
-    
-    def select_color(self, color):
-        self.element.color = color
-        # Highlight the selected color button with a bright cyan border for better visibility in dark mode
-        for button in self.color_buttons:
-            button_color = button.palette().button().color()
-            if button_color == color:
-                button.setStyleSheet(f"background-color: rgb({color.red()}, {color.green()}, {color.blue()}); border: 3px solid #00FFFF; border-radius: 4px;")
-            else:
-                button.setStyleSheet(f"background-color: rgb({button_color.red()}, {button_color.green()}, {button_color.blue()}); border: 1px solid #646464; border-radius: 4px;")
-    
-    def choose_custom_color(self):
-        color = QColorDialog.getColor(self.element.color, self)
-        if color.isValid():
-            self.element.color = color
-    
-    def accept(self):
-        # Apply the changes
-        if self.element:
-            old_label = self.element.label
-            new_label = self.label_edit.text()
-            
-            # Update the element properties
-            self.element.label = new_label
-            self.element.color = self.color_button.color
-            
-            # If the label changed, recalculate the element size
-            if old_label != new_label:
-                # Calculate minimum size based on new text
-                min_width, min_height = self.element._calculate_min_size_for_text(new_label)
-                
-                # Use the larger of the current size or the minimum required size
-                self.element.width = max(self.element.width, min_width)
-                self.element.height = max(self.element.height, min_height)
-            
-            # Notify that properties have changed
-            if self.canvas:
-                self.canvas.diagram_changed.emit()
-                self.canvas.update()
-        
-        # Close the dialog
-        super().accept()
-
-
-class DiagramCanvas(QWidget):
-    """Widget for drawing and interacting with the diagram"""
-    diagram_changed = pyqtSignal()
-    element_selected = pyqtSignal(object)  # Signal to notify when an element is selected for editing
-    
-    # Constants
-    ELEMENT_PADDING = 10  # Padding around elements to prevent overlap
-    
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.elements = []  # List of diagram elements
-        self.connections = []  # List of connections between elements
-        self.selected_elements = []  # List of currently selected elements
-        self.selected_connections = []  # List of currently selected connections
-        self.setMouseTracking(True)  # Enable mouse tracking for hover effects
-        self.setFocusPolicy(Qt.StrongFocus)  # Enable keyboard focus
-        
-        # Initialize variables for dragging
-        self.dragging = False
-        self.drag_start = None
-        self.drag_element = None
-        self.last_mouse_pos = QPoint(0, 0)
-        
-        # Initialize variables for selection rectangle
-        self.selecting = False
-        self.selection_start = QPoint(0, 0)
-        self.selection_rect = None
-        self.selection_rect_active = False
-        
-        # Initialize variables for connection creation
-        self.creating_connection = False
-        self.connection_source = None
-        self.connection_just_created = False
-        self.connection_creation_time = QTime.currentTime()
-        self.connection_drag = False
-        
-        # Initialize variables for nesting
-        self.creating_nesting = False
-        self.nesting_parent = None
-        self.nesting_drag = False
-        
-        # Initialize variables for cutting
-        self.cutting = False
-        self.cut_start = None
-        self.cut_current = None
-        
-        # Initialize variables for zoom and pan
-        self.scale_factor = 1.0
-        self.min_scale = 0.2  # Minimum zoom level
-        self.max_scale = 5.0  # Maximum zoom level
-        self.pan_offset = QPoint(0, 0)
-        self.panning = False
-        self.pan_start = QPoint(0, 0)
-        
-        # Set a dark background
-        self.setAutoFillBackground(True)
-        palette = self.palette()
-        palette.setColor(QPalette.Window, QColor(40, 40, 40))
-        self.setPalette(palette)
-        
-        print("DiagramCanvas initialized")
-        
-        # Set up the widget
-        self.setMinimumSize(800, 600)
-        self.setAcceptDrops(True)  # Enable drop events
-        
-        # Create context menu - only for connections, not for creating connections
-        self.setContextMenuPolicy(Qt.DefaultContextMenu)
-        
-        # Initialize zoom and pan attributes
-        print("DiagramCanvas initialized")
-    
-    def contextMenuEvent(self, event):
-        # Check if we just created a connection (within the last 1000ms)
-        if self.connection_just_created:
-            current_time = QTime.currentTime()
-            if self.connection_creation_time.msecsTo(current_time) < 1000:  # Increased from 500ms to 1000ms
-                # Prevent context menu from appearing
-                event.accept()
-                return
-            else:
-                # Reset the flag if enough time has passed
-                self.connection_just_created = False
-        
-        # Transform mouse position to account for zoom and pan
-        scene_pos = self.transform_point_to_scene(event.pos())
-        
-        # Check if we clicked on an element
-        clicked_element = None
-        for element in reversed(self.elements):
-            if element.contains(scene_pos):
-                clicked_element = element
-                break
-                
-        if clicked_element:
-            # Create element context menu
-            menu = QMenu(self)
-            
-            # If the element is a child (has a parent), add option to disconnect
-            if clicked_element.parent:
-                disconnect_action = QAction("Disconnect from Parent", self)
-                disconnect_action.triggered.connect(lambda: self.disconnect_from_parent(clicked_element))
-                menu.addAction(disconnect_action)
-                
-                menu.exec_(event.globalPos())
-                event.accept()
-                return
-            
-            # If no special actions, start connection creation
-            self.creating_connection = True
-            self.connection_source = clicked_element
-            self.update()
-            event.accept()
-            return
-        
-        # Find if we clicked on a connection
-        clicked_connection = None
-        for connection in self.connections:
-            # Check if click is near the connection line
-            source_center = QPoint(connection.source.x + connection.source.width//2, 
-                                  connection.source.y + connection.source.height//2)
-            target_center = QPoint(connection.target.x + connection.target.width//2, 
-                                  connection.target.y + connection.target.height//2)
-            
-            # Calculate distance from click to line
-            distance = self._point_to_line_distance(scene_pos, source_center, target_center)
-            
-            if distance < 10:  # 10 pixels threshold
-                clicked_connection = connection
-                break
-        
-        if clicked_connection:
-            # Create connection context menu
-            menu = QMenu(self)
-            
-            # Add actions for connection
-            edit_label_action = QAction("Edit Label", self)
-            edit_label_action.triggered.connect(lambda: self.edit_connection_label(clicked_connection))
-            menu.addAction(edit_label_action)
-            
-            # Add option to create reverse connection
-            create_reverse_action = QAction("Create Reverse Connection", self)
-            create_reverse_action.triggered.connect(lambda: self.create_reverse_connection(clicked_connection))
-            menu.addAction(create_reverse_action)
-            
-            # Delete connection
-            delete_action = QAction("Delete Connection", self)
-            delete_action.triggered.connect(lambda: self.delete_connection(clicked_connection))
-            menu.addAction(delete_action)
-            
-            menu.exec_(event.globalPos())
-            event.accept()
-            return
-        
-        # Let the right-click event pass through for other purposes
-        event.ignore()
-    
-    def disconnect_from_parent(self, element):
-        """Disconnect an element from its parent"""
-        if element.parent:
-            parent = element.parent
-            # Remove from parent's children list
-            parent.children.remove(element)
-            # Clear the parent reference
-            element.parent = None
-            print(f"Disconnected {element.label} from parent {parent.label}")
-            self.diagram_changed.emit()
-            self.update()
-    
-    def edit_connection_label(self, connection):
-        """Edit the label of a connection"""
-        text, ok = QInputDialog.getText(self, "Connection Label", "Enter label:", 
-                                     QLineEdit.Normal, connection.label)
-        if ok:
-            connection.label = text
-            self.diagram_changed.emit()
-            self.update()
-    
-    def create_reverse_connection(self, connection):
-        """Create a reverse connection"""
-        # Check if a connection already exists in the opposite direction
-        existing_reverse_connection = None
-        for conn in self.connections:
-            if conn.source == connection.target and conn.target == connection.source:
-                existing_reverse_connection = conn
-                break
-        
-        if existing_reverse_connection:
-            # Connection already exists
-            print(f"Connection already exists between {connection.target.label} and {connection.source.label}")
-        else:
-            # Create new reverse connection
-            reverse_connection = ArrowConnection(connection.target, connection.source)
-            self.connections.append(reverse_connection)
-            print(f"Created reverse connection from {connection.target.label} to {connection.source.label}")
-        
-        # Ensure we emit the signal to update the D2 code
-        self.diagram_changed.emit()
-        self.update()
-    
-    def delete_connection(self, connection):
-        """Delete a connection"""
-        if connection in self.connections:
-            self.connections.remove(connection)
-            self.diagram_changed.emit()
-            self.update()
-    
-    def _point_to_line_distance(self, point, line_start, line_end):
-        """Calculate the distance from a point to a line segment"""
-        # Extract coordinates
-        px, py = point.x(), point.y()
-        ax, ay = line_start.x(), line_start.y()
-        bx, by = line_end.x(), line_end.y()
-        
-        # Calculate the squared length of the line segment
-        ab_squared = (bx - ax) ** 2 + (by - ay) ** 2
-        
-        if ab_squared == 0:
-            # Line segment is actually a point
-            return math.sqrt((px - ax) ** 2 + (py - ay) ** 2)
-        
-        # Calculate the projection parameter t
-        t = ((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / ab_squared
-        
-        if t < 0:
-            # Closest point is line_start
-            return math.sqrt((px - ax) ** 2 + (py - ay) ** 2)
-        elif t > 1:
-            # Closest point is line_end
-            return math.sqrt((px - bx) ** 2 + (py - by) ** 2)
-        else:
-            # Closest point is on the line segment
-            projection_x = ax + t * (bx - ax)
-            projection_y = ay + t * (by - ay)
-            return math.sqrt((px - projection_x) ** 2 + (py - projection_y) ** 2)
-    
-    def _would_create_circular_nesting(self, parent, child):
-        """Check if creating a nesting relationship would create a circular reference"""
-        # If the child is already a parent of the parent, it would create a circular reference
-        current = parent
-        while current:
-            if current == child:
-                return True
-            current = current.parent
-        return False
-    
-    def dragEnterEvent(self, event):
-        if event.mimeData().hasText():
-            event.acceptProposedAction()
-            
-    def dragMoveEvent(self, event):
-        if event.mimeData().hasText():
-            event.acceptProposedAction()
-    
-    def dropEvent(self, event):
-        if event.mimeData().hasText():
-            element_type = event.mimeData().text()
-            
-            # Transform drop position to account for zoom and pan
-            scene_pos = self.transform_point_to_scene(event.pos())
-            
-            # Save state for undo before adding the element
-            parent_window = self.window()
-            if isinstance(parent_window, DiagramDesigner):
-                parent_window.save_state()
-            
-            # Create a new element based on the type
-            new_element = None
-            if element_type == "box":
-                # Create with default size - the constructor will adjust based on text
-                new_element = BoxElement(scene_pos.x() - 50, scene_pos.y() - 30)
-            elif element_type == "circle":
-                new_element = CircleElement(scene_pos.x() - 40, scene_pos.y() - 40)
-            elif element_type == "diamond":
-                new_element = DiamondElement(scene_pos.x() - 50, scene_pos.y() - 40)
-            elif element_type == "hexagon":
-                new_element = HexagonElement(scene_pos.x() - 50, scene_pos.y() - 40)
-            
-            if new_element:
-                # Center the element at the drop position after its size has been calculated
-                new_element.x = scene_pos.x() - new_element.width // 2
-                new_element.y = scene_pos.y() - new_element.height // 2
-                
-                # Check if the new element would overlap with any existing elements
-                overlap_detected = False
-                
-                for element in self.elements:
-                    if new_element.overlaps_with(element, self.ELEMENT_PADDING):
-                        overlap_detected = True
-                        break
-                
-                if overlap_detected:
-                    # Find the nearest valid position
-                    valid_position = self.find_nearest_valid_position(new_element)
-                    
-                    if valid_position:
-                        # Update the element's position to the valid position
-                        new_element.x, new_element.y = valid_position
-                        print(f"Element repositioned to nearest valid position: ({new_element.x}, {new_element.y})")
-                    else:
-                        # No valid position found, don't add the element
-                        print("No valid position found for the element")
-                        return
-                
-                # Add the element to the canvas
-                self.elements.append(new_element)
-                
-                # Clear previous selection
-                self.selected_elements.clear()
-                self.selected_connections.clear()
-                
-                # Select the new element
-                self.selected_elements.append(new_element)
-                
-                # Show properties for the new element
-                self.element_selected.emit(new_element)
-                
-                # Emit signal to update D2 code
-                self.diagram_changed.emit()
-                
-                # Update the canvas
-                self.update()
-                
-                # Print debug info
-                print(f"Created new {element_type} element at ({new_element.x}, {new_element.y})")
-                
-                # Accept the drop event
-                event.acceptProposedAction()
-                
-                # Return success
-                return 1
-            
-            # If we get here, no element was created
-            return 0
-    
-    def find_nearest_valid_position(self, element, max_distance=300):
-        """
-        Find the nearest valid position for an element that doesn't overlap with existing elements.
-        Uses a spiral search pattern to find the closest valid position.
-        
-        Args:
-            element: The element to position
-            max_distance: Maximum search distance in pixels
-            
-        Returns:
-            (x, y) tuple of the nearest valid position, or None if no valid position found
-        """
-        # Start with the element's current position
-        original_x, original_y = element.x, element.y
-        
-        # Try the original position first
-        overlap = False
-        for existing_element in self.elements:
-            if element.overlaps_with(existing_element, self.ELEMENT_PADDING):
-                overlap = True
-                break
-                
-        if not overlap:
-            return original_x, original_y
-        
-        # Spiral search pattern
-        # Start with a small step and increase gradually
-        step_size = max(element.width, element.height) // 2
-        max_steps = max_distance // step_size
-        
-        # Search in a spiral pattern (right, down, left, up, and repeat with increasing distance)
-        directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]  # right, down, left, up
-        
-        for distance in range(1, max_steps + 1):
-            for direction in directions:
-                # Try multiple positions in each direction
-                for step in range(distance):
-                    # Calculate new position
-                    test_x = original_x + direction[0] * step_size * distance
-                    test_y = original_y + direction[1] * step_size * distance
-                    
-                    # Update element position temporarily
-                    element.x = test_x
-                    element.y = test_y
-                    
-                    # Check for overlaps
-                    overlap = False
-                    for existing_element in self.elements:
-                        if element.overlaps_with(existing_element, self.ELEMENT_PADDING):
-                            overlap = True
-                            break
-                    
-                    if not overlap:
-                        return test_x, test_y
-        
-        # If we get here, no valid position was found within the max distance
-        # Reset the element's position
-        element.x = original_x
-        element.y = original_y
-        return None
-    
-    def mousePressEvent(self, event):
-        # Handle middle mouse button for zoom-to-fit
-        if event.button() == Qt.MiddleButton:
-            # Single click to zoom to fit
-            self.zoom_to_fit()
-            return
-            
-        # Transform mouse position to account for zoom and pan
-        scene_pos = self.transform_point_to_scene(event.pos())
-            
-        if event.button() == Qt.LeftButton:
-            # Check if clicking on an element
-            clicked_element = None
-            for element in reversed(self.elements):
-                if element.contains(scene_pos):
-                    clicked_element = element
-                    break
-            
-            # Check if clicking on a connection
-            clicked_connection = None
-            if not clicked_element:
-                for connection in self.connections:
-                    source_center = QPoint(connection.source.x + connection.source.width//2, 
-                                          connection.source.y + connection.source.height//2)
-                    target_center = QPoint(connection.target.x + connection.target.width//2, 
-                                          connection.target.y + connection.target.height//2)
-                    
-                    # Calculate distance from click to line
-                    distance = self._point_to_line_distance(scene_pos, source_center, target_center)
-                    
-                    if distance < 10:  # 10 pixels threshold for selection
-                        clicked_connection = connection
-                        break
-            
-            # Handle Alt + left mouse button for cutting connections
-            if event.modifiers() & Qt.AltModifier:
-                self.cutting = True
-                self.cut_start = scene_pos
-                self.cut_current = scene_pos
-                self.setCursor(Qt.CrossCursor)  # Set cursor to cross for cutting
-                return
-            
-            if clicked_element:
-                # Start dragging the element
-                self.dragging = True
-                self.drag_element = clicked_element
-                self.drag_start = scene_pos
-                
-                # Check if we're clicking on a selected element
-                if clicked_element in self.selected_elements:
-                    # If Shift is not pressed, keep the current selection
-                    pass
-                else:
-                    # If Shift is not pressed, clear the current selection
-                    if not (event.modifiers() & Qt.ShiftModifier):
-                        self.selected_elements.clear()
-                    
-                    # Add the clicked element to the selection
-                    self.selected_elements.append(clicked_element)
-                    
-                    # Emit signal to notify that an element is selected
-                    self.element_selected.emit(clicked_element)
-                
-                # Update the canvas
-                self.update()
-            elif clicked_connection:
-                # Select the connection
-                if not (event.modifiers() & Qt.ShiftModifier):
-                    self.selected_connections.clear()
-                    self.selected_elements.clear()
-                
-                self.selected_connections.append(clicked_connection)
-                
-                # Update the canvas
-                self.update()
-            else:
-                # Clicking in empty space
-                
-                # Start panning if no element or connection was clicked
-                self.panning = True
-                self.pan_start = event.pos()
-                self.setCursor(Qt.OpenHandCursor)  # Set cursor to open hand for panning
-                
-                # If Shift is not pressed, clear the current selection
-                if not (event.modifiers() & Qt.ShiftModifier):
-                    self.selected_elements.clear()
-                    self.selected_connections.clear()
-                    
-                    # Emit signal to notify that no element is selected
-                    self.element_selected.emit(None)
-                
-                # Update the canvas
-                self.update()
-        elif event.button() == Qt.RightButton:
-            # Check if clicking on an element
-            clicked_element = None
-            for element in reversed(self.elements):
-                if element.contains(scene_pos):
-                    clicked_element = element
-                    break
-            
-            if clicked_element:
-                # Check if Alt key is pressed for nesting operation
-                if event.modifiers() & Qt.AltModifier:
-                    # Start creating a nesting relationship via dragging
-                    self.creating_nesting = True
-                    self.nesting_parent = clicked_element
-                    self.nesting_drag = True  # Flag to indicate we're creating nesting by dragging
-                    print(f"Starting nesting drag from parent: {clicked_element.label}")
-                    self.update()
-                else:
-                    # Standard connection creation
-                    self.creating_connection = True
-                    self.connection_source = clicked_element
-                    self.connection_drag = True  # Flag to indicate we're creating by dragging
-                    print(f"Starting connection drag from element: {clicked_element.label}")
-                    self.update()
-            else:
-                # Right-clicking in empty space - start selection rectangle
-                self.selecting = True
-                self.selection_start = event.pos()
-                self.selection_rect = None
-                self.selection_rect_active = False
-                
-                # If Shift is not pressed, clear the current selection
-                if not (event.modifiers() & Qt.ShiftModifier):
-                    self.selected_elements.clear()
-                    self.selected_connections.clear()
-                    
-                    # Emit signal to notify that no element is selected
-                    self.element_selected.emit(None)
-                
-                # Update the canvas
-                self.update()
-    
-    def mouseMoveEvent(self, event):
-        # Always update the last_mouse_pos for connection drawing and other interactions
-        self.last_mouse_pos = self.transform_point_to_scene(event.pos())
-        
-        # Force update for all interactions
-        need_update = False
-        need_repaint = False  # For operations that need immediate visual feedback
-        
-        # Handle cutting with Alt + left mouse button
-        if self.cutting and event.buttons() & Qt.LeftButton:
-            # Update the current position of the cutting line
-            self.cut_current = self.last_mouse_pos
-            need_update = True
-            
-        # Handle panning with left mouse button in empty space
-        elif self.panning and event.buttons() & Qt.LeftButton:
-            delta = event.pos() - self.pan_start
-            self.pan_offset += delta
-            self.pan_start = event.pos()
-            self.setCursor(Qt.ClosedHandCursor)  # Change cursor to closed hand during active panning
-            need_repaint = True  # Use repaint for immediate visual feedback
-            
-        # Handle connection creation with right mouse button
-        elif self.creating_connection and event.buttons() & Qt.RightButton:
-            # Just update to redraw the temporary connection line
-            need_repaint = True  # Use repaint for immediate visual feedback
-            
-        # Handle nesting creation with Alt + right mouse button
-        elif self.creating_nesting and event.buttons() & Qt.RightButton:
-            # Just update to redraw the temporary nesting line
-            need_repaint = True  # Use repaint for immediate visual feedback
-            
-        # Handle dragging elements
-        elif self.dragging and self.drag_element and (event.buttons() & Qt.LeftButton):
-            # Calculate the movement delta
-            delta = self.last_mouse_pos - self.drag_start
-            
-            # Determine which elements to move
-            elements_to_move = []
-            if self.drag_element in self.selected_elements and len(self.selected_elements) > 1:
-                # If dragging a selected element and multiple elements are selected,
-                # move all selected elements
-                elements_to_move = self.selected_elements
-            else:
-                # Otherwise just move the dragged element
-                elements_to_move = [self.drag_element]
-            
-            # Store original positions to revert if needed
-            original_positions = [(element, element.x, element.y) for element in elements_to_move]
-            
-            # Temporarily move all elements
-            for element in elements_to_move:
-                element.move(delta.x(), delta.y())
-            
-            # Check for overlap with other elements
-            overlap_detected = False
-            
-            for moving_element in elements_to_move:
-                for element in self.elements:
-                    # Skip elements being moved and their children
-                    if element in elements_to_move or element in moving_element.children:
-                        continue
-                    
-                    # Skip if the element is a child of the current element
-                    if element.parent == moving_element:
-                        continue
-                        
-                    # Check if the moved element overlaps with this element
-                    if moving_element.overlaps_with(element, self.ELEMENT_PADDING):
-                        overlap_detected = True
-                        break
-                
-                if overlap_detected:
-                    break
-            
-            # If overlap detected, revert to original positions
-            if overlap_detected:
-                for element, orig_x, orig_y in original_positions:
-                    element.x = orig_x
-                    element.y = orig_y
-                # Don't update drag_start here, so the elements can still be dragged
-                # from their original positions in a different direction
-            else:
-                # Update the drag start position only if the move was successful
-                self.drag_start = self.last_mouse_pos
-            
-            need_repaint = True  # Use repaint for immediate visual feedback
-            
-        # Handle selection rectangle with right mouse button
-        elif hasattr(self, 'selecting') and self.selecting and (event.buttons() & Qt.RightButton):
-            # Update selection rectangle
-            current_pos = event.pos()
-            self.selection_rect = QRect(self.selection_start, current_pos).normalized()
-            self.selection_rect_active = True
-            need_repaint = True  # Use repaint for immediate visual feedback
-        
-        # Always update the canvas if any interaction is happening
-        if need_repaint:
-            # Use repaint for immediate visual feedback
-            self.repaint()
-        elif need_update or event.buttons():
-            # Use update for less critical updates
-            self.update()
-        
-        event.accept()
-    
-    def mouseReleaseEvent(self, event):
-        # Handle left mouse button release
-        if event.button() == Qt.LeftButton:
-            # Check if we were in cutting mode
-            if self.cutting:
-                # Find connections that intersect with the cutting line
-                intersected_connections = self.find_intersected_connections(self.cut_start, self.cut_current)
-                
-                if intersected_connections:
-                    # Save the current state for undo
-                    parent_window = self.window()
-                    if isinstance(parent_window, DiagramDesigner):
-                        parent_window.save_state()
-                    
-                    # Remove the intersected connections
-                    for connection in intersected_connections:
-                        self.connections.remove(connection)
-                    
-                    # Emit signal to update D2 code
-                    self.diagram_changed.emit()
-                
-                # Reset cutting mode
-                self.cutting = False
-                self.cut_start = None
-                self.cut_current = None
-                self.setCursor(Qt.ArrowCursor)
-                self.update()
-            
-            # Check if we were panning
-            elif self.panning:
-                self.panning = False
-                self.setCursor(Qt.ArrowCursor)
-            
-            # Check if we were dragging an element
-            elif self.drag_element:
-                # Save the current state for undo
-                parent_window = self.window()
-                if isinstance(parent_window, DiagramDesigner):
-                    parent_window.save_state()
-                
-                # Reset drag element
-                self.drag_element = None
-                self.drag_start = None
-                self.setCursor(Qt.ArrowCursor)
-                
-                # Emit signal to update D2 code
-                self.diagram_changed.emit()
-
-        elif event.button() == Qt.RightButton:
-            # Handle selection rectangle with right mouse button
-            if hasattr(self, 'selecting') and self.selecting:
-                self.selecting = False
-                
-                # Transform selection rectangle to scene coordinates
-                if self.selection_rect:
-                    # Find elements within the selection rectangle
-                    for element in self.elements:
-                        element_rect = QRect(
-                            self.transform_point_from_scene(QPoint(element.x, element.y)),
-                            self.transform_point_from_scene(QPoint(element.x + element.width, element.y + element.height))
-                        ).normalized()
-                        
-                        if self.selection_rect.intersects(element_rect):
-                            if element not in self.selected_elements:
-                                self.selected_elements.append(element)
-                    
-                    # Find connections within the selection rectangle
-                    for connection in self.connections:
-                        source_center = QPoint(
-                            connection.source.x + connection.source.width//2,
-                            connection.source.y + connection.source.height//2
-                        )
-                        target_center = QPoint(
-                            connection.target.x + connection.target.width//2,
-                            connection.target.y + connection.target.height//2
-                        )
-                        
-                        source_screen = self.transform_point_from_scene(source_center)
-                        target_screen = self.transform_point_from_scene(target_center)
-                        
-                        # Check if either endpoint is within the selection rectangle
-                        if (self.selection_rect.contains(source_screen) or 
-                            self.selection_rect.contains(target_screen)):
-                            if connection not in self.selected_connections:
-                                self.selected_connections.append(connection)
-                
-                # Clear selection rectangle
-                self.selection_rect = None
-                self.selection_rect_active = False
-                
-                # Show properties for the first selected element
-                if self.selected_elements:
-                    self.element_selected.emit(self.selected_elements[0])
-                
-                # Update the canvas
-                self.update()
-                return
-                
-            # Check if we were creating a nesting relationship with Alt+Right-click
-            if self.creating_nesting and hasattr(self, 'nesting_drag') and self.nesting_drag:
-                # Transform mouse position to account for zoom and pan
-                scene_pos = self.transform_point_to_scene(event.pos())
-                
-                # Check if releasing over an element
-                child_element = None
-                for element in reversed(self.elements):
-                    if element.contains(scene_pos):
-                        child_element = element
-                        break
-                
-                if child_element and child_element != self.nesting_parent:
-                    # Check if this would create a circular nesting
-                    if self._would_create_circular_nesting(self.nesting_parent, child_element):
-                        print(f"Cannot nest {child_element.label} inside {self.nesting_parent.label} - would create circular nesting")
-                    else:
-                        # Remove from previous parent if exists
-                        if child_element.parent:
-                            child_element.parent.children.remove(child_element)
-                        
-                        # Create nesting relationship
-                        child_element.parent = self.nesting_parent
-                        self.nesting_parent.children.append(child_element)
-                        print(f"Nested {child_element.label} inside {self.nesting_parent.label}")
-                        self.diagram_changed.emit()
-                        
-                        # Set the flag to prevent context menu
-                        self.connection_just_created = True
-                        self.connection_creation_time = QTime.currentTime()
-                else:
-                    print("Nesting operation cancelled - no child element or same as parent")
-                
-                # Reset nesting creation state
-                self.creating_nesting = False
-                self.nesting_parent = None
-                self.nesting_drag = False
-                self.update()
-                
-                # Accept the event to prevent context menu
-                event.accept()
-                return
-                
-            # Check if we were creating a connection with Right-click
-            elif self.creating_connection:
-                # Transform mouse position to account for zoom and pan
-                scene_pos = self.transform_point_to_scene(event.pos())
-                
-                # Check if releasing over an element
-                target_element = None
-                for element in reversed(self.elements):
-                    if element.contains(scene_pos):
-                        target_element = element
-                        break
-                
-                if target_element and target_element != self.connection_source:
-                    # Check if a connection already exists between these elements
-                    existing_connection = None
-                    for conn in self.connections:
-                        if (conn.source == self.connection_source and conn.target == target_element):
-                            existing_connection = conn
-                            break
-                    
-                    if existing_connection:
-                        # Connection already exists
-                        print(f"Connection already exists between {self.connection_source.label} and {target_element.label}")
-                    else:
-                        # Create a new connection
-                        new_connection = ArrowConnection(self.connection_source, target_element)
-                        self.connections.append(new_connection)
-                        print(f"Created connection from {self.connection_source.label} to {target_element.label}")
-                        self.diagram_changed.emit()
-                        
-                        # Set the flag to prevent context menu
-                        self.connection_just_created = True
-                        self.connection_creation_time = QTime.currentTime()
-                else:
-                    print("Connection creation cancelled - no target element or same as source")
-                
-                # Reset connection creation state
-                self.creating_connection = False
-                self.connection_source = None
-                self.update()
-                
-                # Accept the event to prevent context menu
-                event.accept()
-    
-    def mouseDoubleClickEvent(self, event):
-        # Transform mouse position to account for zoom and pan
-        scene_pos = self.transform_point_to_scene(event.pos())
-        
-        # Check if double-clicking on a container title
-        for element in self.elements:
-            if element.children:
-                # Calculate container bounds
-                min_x = element.x
-                min_y = element.y
-                max_x = element.x + element.width
-                max_y = element.y + element.height
-                
-                # Define title padding
-                title_padding = 40  # Extra space below the header
-                
-                # Adjust the parent element's position if it's too close to the top of its own container
-                if element.y < min_y + title_padding:
-                    # Create space between the parent element and the container title
-                    element.y = min_y + title_padding
-                    max_y = element.y + element.height  # Update max_y after moving the element
-                
-                for child in element.children:
-                    # Apply extra top padding to child elements to prevent them from touching the title
-                    # Adjust child positions if they're too close to the top of the container
-                    if child.y < min_y + title_padding:
-                        # Push the child element down if it's too close to the title
-                        child.y = min_y + title_padding
-                    
-                    min_x = min(min_x, child.x)
-                    min_y = min(min_y, child.y)
-                    max_x = max(max_x, child.x + child.width)
-                    max_y = max(max_y, child.y + child.height)
-                
-                # Add padding
-                padding = 20  # Increased padding
-                min_x -= padding
-                min_y -= padding
-                max_x += padding
-                max_y += padding
-                
-                # Check if clicked in the title area (top 20 pixels of container)
-                title_rect = QRect(min_x, min_y, max_x - min_x, 20)
-                if title_rect.contains(scene_pos):
-                    # Get current container title or default
-                    current_title = element.container_title if element.container_title else f"{element.label}"
-                    # Edit container title
-                    text, ok = QInputDialog.getText(self, "Container Title", "Enter container name:", 
-                                                QLineEdit.Normal, current_title)
-                    if ok:
-                        element.container_title = text
-                        # Title changed, update the D2 code
-                        self.diagram_changed.emit()
-                        self.update()
-                    return
+                border: 1px solid #555555;
+                height: 8px;
+                border-radius: 4px;
+            }
+        """)
+        self.width_value_label = QLabel(f"{self.element.width}px")
+        self.width_value_label.setStyleSheet("color: #e0e0e0; min-width: 45px; font-weight: bold;")
+        self.width_value_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        self.width_slider.valueChanged.connect(self.update_width_label)
         
-        # Double-clicking on a connection to edit its label
-        for connection in self.connections:
-            source_center = QPoint(connection.source.x + connection.source.width//2, 
-                                  connection.source.y + connection.source.height//2)
-            target_center = QPoint(connection.target.x + connection.target.width//2, 
-                                  connection.target.y + connection.target.height//2)
-            
-            # Simple line hit test
-            line_rect = QRect(min(source_center.x(), target_center.x()) - 5,
-                             min(source_center.y(), target_center.y()) - 5,
-                             abs(source_center.x() - target_center.x()) + 10,
-                             abs(source_center.y() - target_center.y()) + 10)
-            
-            if line_rect.contains(event.pos()):
-                # Edit connection label
-                text, ok = QLineEdit.getText(self, "Connection Label", "Enter label:", 
-                                             QLineEdit.Normal, connection.label)
-                if ok:
-                    connection.label = text
-                    # Label changed, update the D2 code
-                    self.diagram_changed.emit()
-                    self.update()
-                break
-    
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
+        width_layout.addWidget(width_label)
+        width_layout.addWidget(self.width_slider)
+        width_layout.addWidget(self.width_value_label)
+        slider_layout.addLayout(width_layout)
         
-        # Fill the background with a dark color
-        painter.fillRect(self.rect(), QColor(40, 40, 40))
+        # Add a small spacer between sliders
+        spacer = QFrame()
+        spacer.setFrameShape(QFrame.HLine)
+        spacer.setFrameShadow(QFrame.Sunken)
+        spacer.setStyleSheet("background-color: #333333; max-height: 1px;")
+        slider_layout.addWidget(spacer)
         
-        # Apply zoom and pan transformations
-        painter.translate(self.pan_offset)
-        painter.scale(self.scale_factor, self.scale_factor)
+        # Height slider
+        height_layout = QHBoxLayout()
+        height_label = QLabel("Height:")
+        height_label.setStyleSheet("color: #e0e0e0; font-weight: bold;")
+        self.height_slider = QSlider(Qt.Horizontal)
+        self.height_slider.setMinimum(20)  # Minimum height
+        self.height_slider.setMaximum(300)  # Maximum height
+        self.height_slider.setValue(self.element.height)
+        self.height_slider.setTickInterval(15)  # 5% of range (300-20)
+        self.height_slider.setTickPosition(QSlider.TicksBelow)
+        self.height_slider.setStyleSheet("""
+            QSlider::groove:horizontal {
+                border: 1px solid #555555;
+                height: 8px;
+                background: #2a2a2a;
+                margin: 2px 0;
+                border-radius: 4px;
+            }
+            QSlider::handle:horizontal {
+                background: #00BFFF;
+                border: 1px solid #00BFFF;
+                width: 18px;
+                margin: -2px 0;
+                border-radius: 9px;
+            }
+            QSlider::handle:horizontal:hover {
+                background: #33CCFF;
+            }
+            QSlider::sub-page:horizontal {
+                background: #3a6ea5;
+                border: 1px solid #555555;
+                height: 8px;
+                border-radius: 4px;
+            }
+        """)
+        self.height_value_label = QLabel(f"{self.element.height}px")
+        self.height_value_label.setStyleSheet("color: #e0e0e0; min-width: 45px; font-weight: bold;")
+        self.height_value_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        self.height_slider.valueChanged.connect(self.update_height_label)
         
-        # Draw the grid
-        self.draw_grid(painter)
+        height_layout.addWidget(height_label)
+        height_layout.addWidget(self.height_slider)
+        height_layout.addWidget(self.height_value_label)
+        slider_layout.addLayout(height_layout)
         
-        # Draw containers first (so they appear behind elements)
-        for element in self.elements:
-            if element.children:
-                # Calculate container bounds
-                min_x = element.x
-                min_y = element.y
-                max_x = element.x + element.width
-                max_y = element.y + element.height
-                
-                for child in element.children:
-                    min_x = min(min_x, child.x)
-                    min_y = min(min_y, child.y)
-                    max_x = max(max_x, child.x + child.width)
-                    max_y = max(max_y, child.y + child.height)
-                
-                # Add padding
-                padding = 20
-                min_x -= padding
-                min_y -= padding
-                max_x += padding
-                max_y += padding
-                
-                # Create container rectangle
-                container_rect = QRectF(min_x, min_y, max_x - min_x, max_y - min_y)
-                
-                # Draw the container with a style similar to regular elements
-                container_pen = QPen(QColor(100, 150, 100), 1.5, Qt.SolidLine)  # Solid line instead of dashed
-                painter.setPen(container_pen)
-                
-                # Use a gradient background for a more polished look
-                gradient = QRadialGradient(
-                    (min_x + max_x) / 2, (min_y + max_y) / 2,  # Center of the container
-                    max((max_x - min_x), (max_y - min_y)) / 2   # Radius
-                )
-                gradient.setColorAt(0, QColor(60, 80, 60, 40))  # Center color (semi-transparent)
-                gradient.setColorAt(1, QColor(50, 70, 50, 60))  # Edge color (slightly more opaque)
-                
-                painter.setBrush(QBrush(gradient))
-                painter.drawRoundedRect(container_rect, 10, 10)  # More rounded corners
-                
-                # Draw a header bar at the top of the container
-                header_height = 30  # Increased height for more space
-                header_rect = QRectF(min_x, min_y, max_x - min_x, header_height)
-                header_gradient = QLinearGradient(min_x, min_y, min_x, min_y + header_height)
-                header_gradient.setColorAt(0, QColor(80, 120, 80, 180))  # Top color
-                header_gradient.setColorAt(1, QColor(60, 100, 60, 150))  # Bottom color
-                
-                painter.setBrush(QBrush(header_gradient))
-                painter.drawRoundedRect(header_rect, 10, 10)
-                
-                # Draw the container title with a better font
-                container_text = element.container_title if element.container_title else f"{element.label} Container"
-                painter.setPen(QPen(QColor(220, 240, 220)))
-                
-                # Use a slightly larger font for the title
-                font = painter.font()
-                original_font = QFont(font)
-                font.setBold(True)
-                font.setPointSize(font.pointSize() + 1)
-                painter.setFont(font)
-                
-                # Center the text in the header
-                text_rect = QRectF(min_x + 10, min_y, max_x - min_x - 20, header_height)
-                painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, container_text)
-                
-                # Restore the original font
-                painter.setFont(original_font)
+        # Add the slider background to the main size layout
+        size_layout.addWidget(slider_bg)
         
-        # Draw all connections
-        for connection in self.connections:
-            # Set the selected state based on whether the connection is in the selected_connections list
-            connection.selected = connection in self.selected_connections
-            connection.draw(painter)
+        layout.addRow("", size_group_box)
         
-        # Draw all elements (on top of connections and containers)
-        for element in self.elements:
-            element.draw(painter)
-            
-            # Draw highlight for selected elements
-            if element in self.selected_elements:
-                # Create a glowing highlight effect around selected elements
-                highlight_rect = QRectF(element.x - 5, element.y - 5, 
-                                     element.width + 10, element.height + 10)
-                
-                # Use a solid line with a bright color for the highlight (70% opacity)
-                highlight_pen = QPen(QColor(0, 160, 255, 178), 2.5)  # 255 * 0.7 = 178
-                painter.setPen(highlight_pen)
-                painter.setBrush(Qt.NoBrush)
-                
-                # Draw rounded rectangle for the highlight
-                painter.drawRoundedRect(highlight_rect, 8, 8)
-                
-                # Add a second, outer glow effect (70% opacity)
-                outer_glow_rect = QRectF(element.x - 8, element.y - 8, 
-                                     element.width + 16, element.height + 16)
-                outer_glow_pen = QPen(QColor(0, 160, 255, 56), 1.5, Qt.DashLine)  # 80 * 0.7 = 56
-                painter.setPen(outer_glow_pen)
-                painter.drawRoundedRect(outer_glow_rect, 10, 10)
-                
-                # If this is a container, draw a small indicator
-                if element.children:
-                    indicator_rect = QRectF(element.x - 5, element.y - 5, 10, 10)
-                    painter.setPen(QPen(QColor(100, 200, 100)))
-                    painter.setBrush(QBrush(QColor(100, 200, 100)))
-                    painter.drawRect(indicator_rect)
+        # OK/Cancel buttons
+        buttons_layout = QHBoxLayout()
+        buttons_layout.setContentsMargins(0, 10, 0, 0)  # Add top margin
         
-        # Draw temporary connection line if creating a connection
-        if self.creating_connection and self.connection_source:
-            # Get the start point (center of the start element)
-            start_x = self.connection_source.x + self.connection_source.width / 2
-            start_y = self.connection_source.y + self.connection_source.height / 2
-            start_point = QPoint(int(start_x), int(start_y))
-            
-            # Get the current mouse position
-            current_point = self.transform_point_to_scene(self.mapFromGlobal(self.cursor().pos()))
-            
-            # Draw a dashed line
-            painter.setPen(QPen(QColor(200, 200, 200), 2, Qt.DashLine))
-            painter.drawLine(start_point, current_point)
+        ok_button = QPushButton("OK")
+        ok_button.setStyleSheet("""
+            QPushButton {
+                background-color: #2c5aa0;
+                color: #ffffff;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 16px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #3a6ea5;
+            }
+            QPushButton:pressed {
+                background-color: #1c4a90;
+            }
+        """)
+        ok_button.clicked.connect(self.accept)
         
-        # Draw temporary nesting line if creating a nesting relationship
-        if self.creating_nesting and self.nesting_parent:
-            # Get the start point (center of the parent element)
-            start_x = self.nesting_parent.x + self.nesting_parent.width / 2
-            start_y = self.nesting_parent.y + self.nesting_parent.height / 2
-            start_point = QPoint(int(start_x), int(start_y))
+        cancel_button = QPushButton("Cancel")
+        cancel_button.setStyleSheet("""
+            QPushButton {
+                background-color: #505050;
+                color: #e0e0e0;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 16px;
+            }
+            QPushButton:hover {
+                background-color: #606060;
+            }
+            QPushButton:pressed {
+                background-color: #404040;
+            }
+        """)
+        cancel_button.clicked.connect(self.reject)
+        
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(cancel_button)
+        buttons_layout.addWidget(ok_button)
+        
+        layout.addRow("", buttons_layout)
+    
+    def update_width_label(self, value):
+        self.width_value_label.setText(f"{value}px")
+    
+    def update_height_label(self, value):
+        self.height_value_label.setText(f"{value}px")
+    
+    def select_color(self, color):
+        self.element.color = color
+        # Highlight the selected color button with a bright cyan border for better visibility in dark mode
+        for button in self.color_buttons:
+            button_color = button.palette().button().color()
+            if button_color == color:
+                button.setStyleSheet(f"background-color: rgb({color.red()}, {color.green()}, {color.blue()}); border: 3px solid #00FFFF; border-radius: 4px;")
+            else:
+                button.setStyleSheet(f"background-color: rgb({button_color.red()}, {button_color.green()}, {button_color.blue()}); border: 1px solid #646464; border-radius: 4px;")
+    
+    def choose_custom_color(self):
+        color = QColorDialog.getColor(self.element.color, self)
+        if color.isValid():
+            self.element.color = color
+    
+    def accept(self):
+        # Apply the changes
+        if self.element:
+            old_label = self.element.label
+            new_label = self.label_edit.text()
             
-            # Get the current mouse position
-            current_point = self.transform_point_to_scene(self.mapFromGlobal(self.cursor().pos()))
+            # Update the element properties
+            self.element.label = new_label
+            self.element.color = self.color_button.color
             
-            # Draw a dashed line with a different color
-            painter.setPen(QPen(QColor(100, 200, 100), 2, Qt.DashLine))
-            painter.drawLine(start_point, current_point)
-        
-        # Draw cutting line if in cutting mode
-        if self.cutting and self.cut_start and self.cut_current:
-            painter.setPen(QPen(QColor(255, 100, 100), 2, Qt.DashLine))
-            painter.drawLine(self.cut_start, self.cut_current)
-        
-        # Draw selection rectangle if selecting
-        if hasattr(self, 'selecting') and self.selecting and hasattr(self, 'selection_rect') and self.selection_rect is not None:
-            # Transform the selection rectangle to account for zoom and pan
-            transformed_rect = QRect(
-                self.transform_point_from_scene(QPoint(self.selection_rect.left(), self.selection_rect.top())),
-                self.transform_point_from_scene(QPoint(self.selection_rect.right(), self.selection_rect.bottom()))
-            ).normalized()
+            # If the label changed, recalculate the element size
+            if old_label != new_label:
+                # Calculate minimum size based on new text
+                min_width, min_height = self.element._calculate_min_size_for_text(new_label)
+                
+                # Use the larger of the current size or the minimum required size
+                self.element.width = max(self.element.width, min_width)
+                self.element.height = max(self.element.height, min_height)
             
-            # Draw the selection rectangle
-            painter.setPen(QPen(QColor(100, 150, 255), 1, Qt.DashLine))
-            painter.setBrush(QBrush(QColor(100, 150, 255, 50)))
-            painter.drawRect(transformed_rect)
+            # Notify that properties have changed
+            if self.canvas:
+                self.canvas.diagram_changed.emit()
+                self.canvas.update()
+        
+        # Close the dialog
+        super().accept()
+
+
+class DiagramCanvas(QWidget):
+    """Widget for drawing and interacting with the diagram"""
+    diagram_changed = pyqtSignal()
+    about_to_change = pyqtSignal()  # Emitted before an undoable edit so the window can snapshot state
+    element_selected = pyqtSignal(object)  # Signal to notify when an element is selected for editing
+    
+    # Constants
+    ELEMENT_PADDING = 10  # Padding around elements to prevent overlap
     
-    def draw_grid(self, painter):
-        # Draw a light grid with dark mode colors
-        painter.setPen(QPen(DARK_GRID, 1, Qt.SolidLine))
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.elements = []  # List of diagram elements
+        self.connections = []  # List of connections between elements
+        self.selected_elements = []  # List of currently selected elements
+        self.selected_connections = []  # List of currently selected connections
+        # No hover effects are drawn, so leave mouse tracking off; Qt still delivers
+        # move events while a button is held, which is all drag/pan/connect need
+        self.setMouseTracking(False)
+        self.setFocusPolicy(Qt.StrongFocus)  # Enable keyboard focus
         
-        # Save the current transformation to restore it later
-        painter.save()
+        # Initialize variables for dragging
+        self.dragging = False
+        self.drag_start = None
+        self.drag_element = None
+        self.drag_obstacles = None  # Index of the elements that stay put during the current drag
+        self.background_cache = None  # (key, QPixmap) of one filled grid cell
+        self.drag_moving = []  # Elements moved by the current drag
+        self.drag_roots = []  # Outermost elements moved by the current drag
+        self.last_mouse_pos = QPoint(0, 0)
+        self.last_mouse_widget_pos = QPoint(0, 0)  # Same position in widget coordinates
+        
+        # Initialize variables for selection rectangle
+        self.selecting = False
+        self.selection_start = QPoint(0, 0)
+        self.selection_rect = None
+        self.selection_rect_active = False
         
-        # Reset the transformation to draw grid in screen coordinates
-        painter.resetTransform()
+        # Initialize variables for connection creation
+        self.creating_connection = False
+        self.connection_source = None
+        self.connection_just_created = False
+        self.connection_creation_time = QTime.currentTime()
+        self.connection_drag = False
         
-        # Get the widget size
-        widget_width = self.width()
-        widget_height = self.height()
+        # Initialize variables for nesting
+        self.creating_nesting = False
+        self.nesting_parent = None
+        self.nesting_drag = False
+        self.nesting_ancestors = set()  # nesting_parent and its ancestors, walked once per drag
         
-        # Calculate the grid size in screen coordinates
-        base_grid_size = 20
-        screen_grid_size = base_grid_size * self.scale_factor
+        # Initialize variables for cutting
+        self.cutting = False
+        self.cut_start = None
+        self.cut_current = None
         
-        # Adjust grid size based on zoom level for better visibility
-        if self.scale_factor < 0.5:
-            screen_grid_size = base_grid_size * self.scale_factor * 2
-        elif self.scale_factor > 2:
-            screen_grid_size = base_grid_size * self.scale_factor / 2
+        # Initialize variables for zoom and pan
+        self.scale_factor = 1.0
+        self.min_scale = 0.2  # Minimum zoom level
+        self.max_scale = 5.0  # Maximum zoom level
+        self.pan_offset = QPoint(0, 0)
+        self.panning = False
+        self.pan_start = QPoint(0, 0)
         
-        # Ensure grid size is at least 10 pixels and at most 50 pixels
-        screen_grid_size = max(10, min(50, screen_grid_size))
+        # Running while a wheel-zoom gesture is in progress; elements are drawn from
+        # resampled pixmaps until it fires, then repainted crisp at the final zoom
+        self.zoom_settle_timer = QTimer(self)
+        self.zoom_settle_timer.setSingleShot(True)
+        self.zoom_settle_timer.setInterval(150)
+        self.zoom_settle_timer.timeout.connect(self.update)
         
-        # Calculate offset for grid alignment based on pan
-        offset_x = self.pan_offset.x() % screen_grid_size
-        offset_y = self.pan_offset.y() % screen_grid_size
+        # Set a dark background
+        palette = self.palette()
+        palette.setColor(QPalette.Window, CANVAS_BG_COLOR)
+        self.setPalette(palette)
         
-        # Draw vertical grid lines
-        x = offset_x
-        while x < widget_width:
-            painter.drawLine(int(x), 0, int(x), widget_height)
-            x += screen_grid_size
+        # paintEvent fills the whole widget itself, so skip Qt's background erase
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
         
-        # Draw horizontal grid lines
-        y = offset_y
-        while y < widget_height:
-            painter.drawLine(0, int(y), widget_width, int(y))
-            y += screen_grid_size
+        # Set up the widget
+        self.setMinimumSize(800, 600)
+        self.setAcceptDrops(True)  # Enable drop events
         
-        # Restore the original transformation
-        painter.restore()
+        # Create context menu - only for connections, not for creating connections
+        self.setContextMenuPolicy(Qt.DefaultContextMenu)
+        
+        logger.debug("DiagramCanvas initialized")
     
-    def generate_d2_code(self):
-        """Generate D2 code from the current diagram"""
-        print(f"GENERATE D2 CODE - Elements: {len(self.elements)}, Connections: {len(self.connections)}")
+    def contextMenuEvent(self, event):
+        # Check if we just created a connection (within the last 1000ms)
+        if self.connection_just_created:
+            current_time = QTime.currentTime()
+            if self.connection_creation_time.msecsTo(current_time) < 1000:  # Increased from 500ms to 1000ms
+                # Prevent context menu from appearing
+                event.accept()
+                return
+            else:
+                # Reset the flag if enough time has passed
+                self.connection_just_created = False
+        
+        # Transform mouse position to account for zoom and pan
+        scene_pos = self.transform_point_to_scene(event.pos())
         
-        # Debug print for all elements
-        for i, element in enumerate(self.elements):
-            print(f"  Element {i}: {element.__class__.__name__}, Label: '{element.label}', Pos: ({element.x}, {element.y})")
+        # Check if we clicked on an element
+        clicked_element = self.element_at(scene_pos)
+                
+        if clicked_element:
+            # Create element context menu
+            menu = QMenu(self)
+            
+            # If the element is a child (has a parent), add option to disconnect
+            if clicked_element.parent:
+                disconnect_action = QAction("Disconnect from Parent", self)
+                disconnect_action.triggered.connect(lambda: self.disconnect_from_parent(clicked_element))
+                menu.addAction(disconnect_action)
+                
+                menu.exec_(event.globalPos())
+                event.accept()
+                return
+            
+            # If no special actions, start connection creation
+            self.creating_connection = True
+            self.connection_source = clicked_element
+            self.update()
+            event.accept()
+            return
         
-        # Debug print for all connections
-        for i, connection in enumerate(self.connections):
-            print(f"  Connection {i}: {connection.source.label} -> {connection.target.label}")
+        # Find if we clicked on a connection
+        clicked_connection = self.connection_at(scene_pos)
         
-        # If no elements, show instructions
-        if len(self.elements) == 0:
-            return "# Create a diagram by dragging elements from the top panel\n# Right-click between elements to create connections"
+        if clicked_connection:
+            # Create connection context menu
+            menu = QMenu(self)
+            
+            # Add actions for connection
+            edit_label_action = QAction("Edit Label", self)
+            edit_label_action.triggered.connect(lambda: self.edit_connection_label(clicked_connection))
+            menu.addAction(edit_label_action)
+            
+            # Add option to create reverse connection
+            create_reverse_action = QAction("Create Reverse Connection", self)
+            create_reverse_action.triggered.connect(lambda: self.create_reverse_connection(clicked_connection))
+            menu.addAction(create_reverse_action)
+            
+            # Delete connection
+            delete_action = QAction("Delete Connection", self)
+            delete_action.triggered.connect(lambda: self.delete_connection(clicked_connection))
+            menu.addAction(delete_action)
+            
+            menu.exec_(event.globalPos())
+            event.accept()
+            return
         
-        # Generate D2 code
-        code_parts = []
+        # Let the right-click event pass through for other purposes
+        event.ignore()
+    
+    def _detach(self, element):
+        """Detach an element from its parent without notifying; returns whether it had one"""
+        if not element.parent:
+            return False
+        parent = element.parent
+        # Remove from parent's children list
+        parent.children.remove(element)
+        # Clear the parent reference
+        element.parent = None
+        logger.debug("Disconnected %s from parent %s", element.label, parent.label)
+        return True
+    
+    def disconnect_from_parent(self, element):
+        """Disconnect an element from its parent"""
+        if self._detach(element):
+            self.diagram_changed.emit()
+            self.update()
+    
+    def edit_connection_label(self, connection):
+        """Edit the label of a connection"""
+        text, ok = QInputDialog.getText(self, "Connection Label", "Enter label:", 
+                                     QLineEdit.Normal, connection.label)
+        if ok:
+            connection.label = text
+            self.diagram_changed.emit()
+            self.update()
+    
+    def create_reverse_connection(self, connection):
+        """Create a reverse connection"""
+        # Check if a connection already exists in the opposite direction
+        existing_reverse_connection = None
+        for conn in self.connections:
+            if conn.source == connection.target and conn.target == connection.source:
+                existing_reverse_connection = conn
+                break
         
-        # Track elements that have been added to the D2 code
-        added_elements = set()
+        if existing_reverse_connection:
+            # Connection already exists
+            logger.debug("Connection already exists between %s and %s", connection.target.label, connection.source.label)
+        else:
+            # Create new reverse connection
+            reverse_connection = ArrowConnection(connection.target, connection.source)
+            self.connections.append(reverse_connection)
+            logger.debug("Created reverse connection from %s to %s", connection.target.label, connection.source.label)
         
-        # Add only top-level elements (elements that are not children of other elements)
-        for element in self.elements:
-            # Skip elements that are children of other elements
-            if element.parent is not None:
-                print(f"  Skipping child element: {element.label} (parent: {element.parent.label})")
-                continue
-                
-            try:
-                element_code = element.to_d2()
-                code_parts.append(element_code)
-                added_elements.add(element.label)
-                print(f"  Added element code: {element_code}")
-            except Exception as e:
-                print(f"Error generating D2 code for element {element.label}: {e}")
+        # Ensure we emit the signal to update the D2 code
+        self.diagram_changed.emit()
+        self.update()
+    
+    def delete_connection(self, connection):
+        """Delete a connection"""
+        # A single remove() instead of an `in` scan followed by remove()
+        try:
+            self.connections.remove(connection)
+        except ValueError:
+            return
         
-        # Add all connections
+        if connection in self.selected_connections:
+            self.selected_connections.remove(connection)
+        self.diagram_changed.emit()
+        self.update()
+    
+    def element_at(self, scene_pos):
+        """Return the top-most element under a scene position, or None"""
+        # Later elements are painted on top, so search from the end
+        for element in reversed(self.elements):
+            if element.contains(scene_pos):
+                return element
+        return None
+    
+    def connection_at(self, scene_pos, threshold=10):
+        """Return the first connection within threshold pixels of a scene position, or None"""
+        px, py = scene_pos.x(), scene_pos.y()
         for connection in self.connections:
-            try:
-                # Check if both source and target elements are already added
-                if connection.source.label not in added_elements:
-                    source_code = connection.source.to_d2()
-                    code_parts.append(source_code)
-                    added_elements.add(connection.source.label)
-                    print(f"  Added source element code: {source_code}")
-                
-                if connection.target.label not in added_elements:
-                    target_code = connection.target.to_d2()
-                    code_parts.append(target_code)
-                    added_elements.add(connection.target.label)
-                    print(f"  Added target element code: {target_code}")
-                
-                connection_code = connection.to_d2()
-                code_parts.append(connection_code)
-                print(f"  Added connection code: {connection_code}")
-            except Exception as e:
-                print(f"Error generating D2 code for connection: {e}")
+            source, target = connection.source, connection.target
+            sx = source.x + source.width // 2
+            sy = source.y + source.height // 2
+            tx = target.x + target.width // 2
+            ty = target.y + target.height // 2
+            
+            # Cheap bounding-box rejection before the exact point-to-segment distance
+            if (px < min(sx, tx) - threshold or px > max(sx, tx) + threshold or
+                    py < min(sy, ty) - threshold or py > max(sy, ty) + threshold):
+                continue
+            
+            # Calculate distance from click to line
+            if self._point_to_line_distance(scene_pos, QPoint(sx, sy), QPoint(tx, ty)) < threshold:
+                return connection
+        return None
+    
+    def _point_to_line_distance(self, point, line_start, line_end):
+        """Calculate the distance from a point to a line segment"""
+        # Extract coordinates
+        px, py = point.x(), point.y()
+        ax, ay = line_start.x(), line_start.y()
+        bx, by = line_end.x(), line_end.y()
         
-        # Join all code parts
-        result = "\n".join(code_parts)
+        # Calculate the squared length of the line segment
+        ab_squared = (bx - ax) ** 2 + (by - ay) ** 2
         
-        # Print the final D2 code
-        print(f"Final D2 code ({len(code_parts)} parts):\n{result}")
+        if ab_squared == 0:
+            # Line segment is actually a point
+            return math.sqrt((px - ax) ** 2 + (py - ay) ** 2)
         
-        return result
+        # Calculate the projection parameter t
+        t = ((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / ab_squared
+        
+        if t < 0:
+            # Closest point is line_start
+            return math.sqrt((px - ax) ** 2 + (py - ay) ** 2)
+        elif t > 1:
+            # Closest point is line_end
+            return math.sqrt((px - bx) ** 2 + (py - by) ** 2)
+        else:
+            # Closest point is on the line segment
+            projection_x = ax + t * (bx - ax)
+            projection_y = ay + t * (by - ay)
+            return math.sqrt((px - projection_x) ** 2 + (py - projection_y) ** 2)
     
-    def keyPressEvent(self, event):
-        # Handle keyboard shortcuts
-        if event.key() == Qt.Key_Delete:
-            # Delete selected elements
-            if self.selected_elements or self.selected_connections:
-                # Save the current state for undo
-                parent_window = self.window()
-                if isinstance(parent_window, DiagramDesigner):
-                    parent_window.save_state()
+    def _ancestor_chain(self, element):
+        """Return a set holding the element and all of its ancestors"""
+        ancestors = set()
+        current = element
+        # Stop on an already-seen element as well, so a corrupt chain can't loop forever
+        while current is not None and current not in ancestors:
+            ancestors.add(current)
+            current = current.parent
+        return ancestors
+    
+    def _would_create_circular_nesting(self, parent, child):
+        """Check if creating a nesting relationship would create a circular reference"""
+        # If the child is the parent or one of its ancestors, it would create a circular reference
+        return child in self._ancestor_chain(parent)
+    
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasText():
+            event.acceptProposedAction()
+            
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasText():
+            event.acceptProposedAction()
+    
+    def dropEvent(self, event):
+        if event.mimeData().hasText():
+            element_type = event.mimeData().text()
+            
+            # Transform drop position to account for zoom and pan
+            scene_pos = self.transform_point_to_scene(event.pos())
+            
+            # Save state for undo before adding the element
+            self.about_to_change.emit()
+            
+            # Create a new element based on the type
+            new_element = None
+            if element_type == "box":
+                # Create with default size - the constructor will adjust based on text
+                new_element = BoxElement(scene_pos.x() - 50, scene_pos.y() - 30)
+            elif element_type == "circle":
+                new_element = CircleElement(scene_pos.x() - 40, scene_pos.y() - 40)
+            elif element_type == "diamond":
+                new_element = DiamondElement(scene_pos.x() - 50, scene_pos.y() - 40)
+            elif element_type == "hexagon":
+                new_element = HexagonElement(scene_pos.x() - 50, scene_pos.y() - 40)
+            
+            if new_element:
+                # Center the element at the drop position after its size has been calculated
+                new_element.x = scene_pos.x() - new_element.width // 2
+                new_element.y = scene_pos.y() - new_element.height // 2
                 
-                if self.selected_elements:
-                    for element in list(self.selected_elements):
-                        # Remove any connections to/from this element
-                        for connection in list(self.connections):
-                            if connection.source == element or connection.target == element:
-                                self.connections.remove(connection)
-                        
-                        # Remove the element from its parent if it has one
-                        if element.parent:
-                            element.parent.children.remove(element)
-                            element.parent = None
-                        
-                        # Remove any children of this element
-                        for child in list(element.children):
-                            child.parent = None
-                            element.children.remove(child)
-                        
-                        # Remove the element from the canvas
-                        self.elements.remove(element)
-                    
-                    # Clear selection
-                    self.selected_elements.clear()
-                    
-                    # Emit signal to update D2 code
-                    self.diagram_changed.emit()
-                    
-                    # Update the canvas
-                    self.update()
+                # Find the nearest non-overlapping position; this tests the drop
+                # position itself first, so no separate overlap pass is needed here
+                valid_position = self.find_nearest_valid_position(new_element)
                 
-                # Delete selected connections
-                if self.selected_connections:
-                    for connection in list(self.selected_connections):
-                        self.connections.remove(connection)
-                    
-                    # Clear selection
-                    self.selected_connections.clear()
-                    
-                    # Emit signal to update D2 code
-                    self.diagram_changed.emit()
-                    
-                    # Update the canvas
-                    self.update()
-        
-        # 'X' key also deletes elements (same as Delete key)
-        elif event.key() == Qt.Key_X and not event.modifiers() & Qt.ControlModifier:
-            # Delete selected elements
-            if self.selected_elements:
-                for element in list(self.selected_elements):
-                    # Remove any connections to/from this element
-                    for connection in list(self.connections):
-                        if connection.source == element or connection.target == element:
-                            self.connections.remove(connection)
-                    
-                    # Remove the element from its parent if it has one
-                    if element.parent:
-                        element.parent.children.remove(element)
-                        element.parent = None
-                    
-                    # Remove any children of this element
-                    for child in list(element.children):
-                        child.parent = None
-                        element.children.remove(child)
-                    
-                    # Remove the element from the canvas
-                    self.elements.remove(element)
+                if valid_position:
+                    # Update the element's position to the valid position
+                    new_element.x, new_element.y = valid_position
+                    logger.debug("Element positioned at: (%s, %s)", new_element.x, new_element.y)
+                else:
+                    # No valid position found, don't add the element
+                    logger.debug("No valid position found for the element")
+                    return
+                
+                # Add the element to the canvas
+                self.elements.append(new_element)
                 
-                # Clear selection
+                # Clear previous selection
                 self.selected_elements.clear()
+                self.selected_connections.clear()
+                
+                # Select the new element
+                self.selected_elements.append(new_element)
+                
+                # Show properties for the new element
+                self.element_selected.emit(new_element)
                 
                 # Emit signal to update D2 code
                 self.diagram_changed.emit()
                 
                 # Update the canvas
                 self.update()
-            
-            # Delete selected connections
-            if self.selected_connections:
-                for connection in list(self.selected_connections):
-                    self.connections.remove(connection)
                 
-                # Clear selection
-                self.selected_connections.clear()
+                # Print debug info
+                logger.debug("Created new %s element at (%s, %s)", element_type, new_element.x, new_element.y)
                 
-                # Emit signal to update D2 code
-                self.diagram_changed.emit()
+                # Accept the drop event
+                event.acceptProposedAction()
                 
-                # Update the canvas
-                self.update()
-        
-        # Cancel current operations with Escape key
-        elif event.key() == Qt.Key_Escape:
-            # Cancel connection creation
-            if self.creating_connection:
-                self.creating_connection = False
-                self.connection_source = None
-                self.update()
+                # Return success
+                return 1
             
-            # Cancel nesting creation
-            if self.creating_nesting:
-                self.creating_nesting = False
-                self.nesting_parent = None
-                self.update()
-                
-            # Cancel cutting mode
-            if self.cutting:
-                self.cutting = False
-                self.cut_start = None
-                self.cut_current = None
-                self.setCursor(Qt.ArrowCursor)
-                self.update()
+            # If we get here, no element was created
+            return 0
+    
+    def _build_drag_obstacles(self, moving_set):
+        """Index the elements that stay put during a drag, sorted by their left edge"""
+        # Descendants of the moving elements travel with them (move() is recursive),
+        # so they cannot go into the static index and are checked live instead
+        riding = []
+        pending = [child for element in moving_set for child in element.children]
+        while pending:
+            element = pending.pop()
+            if element not in moving_set:
+                riding.append(element)
+            pending.extend(element.children)
+        riding_set = set(riding)
+        
+        obstacles = sorted(
+            ((element.x, element.y, element.x + element.width, element.y + element.height,
+              element.parent) for element in self.elements
+             if element not in moving_set and element not in riding_set),
+            key=lambda obstacle: obstacle[0]
+        )
+        lefts = [obstacle[0] for obstacle in obstacles]
+        max_width = max((obstacle[2] - obstacle[0] for obstacle in obstacles), default=0)
+        return lefts, obstacles, max_width, riding
+    
+    def _overlaps_drag_obstacle(self, moving_element):
+        """Check a moving element against the drag obstacle index, considering padding"""
+        lefts, obstacles, max_width, riding = self.drag_obstacles
+        padding = self.ELEMENT_PADDING
+        
+        # Padded bounds of the moving element, as in overlaps_with()
+        left = moving_element.x - padding
+        top = moving_element.y - padding
+        right = moving_element.x + moving_element.width + padding
+        bottom = moving_element.y + moving_element.height + padding
+        
+        # Only obstacles whose left edge lies in (left - max_width, right) can reach us
+        start = bisect.bisect_right(lefts, left - max_width)
+        end = bisect.bisect_left(lefts, right)
+        for other_left, other_top, other_right, other_bottom, parent in obstacles[start:end]:
+            # Children of the moving element may overlap it
+            if parent is moving_element:
+                continue
+            if left < other_right and other_left < right and top < other_bottom and other_top < bottom:
+                return True
+        
+        # Descendants being carried along by the drag
+        for element in riding:
+            if element.parent is moving_element:
+                continue
+            if moving_element.overlaps_with(element, padding):
+                return True
+        return False
+    
+    def find_nearest_valid_position(self, element, max_distance=300):
+        """
+        Find the nearest valid position for an element that doesn't overlap with existing elements.
+        Uses a spiral search pattern to find the closest valid position.
+        
+        Args:
+            element: The element to position
+            max_distance: Maximum search distance in pixels
             
-            # Clear selection
-            self.selected_elements.clear()
-            self.selected_connections.clear()
-            self.update()
+        Returns:
+            (x, y) tuple of the nearest valid position, or None if no valid position found
+        """
+        # Start with the element's current position
+        original_x, original_y = element.x, element.y
+        width, height = element.width, element.height
+        
+        # Precompute every other element's bounds, grown by the padding, as plain tuples once;
+        # each candidate is then tested with float compares instead of building QRectFs
+        padding = self.ELEMENT_PADDING
+        obstacles = [
+            (other.x - padding, other.y - padding,
+             other.x + other.width + padding, other.y + other.height + padding)
+            for other in self.elements if other is not element
+        ]
         
-        # Ctrl+D to duplicate selected elements
-        elif event.key() == Qt.Key_D and event.modifiers() & Qt.ControlModifier:
-            if self.selected_elements:
-                # Save the current state for undo
-                parent_window = self.window()
-                if isinstance(parent_window, DiagramDesigner):
-                    parent_window.save_state()
+        def overlaps_any(x, y):
+            # Same test as overlaps_with(): strict overlap, touching edges are fine
+            right = x + width
+            bottom = y + height
+            for left, top, other_right, other_bottom in obstacles:
+                if x < other_right and left < right and y < other_bottom and top < bottom:
+                    return True
+            return False
+        
+        # Try the original position first
+        if not overlaps_any(original_x, original_y):
+            return original_x, original_y
+        
+        # Spiral search pattern
+        # Start with a small step and increase gradually
+        step_size = max(width, height) // 2
+        max_steps = max_distance // step_size
+        
+        # Search in a spiral pattern (right, down, left, up, and repeat with increasing distance)
+        directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]  # right, down, left, up
+        
+        for distance in range(1, max_steps + 1):
+            for direction in directions:
+                # Each direction yields exactly one candidate per ring, so test it once
+                test_x = original_x + direction[0] * step_size * distance
+                test_y = original_y + direction[1] * step_size * distance
                 
-                new_elements = []
+                if not overlaps_any(test_x, test_y):
+                    return test_x, test_y
+        
+        # If we get here, no valid position was found within the max distance
+        return None
+    
+    def mousePressEvent(self, event):
+        # Handle middle mouse button for zoom-to-fit
+        if event.button() == Qt.MiddleButton:
+            # Single click to zoom to fit
+            self.zoom_to_fit()
+            return
+            
+        # Transform mouse position to account for zoom and pan
+        scene_pos = self.transform_point_to_scene(event.pos())
+        self.last_mouse_widget_pos = event.pos()
+            
+        if event.button() == Qt.LeftButton:
+            # Handle Alt + left mouse button for cutting connections; this doesn't care what
+            # is under the cursor, so decide it before running any hit tests
+            if event.modifiers() & Qt.AltModifier:
+                self.cutting = True
+                self.cut_start = scene_pos
+                self.cut_current = scene_pos
+                self.setCursor(Qt.CrossCursor)  # Set cursor to cross for cutting
+                return
+            
+            # Check if clicking on an element
+            clicked_element = self.element_at(scene_pos)
+            
+            # Check if clicking on a connection
+            clicked_connection = None
+            if not clicked_element:
+                clicked_connection = self.connection_at(scene_pos)
+            
+            if clicked_element:
+                # Start dragging the element
+                self.dragging = True
+                self.drag_element = clicked_element
+                self.drag_start = scene_pos
+                self.drag_obstacles = None
                 
-                for element in self.selected_elements:
-                    # Create a new element of the same type
-                    if isinstance(element, BoxElement):
-                        new_element = BoxElement(element.x + 20, element.y + 20, element.width, element.height, element.label + " (copy)")
-                    elif isinstance(element, CircleElement):
-                        new_element = CircleElement(element.x + 20, element.y + 20, element.width, element.height, element.label + " (copy)")
-                    elif isinstance(element, DiamondElement):
-                        new_element = DiamondElement(element.x + 20, element.y + 20, element.width, element.height, element.label + " (copy)")
-                    elif isinstance(element, HexagonElement):
-                        new_element = HexagonElement(element.x + 20, element.y + 20, element.width, element.height, element.label + " (copy)")
-                    else:
-                        continue
+                # Check if we're clicking on a selected element
+                if clicked_element in self.selected_elements:
+                    # If Shift is not pressed, keep the current selection
+                    pass
+                else:
+                    # If Shift is not pressed, clear the current selection
+                    if not (event.modifiers() & Qt.ShiftModifier):
+                        self.selected_elements.clear()
                     
-                    # Copy properties
-                    new_element.color = QColor(element.color)
-                    new_element.border_color = QColor(element.border_color)
+                    # Add the clicked element to the selection
+                    self.selected_elements.append(clicked_element)
                     
-                    # Add to canvas
-                    self.elements.append(new_element)
-                    new_elements.append(new_element)
+                    # Emit signal to notify that an element is selected
+                    self.element_selected.emit(clicked_element)
+                
+                # Update the canvas
+                self.update()
+            elif clicked_connection:
+                # Select the connection
+                if not (event.modifiers() & Qt.ShiftModifier):
+                    self.selected_connections.clear()
+                    self.selected_elements.clear()
+                
+                self.selected_connections.append(clicked_connection)
+                
+                # Update the canvas
+                self.update()
+            else:
+                # Clicking in empty space
                 
-                # Update selection to the new elements
-                self.selected_elements = new_elements
+                # Start panning if no element or connection was clicked
+                self.panning = True
+                self.pan_start = event.pos()
+                self.setCursor(Qt.OpenHandCursor)  # Set cursor to open hand for panning
                 
-                # Emit signal to update D2 code
-                self.diagram_changed.emit()
+                # If Shift is not pressed, clear the current selection
+                if not (event.modifiers() & Qt.ShiftModifier):
+                    self.selected_elements.clear()
+                    self.selected_connections.clear()
+                    
+                    # Emit signal to notify that no element is selected
+                    self.element_selected.emit(None)
                 
                 # Update the canvas
                 self.update()
-        
-        # Ctrl+X to disconnect from parent
-        elif event.key() == Qt.Key_X and event.modifiers() & Qt.ControlModifier:
-            if self.selected_elements:
-                # Save the current state for undo
-                parent_window = self.window()
-                if isinstance(parent_window, DiagramDesigner):
-                    parent_window.save_state()
+        elif event.button() == Qt.RightButton:
+            # Check if clicking on an element
+            clicked_element = self.element_at(scene_pos)
+            
+            if clicked_element:
+                # Check if Alt key is pressed for nesting operation
+                if event.modifiers() & Qt.AltModifier:
+                    # Start creating a nesting relationship via dragging
+                    self.creating_nesting = True
+                    self.nesting_parent = clicked_element
+                    self.nesting_drag = True  # Flag to indicate we're creating nesting by dragging
+                    # Walk the parent chain once here; the release check is then a set lookup
+                    self.nesting_ancestors = self._ancestor_chain(clicked_element)
+                    logger.debug("Starting nesting drag from parent: %s", clicked_element.label)
+                    self.update()
+                else:
+                    # Standard connection creation
+                    self.creating_connection = True
+                    self.connection_source = clicked_element
+                    self.connection_drag = True  # Flag to indicate we're creating by dragging
+                    logger.debug("Starting connection drag from element: %s", clicked_element.label)
+                    self.update()
+            else:
+                # Right-clicking in empty space - start selection rectangle
+                self.selecting = True
+                self.selection_start = event.pos()
+                self.selection_rect = None
+                self.selection_rect_active = False
                 
-                for element in self.selected_elements:
-                    self.disconnect_from_parent(element)
-        
-        # Ctrl+Z for undo (handled by the main window)
-        elif event.key() == Qt.Key_Z and event.modifiers() & Qt.ControlModifier:
-            print("Ctrl+Z pressed - Calling undo_action")
-            parent_window = self.window()
-            if isinstance(parent_window, DiagramDesigner):
-                parent_window.undo_action()
-        
-        # Ctrl+Y for redo (handled by the main window)
-        elif event.key() == Qt.Key_Y and event.modifiers() & Qt.ControlModifier:
-            print("Ctrl+Y pressed - Calling redo_action")
-            parent_window = self.window()
-            if isinstance(parent_window, DiagramDesigner):
-                parent_window.redo_action()
-        
-        # Ctrl+S for save
-        elif event.key() == Qt.Key_S and event.modifiers() & Qt.ControlModifier:
-            parent_window = self.window()
-            if isinstance(parent_window, DiagramDesigner):
-                parent_window.save_diagram()
-        
-        # Ctrl+O for open/load
-        elif event.key() == Qt.Key_O and event.modifiers() & Qt.ControlModifier:
-            parent_window = self.window()
-            if isinstance(parent_window, DiagramDesigner):
-                parent_window.load_diagram()
-        
-        else:
-            # Pass the event to the parent class
-            super().keyPressEvent(event)
-    
-    def transform_point_to_scene(self, point):
-        """Transform a point from screen coordinates to scene coordinates"""
-        # Adjust for pan
-        adjusted_point = QPoint(point.x() - self.pan_offset.x(), point.y() - self.pan_offset.y())
-        # Adjust for zoom
-        return QPoint(int(adjusted_point.x() / self.scale_factor), int(adjusted_point.y() / self.scale_factor))
-    
-    def transform_point_from_scene(self, point):
-        """Transform a point from scene coordinates to screen coordinates"""
-        # Adjust for zoom
-        scaled_point = QPoint(int(point.x() * self.scale_factor), int(point.y() * self.scale_factor))
-        # Adjust for pan
-        return QPoint(scaled_point.x() + self.pan_offset.x(), scaled_point.y() + self.pan_offset.y())
+                # If Shift is not pressed, clear the current selection
+                if not (event.modifiers() & Qt.ShiftModifier):
+                    self.selected_elements.clear()
+                    self.selected_connections.clear()
+                    
+                    # Emit signal to notify that no element is selected
+                    self.element_selected.emit(None)
+                
+                # Update the canvas
+                self.update()
     
-    def wheelEvent(self, event):
-        """Handle mouse wheel events for zooming"""
-        # Store the mouse position in screen coordinates
-        mouse_pos = event.pos()
-        
-        # Convert mouse position to scene coordinates before zoom
-        scene_pos = self.transform_point_to_scene(mouse_pos)
-        
-        # Store old scale factor
-        old_scale = self.scale_factor
-        
-        # Calculate zoom factor
-        zoom_factor = 1.15  # Slightly increased for more noticeable zoom
-        if event.angleDelta().y() < 0:
-            # Zoom out
-            self.scale_factor /= zoom_factor
-        else:
-            # Zoom in
-            self.scale_factor *= zoom_factor
-        
-        # Clamp scale factor to min/max values
-        self.scale_factor = max(self.min_scale, min(self.max_scale, self.scale_factor))
-        
-        # Calculate how the scene point would be positioned after zoom
-        # This is the key to zooming at the mouse position
-        new_screen_x = int(scene_pos.x() * self.scale_factor + self.pan_offset.x())
-        new_screen_y = int(scene_pos.y() * self.scale_factor + self.pan_offset.y())
-        
-        # Adjust pan offset to keep the point under the cursor fixed
-        delta_x = new_screen_x - mouse_pos.x()
-        delta_y = new_screen_y - mouse_pos.y()
-        
-        self.pan_offset.setX(self.pan_offset.x() - delta_x)
-        self.pan_offset.setY(self.pan_offset.y() - delta_y)
+    def mouseMoveEvent(self, event):
+        # Where the cursor was, so preview lines can repaint just the area they covered
+        previous_widget_pos = self.last_mouse_widget_pos
         
-        # Force immediate repaint to ensure real-time updates
-        self.repaint()
+        # Always update the last_mouse_pos for connection drawing and other interactions
+        self.last_mouse_pos = self.transform_point_to_scene(event.pos())
+        self.last_mouse_widget_pos = event.pos()
         
-        # Debug print
-        print(f"Zoom: {self.scale_factor:.2f}, Pan: ({self.pan_offset.x()}, {self.pan_offset.y()})")
+        # Force update for all interactions
+        need_update = False
         
-        # Accept the event to prevent it from being passed to parent widgets
-        event.accept()
-
-    def zoom_to_fit(self):
-        """Zoom to fit the diagram in the canvas"""
-        if not self.elements:
-            # Reset to default view if no elements
-            self.scale_factor = 1.0
-            self.pan_offset = QPoint(0, 0)
-            self.update()
+        # Handle cutting with Alt + left mouse button
+        if self.cutting and event.buttons() & Qt.LeftButton:
+            # Update the current position of the cutting line
+            self.cut_current = self.last_mouse_pos
+            if self.cut_start:
+                self._update_preview_line(self.cut_start, previous_widget_pos)
+            event.accept()
             return
             
-        # Find the bounding box of all elements
-        min_x = min(element.x for element in self.elements)
-        max_x = max(element.x + element.width for element in self.elements)
-        min_y = min(element.y for element in self.elements)
-        max_y = max(element.y + element.height for element in self.elements)
-        
-        # Add padding (10% on each side)
-        padding_x = (max_x - min_x) * 0.1
-        padding_y = (max_y - min_y) * 0.1
-        min_x -= padding_x
-        max_x += padding_x
-        min_y -= padding_y
-        max_y += padding_y
-        
-        # Calculate dimensions
-        width = max_x - min_x
-        height = max_y - min_y
-        
-        if width <= 0 or height <= 0:
+        # Handle panning with left mouse button in empty space
+        elif self.panning and event.buttons() & Qt.LeftButton:
+            delta = event.pos() - self.pan_start
+            self.pan_offset += delta
+            self.pan_start = event.pos()
+            
+            # Change cursor to closed hand during active panning (only once, not on every move)
+            if self.cursor().shape() != Qt.ClosedHandCursor:
+                self.setCursor(Qt.ClosedHandCursor)
+            
+            # Shift the already-painted pixels and let Qt repaint only the newly exposed strip,
+            # instead of redrawing the whole canvas for every mouse move
+            self.scroll(delta.x(), delta.y())
+            event.accept()
             return
             
-        # Calculate scale factor to fit the diagram
-        scale_x = self.width() / width
-        scale_y = self.height() / height
-        self.scale_factor = min(scale_x, scale_y, self.max_scale)  # Limit maximum zoom
-        
-        # Calculate pan offset to center the diagram
-        center_x = (min_x + max_x) / 2
-        center_y = (min_y + max_y) / 2
-        
-        viewport_center_x = self.width() / 2
-        viewport_center_y = self.height() / 2
-        
-        self.pan_offset.setX(int(viewport_center_x - center_x * self.scale_factor))
-        self.pan_offset.setY(int(viewport_center_y - center_y * self.scale_factor))
-        
-        self.update()
-        print(f"Zoom to fit: scale={self.scale_factor}, pan=({self.pan_offset.x()}, {self.pan_offset.y()})")
-
-    def find_intersected_connections(self, start_point, end_point):
-        """Find connections that intersect with the line from start_point to end_point"""
-        intersected_connections = []
-        
-        for connection in self.connections:
-            # Get the source and target points of the connection
-            source_center = QPoint(
-                int(connection.source.x + connection.source.width / 2),
-                int(connection.source.y + connection.source.height / 2)
-            )
-            target_center = QPoint(
-                int(connection.target.x + connection.target.width / 2),
-                int(connection.target.y + connection.target.height / 2)
-            )
+        # Handle connection creation with right mouse button
+        elif self.creating_connection and event.buttons() & Qt.RightButton:
+            # Just redraw the temporary connection line
+            if self.connection_source:
+                element = self.connection_source
+                self._update_preview_line(QPoint(int(element.x + element.width / 2),
+                                                 int(element.y + element.height / 2)),
+                                          previous_widget_pos)
+            event.accept()
+            return
             
-            # Find the actual connection points (where the arrow intersects with the elements)
-            source_point = connection._find_intersection_point(connection.source, target_center, source_center)
-            target_point = connection._find_intersection_point(connection.target, source_center, target_center)
+        # Handle nesting creation with Alt + right mouse button
+        elif self.creating_nesting and event.buttons() & Qt.RightButton:
+            # Just redraw the temporary nesting line
+            if self.nesting_parent:
+                element = self.nesting_parent
+                self._update_preview_line(QPoint(int(element.x + element.width / 2),
+                                                 int(element.y + element.height / 2)),
+                                          previous_widget_pos)
+            event.accept()
+            return
             
-            # Check if the cutting line intersects with the connection line
-            if self._lines_intersect(start_point, end_point, source_point, target_point):
-                intersected_connections.append(connection)
-                print(f"Connection intersected: {connection.source.label} -> {connection.target.label}")
-        
-        return intersected_connections
-        
-    def _lines_intersect(self, p1, p2, p3, p4):
-        """Check if two line segments (p1-p2 and p3-p4) intersect"""
-        # Convert QPoint to coordinates
-        x1, y1 = p1.x(), p1.y()
-        x2, y2 = p2.x(), p2.y()
-        x3, y3 = p3.x(), p3.y()
-        x4, y4 = p4.x(), p4.y()
-        
-        # Calculate the direction vectors
-        dx1 = x2 - x1
-        dy1 = y2 - y1
-        dx2 = x4 - x3
-        dy2 = y4 - y3
-        
-        # Calculate the determinant
-        det = dx1 * dy2 - dy1 * dx2
-        
-        # If determinant is zero, lines are parallel
-        if abs(det) < 1e-10:
-            return False
+        # Handle dragging elements
+        elif self.dragging and self.drag_element and (event.buttons() & Qt.LeftButton):
+            # Calculate the movement delta
+            delta = self.last_mouse_pos - self.drag_start
             
-        # Calculate parameters for the intersection point
-        t1 = ((x3 - x1) * dy2 - (y3 - y1) * dx2) / det
-        t2 = ((x3 - x1) * dy1 - (y3 - y1) * dx1) / det
-        
-        # Check if the intersection point is within both line segments
-        return 0 <= t1 <= 1 and 0 <= t2 <= 1
-
-    def push_away_elements(self, resized_element, original_width, original_height):
-        """
-        Push away elements that would overlap with the resized element.
-        
-        Args:
-            resized_element: The element that was resized
-            original_width: The original width of the element before resizing
-            original_height: The original height of the element before resizing
-        """
-        # Calculate how much the element has grown in each direction
-        width_increase = resized_element.width - original_width
-        height_increase = resized_element.height - original_height
+            # When zoomed in, several mouse events map to the same scene point; nothing
+            # would move, so skip the overlap check and the repaint entirely
+            if delta.isNull():
+                event.accept()
+                return
+            
+            # The selection cannot change mid-drag, so which elements move is decided once on
+            # the first move rather than scanning the selection list on every mouse event.
+            # The elements that are not moving stay put for the whole drag, so they are indexed
+            # once and each move only looks at nearby ones. Only the outermost moving elements
+            # are moved: move() carries descendants along, so moving a selected child as well
+            # as its selected parent would shift it twice
+            if self.drag_obstacles is None:
+                if len(self.selected_elements) > 1 and self.drag_element in self.selected_elements:
+                    # If dragging a selected element and multiple elements are selected,
+                    # move all selected elements
+                    elements_to_move = list(self.selected_elements)
+                else:
+                    # Otherwise just move the dragged element
+                    elements_to_move = [self.drag_element]
+                self.drag_moving = elements_to_move
+                moving_set = set(elements_to_move)
+                self.drag_obstacles = self._build_drag_obstacles(moving_set)
+                self.drag_roots = [element for element in elements_to_move
+                                   if not self._ancestor_chain(element.parent) & moving_set]
+            
+            # Temporarily move all elements
+            dx, dy = delta.x(), delta.y()
+            for element in self.drag_roots:
+                element.move(dx, dy)
+            
+            # Check for overlap with the elements that are not moving
+            overlap_detected = False
+            for moving_element in self.drag_moving:
+                if self._overlaps_drag_obstacle(moving_element):
+                    overlap_detected = True
+                    break
+            
+            # If overlap detected, revert to original positions (descendants included)
+            if overlap_detected:
+                for element in self.drag_roots:
+                    element.move(-dx, -dy)
+                # Don't update drag_start here, so the elements can still be dragged
+                # from their original positions in a different direction
+            else:
+                # Update the drag start position only if the move was successful
+                self.drag_start = self.last_mouse_pos
+            
+            need_update = True
+            
+        # Handle selection rectangle with right mouse button
+        elif self.selecting and (event.buttons() & Qt.RightButton):
+            # Update selection rectangle
+            current_pos = event.pos()
+            self.selection_rect = QRect(self.selection_start, current_pos).normalized()
+            self.selection_rect_active = True
+            need_update = True
         
-        # If the element didn't grow, no need to push anything
-        if width_increase <= 0 and height_increase <= 0:
-            return
+        # Always update the canvas if any interaction is happening.
+        # update() lets Qt coalesce bursts of mouse moves into one paint per frame,
+        # where repaint() forced a full synchronous paint for every event.
+        if need_update or event.buttons():
+            self.update()
         
-        # Check each element for potential overlap
-        for element in self.elements:
-            # Skip the resized element itself
-            if element == resized_element or element in resized_element.children:
-                continue
+        event.accept()
+    
+    def _update_preview_line(self, scene_start, previous_widget_pos):
+        """Repaint only the area a preview line from scene_start to the cursor covered
+        before and after the cursor moved, instead of the whole canvas"""
+        start = self.transform_point_from_scene(scene_start)
+        dirty = QRect(start, previous_widget_pos).normalized().united(
+            QRect(start, self.last_mouse_widget_pos).normalized())
+        
+        # The 2px preview pens are scaled with the diagram
+        margin = int(2 * self.scale_factor) + 2
+        self.update(dirty.adjusted(-margin, -margin, margin, margin))
+    
+    def mouseReleaseEvent(self, event):
+        # Handle left mouse button release
+        if event.button() == Qt.LeftButton:
+            # Check if we were in cutting mode
+            if self.cutting:
+                # Find connections that intersect with the cutting line
+                intersected_connections = self.find_intersected_connections(self.cut_start, self.cut_current)
                 
-            # Skip if the element is a parent of the resized element
-            if resized_element.parent == element:
-                continue
+                if intersected_connections:
+                    # Save the current state for undo
+                    self.about_to_change.emit()
+                    
+                    # Remove the intersected connections
+                    for connection in intersected_connections:
+                        self.connections.remove(connection)
+                    
+                    # Emit signal to update D2 code
+                    self.diagram_changed.emit()
                 
-            # Check if the elements now overlap
-            if resized_element.overlaps_with(element, self.ELEMENT_PADDING):
-                # Calculate the center points of both elements
-                resized_center_x = resized_element.x + resized_element.width / 2
-                resized_center_y = resized_element.y + resized_element.height / 2
-                element_center_x = element.x + element.width / 2
-                element_center_y = element.y + element.height / 2
+                # Reset cutting mode
+                self.cutting = False
+                self.cut_start = None
+                self.cut_current = None
+                self.setCursor(Qt.ArrowCursor)
+                self.update()
+            
+            # Check if we were panning
+            elif self.panning:
+                self.panning = False
+                self.setCursor(Qt.ArrowCursor)
+            
+            # Check if we were dragging an element
+            elif self.drag_element:
+                # Save the current state for undo
+                self.about_to_change.emit()
                 
-                # Calculate the direction vector from resized element to the other element
-                dx = element_center_x - resized_center_x
-                dy = element_center_y - resized_center_y
+                # Reset drag element
+                self.drag_element = None
+                self.drag_start = None
+                self.drag_obstacles = None
+                self.setCursor(Qt.ArrowCursor)
                 
-                # Normalize the direction vector if it's not zero
-                length = (dx**2 + dy**2)**0.5
-                if length < 0.001:  # Avoid division by zero
-                    # If centers are too close, push directly to the right
-                    dx, dy = 1, 0
+                # Emit signal to update D2 code
+                self.diagram_changed.emit()
+
+        elif event.button() == Qt.RightButton:
+            # Handle selection rectangle with right mouse button
+            if self.selecting:
+                self.selecting = False
+                
+                # Transform selection rectangle to scene coordinates
+                if self.selection_rect:
+                    # Sets for O(1) "already selected" checks
+                    already_selected = set(self.selected_elements)
+                    already_selected_connections = set(self.selected_connections)
+                    
+                    # Find elements within the selection rectangle
+                    for element in self.elements:
+                        element_rect = QRect(
+                            self.transform_point_from_scene(QPoint(element.x, element.y)),
+                            self.transform_point_from_scene(QPoint(element.x + element.width, element.y + element.height))
+                        ).normalized()
+                        
+                        if self.selection_rect.intersects(element_rect):
+                            if element not in already_selected:
+                                already_selected.add(element)
+                                self.selected_elements.append(element)
+                    
+                    # Find connections within the selection rectangle
+                    for connection in self.connections:
+                        source_center = QPoint(
+                            connection.source.x + connection.source.width//2,
+                            connection.source.y + connection.source.height//2
+                        )
+                        target_center = QPoint(
+                            connection.target.x + connection.target.width//2,
+                            connection.target.y + connection.target.height//2
+                        )
+                        
+                        source_screen = self.transform_point_from_scene(source_center)
+                        target_screen = self.transform_point_from_scene(target_center)
+                        
+                        # Check if either endpoint is within the selection rectangle
+                        if (self.selection_rect.contains(source_screen) or 
+                            self.selection_rect.contains(target_screen)):
+                            if connection not in already_selected_connections:
+                                already_selected_connections.add(connection)
+                                self.selected_connections.append(connection)
+                
+                # Clear selection rectangle
+                self.selection_rect = None
+                self.selection_rect_active = False
+                
+                # Show properties for the first selected element
+                if self.selected_elements:
+                    self.element_selected.emit(self.selected_elements[0])
+                
+                # Update the canvas
+                self.update()
+                return
+                
+            # Check if we were creating a nesting relationship with Alt+Right-click
+            if self.creating_nesting and self.nesting_drag:
+                # Transform mouse position to account for zoom and pan
+                scene_pos = self.transform_point_to_scene(event.pos())
+                
+                # Check if releasing over an element
+                child_element = self.element_at(scene_pos)
+                
+                if child_element and child_element != self.nesting_parent:
+                    # Check if this would create a circular nesting
+                    if child_element in self.nesting_ancestors:
+                        logger.debug("Cannot nest %s inside %s - would create circular nesting", child_element.label, self.nesting_parent.label)
+                    else:
+                        # Remove from previous parent if exists
+                        if child_element.parent:
+                            child_element.parent.children.remove(child_element)
+                        
+                        # Create nesting relationship
+                        child_element.parent = self.nesting_parent
+                        self.nesting_parent.children.append(child_element)
+                        logger.debug("Nested %s inside %s", child_element.label, self.nesting_parent.label)
+                        self.diagram_changed.emit()
+                        
+                        # Set the flag to prevent context menu
+                        self.connection_just_created = True
+                        self.connection_creation_time = QTime.currentTime()
                 else:
-                    dx /= length
-                    dy /= length
+                    logger.debug("Nesting operation cancelled - no child element or same as parent")
                 
-                # Calculate the minimum distance needed to push away
-                # This includes the half-widths/heights of both elements plus padding
-                min_dist_x = (resized_element.width + element.width) / 2 + self.ELEMENT_PADDING
-                min_dist_y = (resized_element.height + element.height) / 2 + self.ELEMENT_PADDING
+                # Reset nesting creation state
+                self.creating_nesting = False
+                self.nesting_parent = None
+                self.nesting_drag = False
+                self.nesting_ancestors = set()
+                self.update()
                 
-                # Calculate the actual distance between centers
-                actual_dist = length
+                # Accept the event to prevent context menu
+                event.accept()
+                return
                 
-                # Calculate how much to push in each direction
-                # We push more in the direction of the larger component (dx or dy)
-                if abs(dx) > abs(dy):
-                    # Pushing horizontally is preferred
-                    push_x = dx * (min_dist_x - actual_dist * abs(dx)) / abs(dx) if abs(dx) > 0.001 else 0
-                    push_y = 0
+            # Check if we were creating a connection with Right-click
+            elif self.creating_connection:
+                # Transform mouse position to account for zoom and pan
+                scene_pos = self.transform_point_to_scene(event.pos())
+                
+                # Check if releasing over an element
+                target_element = self.element_at(scene_pos)
+                
+                if target_element and target_element != self.connection_source:
+                    # Check if a connection already exists between these elements
+                    existing_connection = None
+                    for conn in self.connections:
+                        if (conn.source == self.connection_source and conn.target == target_element):
+                            existing_connection = conn
+                            break
+                    
+                    if existing_connection:
+                        # Connection already exists
+                        logger.debug("Connection already exists between %s and %s", self.connection_source.label, target_element.label)
+                    else:
+                        # Create a new connection
+                        new_connection = ArrowConnection(self.connection_source, target_element)
+                        self.connections.append(new_connection)
+                        logger.debug("Created connection from %s to %s", self.connection_source.label, target_element.label)
+                        self.diagram_changed.emit()
+                        
+                        # Set the flag to prevent context menu
+                        self.connection_just_created = True
+                        self.connection_creation_time = QTime.currentTime()
                 else:
-                    # Pushing vertically is preferred
-                    push_x = 0
-                    push_y = dy * (min_dist_y - actual_dist * abs(dy)) / abs(dy) if abs(dy) > 0.001 else 0
+                    logger.debug("Connection creation cancelled - no target element or same as source")
                 
-                # Apply the push
-                element.move(int(push_x), int(push_y))
+                # Reset connection creation state
+                self.creating_connection = False
+                self.connection_source = None
+                self.update()
                 
-                # Recursively push away any elements that might now overlap with the pushed element
-                self.push_away_elements(element, element.width, element.height)
-
-    def resize_element(self, element, new_width, new_height):
-        """
-        Resize an element and push away other elements if needed.
-        
-        Args:
-            element: The element to resize
-            new_width: The new width for the element
-            new_height: The new height for the element
-        """
-        # Store original dimensions
-        original_width = element.width
-        original_height = element.height
-        
-        # Resize the element using its resize method to respect minimum text size
-        element.resize(new_width, new_height)
-        
-        # Push away other elements if needed
-        self.push_away_elements(element, original_width, original_height)
+                # Accept the event to prevent context menu
+                event.accept()
+    
+    def mouseDoubleClickEvent(self, event):
+        # Transform mouse position to account for zoom and pan
+        scene_pos = self.transform_point_to_scene(event.pos())
         
-        # Update the canvas
-        self.update()
+        # Check if double-clicking on a container title
+        for element in self.elements:
+            if element.children:
+                # Calculate container bounds
+                min_x = element.x
+                min_y = element.y
+                max_x = element.x + element.width
+                max_y = element.y + element.height
+                
+                # Define title padding
+                title_padding = 40  # Extra space below the header
+                
+                # Nothing is left above this line, so min_y never changes in the loop below
+                # and the threshold is computed once per container
+                title_bottom = min_y + title_padding
+                
+                # Adjust the parent element's position if it's too close to the top of its own container
+                if element.y < title_bottom:
+                    # Create space between the parent element and the container title
+                    element.y = title_bottom
+                    max_y = element.y + element.height  # Update max_y after moving the element
+                
+                for child in element.children:
+                    # Apply extra top padding to child elements to prevent them from touching the title
+                    # Adjust child positions if they're too close to the top of the container
+                    child_y = child.y
+                    if child_y < title_bottom:
+                        # Push the child element down if it's too close to the title
+                        child.y = child_y = title_bottom
+                    
+                    child_x = child.x
+                    if child_x < min_x:
+                        min_x = child_x
+                    right = child_x + child.width
+                    if right > max_x:
+                        max_x = right
+                    bottom = child_y + child.height
+                    if bottom > max_y:
+                        max_y = bottom
+                
+                # Add padding
+                padding = 20  # Increased padding
+                min_x -= padding
+                min_y -= padding
+                max_x += padding
+                max_y += padding
+                
+                # Check if clicked in the title area (top 20 pixels of container)
+                title_rect = QRect(min_x, min_y, max_x - min_x, 20)
+                if title_rect.contains(scene_pos):
+                    # Get current container title or default
+                    current_title = element.container_title if element.container_title else f"{element.label}"
+                    # Edit container title
+                    text, ok = QInputDialog.getText(self, "Container Title", "Enter container name:", 
+                                                QLineEdit.Normal, current_title)
+                    if ok:
+                        element.container_title = text
+                        # Title changed, update the D2 code
+                        self.diagram_changed.emit()
+                        self.update()
+                    return
         
-        # Emit signal to update D2 code
-        self.diagram_changed.emit()
-
-
-class DiagramDesigner(QMainWindow):
-    """Main application window"""
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("D2 Diagram Designer")
+        # Double-clicking on a connection to edit its label
+        for connection in self.connections:
+            source_center = QPoint(connection.source.x + connection.source.width//2, 
+                                  connection.source.y + connection.source.height//2)
+            target_center = QPoint(connection.target.x + connection.target.width//2, 
+                                  connection.target.y + connection.target.height//2)
+            
+            # Simple line hit test
+            line_rect = QRect(min(source_center.x(), target_center.x()) - 5,
+                             min(source_center.y(), target_center.y()) - 5,
+                             abs(source_center.x() - target_center.x()) + 10,
+                             abs(source_center.y() - target_center.y()) + 10)
+            
+            if line_rect.contains(event.pos()):
+                # Edit connection label
+                text, ok = QLineEdit.getText(self, "Connection Label", "Enter label:", 
+                                             QLineEdit.Normal, connection.label)
+                if ok:
+                    connection.label = text
+                    # Label changed, update the D2 code
+                    self.diagram_changed.emit()
+                    self.update()
+                break
+    
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
         
-        # Set window flags for a minimal frame
-        self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint)
+        # Only the exposed part of the widget needs repainting
+        exposed_rect = event.rect()
         
-        # Create and set a box icon for the window
-        icon = QIcon()
-        pixmap = QPixmap(32, 32)
-        pixmap.fill(Qt.transparent)
-        painter = QPainter(pixmap)
-        painter.setPen(QPen(QColor(220, 220, 220), 2))
-        painter.setBrush(QBrush(QColor(60, 60, 60)))
-        painter.drawRect(4, 4, 24, 24)
-        painter.end()
-        icon.addPixmap(pixmap)
-        self.setWindowIcon(icon)
+        # Tile the dark background and grid over the exposed area from a cached grid cell
+        # (when the spacing is a whole number of pixels) instead of re-filling and
+        # re-stroking them on every frame. The cell does not depend on the pan, so the
+        # strips scroll() exposes while panning reuse it
+        self.draw_background(painter, exposed_rect)
         
-        # Initialize undo and redo stacks
-        self.undo_stack = []
-        self.redo_stack = []
-        self.max_undo_steps = 20  # Maximum number of undo steps
+        # Exposed area in scene coordinates, grown to cover selection glows and borders,
+        # so anything entirely outside it can be skipped
+        visible_rect = QRectF(
+            (exposed_rect.x() - self.pan_offset.x()) / self.scale_factor,
+            (exposed_rect.y() - self.pan_offset.y()) / self.scale_factor,
+            exposed_rect.width() / self.scale_factor,
+            exposed_rect.height() / self.scale_factor
+        ).adjusted(-10, -10, 10, 10)
         
-        # Apply dark mode to the application
-        self.setup_dark_mode()
-        self.setup_ui()
-    
-    def setup_dark_mode(self):
-        """Apply dark mode styling to the application"""
-        # Set the application style to dark mode
-        app = QApplication.instance()
+        # Apply zoom and pan transformations
+        painter.translate(self.pan_offset)
+        painter.scale(self.scale_factor, self.scale_factor)
         
-        # Set dark palette for the application
-        dark_palette = QPalette()
-        dark_palette.setColor(QPalette.Window, DARK_BG)
-        dark_palette.setColor(QPalette.WindowText, QColor(220, 220, 220))  # Keep UI text light
-        dark_palette.setColor(QPalette.Base, DARK_WIDGET_BG)
-        dark_palette.setColor(QPalette.AlternateBase, DARK_BG)
-        dark_palette.setColor(QPalette.ToolTipBase, DARK_WIDGET_BG)  # Dark background for tooltips
-        dark_palette.setColor(QPalette.ToolTipText, QColor(240, 240, 240))  # White text for tooltips
-        dark_palette.setColor(QPalette.Text, QColor(220, 220, 220))  # Keep input text light
-        dark_palette.setColor(QPalette.Button, DARK_WIDGET_BG)
-        dark_palette.setColor(QPalette.ButtonText, QColor(220, 220, 220))  # Keep button text light
-        dark_palette.setColor(QPalette.BrightText, Qt.red)
-        dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
-        dark_palette.setColor(QPalette.Highlight, DARK_SELECTION)
-        dark_palette.setColor(QPalette.HighlightedText, Qt.white)
+        # Container titles use a bold font one point larger than the painter's; build it
+        # once per paint rather than once per container
+        base_font = painter.font()
+        container_title_font = QFont(base_font)
+        container_title_font.setBold(True)
+        container_title_font.setPointSize(base_font.pointSize() + 1)
         
-        # Apply the palette
-        app.setPalette(dark_palette)
+        # Draw containers first (so they appear behind elements)
+        for element in self.elements:
+            if element.children:
+                # Calculate container bounds (padded)
+                min_x, min_y, max_x, max_y = element.container_bounds()
+                
+                # Create container rectangle
+                container_rect = QRectF(min_x, min_y, max_x - min_x, max_y - min_y)
+                
+                # Skip containers that are entirely off-screen
+                if not container_rect.intersects(visible_rect):
+                    continue
+                
+                # Draw the container with a style similar to regular elements
+                painter.setPen(CONTAINER_PEN)  # Solid line instead of dashed
+                
+                # Use a gradient background for a more polished look
+                gradient = QRadialGradient(
+                    (min_x + max_x) / 2, (min_y + max_y) / 2,  # Center of the container
+                    max((max_x - min_x), (max_y - min_y)) / 2   # Radius
+                )
+                gradient.setColorAt(0, QColor(60, 80, 60, 40))  # Center color (semi-transparent)
+                gradient.setColorAt(1, QColor(50, 70, 50, 60))  # Edge color (slightly more opaque)
+                
+                painter.setBrush(QBrush(gradient))
+                painter.drawRoundedRect(container_rect, 10, 10)  # More rounded corners
+                
+                # Draw a header bar at the top of the container
+                header_height = 30  # Increased height for more space
+                header_rect = QRectF(min_x, min_y, max_x - min_x, header_height)
+                header_gradient = QLinearGradient(min_x, min_y, min_x, min_y + header_height)
+                header_gradient.setColorAt(0, QColor(80, 120, 80, 180))  # Top color
+                header_gradient.setColorAt(1, QColor(60, 100, 60, 150))  # Bottom color
+                
+                painter.setBrush(QBrush(header_gradient))
+                painter.drawRoundedRect(header_rect, 10, 10)
+                
+                # Draw the container title with a better font
+                container_text = element.container_title if element.container_title else f"{element.label} Container"
+                painter.setPen(CONTAINER_TITLE_PEN)
+                
+                # Use a slightly larger font for the title
+                painter.setFont(container_title_font)
+                
+                # Lay the title out once and reuse it until the text or font changes
+                key = (container_text, container_title_font)
+                if element._title_text is None or element._title_text[0] != key:
+                    element._title_text = (key, make_static_text(container_text, container_title_font))
+                static_text = element._title_text[1]
+                
+                # Left-align the text in the header, centered vertically, clipped to the
+                # header like drawText into a rect would clip it
+                painter.save()
+                painter.setClipRect(QRectF(min_x + 10, min_y, max_x - min_x - 20, header_height))
+                painter.drawStaticText(
+                    QPointF(min_x + 10, min_y + (header_height - static_text.size().height()) / 2),
+                    static_text)
+                painter.restore()
+                
+                # Restore the original font
+                painter.setFont(base_font)
         
-        # Set stylesheet for additional customization
-        QApplication.setStyle("Fusion")  # Use Fusion style for better dark mode support
+        # Selection lookups as sets, built once per paint, so the loops below stay linear
+        # even when a rubber band has selected most of the diagram
+        selected_elements = set(self.selected_elements)
+        selected_connections = set(self.selected_connections)
         
-        # Apply stylesheet for scrollbars and other elements
-        app.setStyleSheet("""
-            /* Custom window frame styling */
-            QMainWindow {
-                border: 1px solid #505050;
-            }
-            
-            /* Title bar styling */
-            QWidget#titleBar {
-                background-color: #2a2a2a;
-                color: #e0e0e0;
-                border-bottom: 1px solid #505050;
-                min-height: 28px;
-                max-height: 28px;
-            }
+        # Draw all connections
+        for connection in self.connections:
+            # Skip unlabelled connections whose bounding box is entirely off-screen
+            if not connection.label:
+                source, target = connection.source, connection.target
+                connection_rect = QRectF(source.x, source.y, source.width, source.height).united(
+                    QRectF(target.x, target.y, target.width, target.height))
+                if not connection_rect.intersects(visible_rect):
+                    continue
             
-            /* Improved scrollbar styling */
-            QScrollBar:vertical {
-                background: #2a2a2a;
-                width: 10px;
-                margin: 0px;
-                border-radius: 5px;
-            }
-            QScrollBar::handle:vertical {
-                background: #505050;
-                min-height: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::handle:vertical:hover {
-                background: #606060;
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-                height: 0px;
-            }
-            QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical {
-                background: none;
-            }
+            # Selection lives only in the canvas list; pass it in rather than mirroring it
+            # onto each connection
+            connection.draw(painter, connection in selected_connections)
+        
+        # Draw all elements (on top of connections and containers)
+        zooming = self.zoom_settle_timer.isActive()
+        for element in self.elements:
+            # Skip elements outside the exposed area
+            if not visible_rect.intersects(QRectF(element.x, element.y, element.width, element.height)):
+                continue
             
-            QScrollBar:horizontal {
-                background: #2a2a2a;
-                height: 10px;
-                margin: 0px;
-                border-radius: 5px;
-            }
-            QScrollBar::handle:horizontal {
-                background: #505050;
-                min-width: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::handle:horizontal:hover {
-                background: #606060;
-            }
-            QScrollBar::add-line:horizontal, QScrollBar::sub-line:horizontal {
-                width: 0px;
-            }
-            QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
-                background: none;
-            }
+            element.paint_cached(painter, self.scale_factor, resample=zooming)
             
-            QToolBar {
-                background-color: #2d2d2d;
-                border-bottom: 1px solid #3c3c3c;
-            }
-            QToolButton {
-                background-color: #3c3c3c;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-                padding: 4px;
-            }
-            QToolButton:hover {
-                background-color: #505050;
-            }
-            QSplitter::handle {
-                background-color: #3c3c3c;
-            }
-            QMainWindow::separator {
-                background-color: #3c3c3c;
-                width: 1px;
-                height: 1px;
-            }
-            QToolTip {
-                background-color: #3d3d3d;
-                color: #ffffff;
-                border: 1px solid #505050;
-                padding: 2px;
-            }
-            QMenu {
-                background-color: #2d2d2d;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-            }
-            QMenu::item:selected {
-                background-color: #3a6ea5;
-            }
-        """)
-    
-    def setup_ui(self):
-        # Create the central widget
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
+            # Draw highlight for selected elements
+            if element in selected_elements:
+                # Create a glowing highlight effect around selected elements
+                highlight_rect = QRectF(element.x - 5, element.y - 5, 
+                                     element.width + 10, element.height + 10)
+                
+                # Use a solid line with a bright color for the highlight (70% opacity)
+                painter.setPen(HIGHLIGHT_PEN)
+                painter.setBrush(Qt.NoBrush)
+                
+                # Draw rounded rectangle for the highlight
+                painter.drawRoundedRect(highlight_rect, 8, 8)
+                
+                # Add a second, outer glow effect (70% opacity)
+                outer_glow_rect = QRectF(element.x - 8, element.y - 8, 
+                                     element.width + 16, element.height + 16)
+                painter.setPen(HIGHLIGHT_GLOW_PEN)
+                painter.drawRoundedRect(outer_glow_rect, 10, 10)
+                
+                # If this is a container, draw a small indicator
+                if element.children:
+                    indicator_rect = QRectF(element.x - 5, element.y - 5, 10, 10)
+                    painter.setPen(CONTAINER_INDICATOR_COLOR)
+                    painter.setBrush(CONTAINER_INDICATOR_COLOR)
+                    painter.drawRect(indicator_rect)
         
-        # Create main layout
-        main_layout = QVBoxLayout(central_widget)
-        main_layout.setContentsMargins(5, 2, 5, 5)  # Reduce margins
-        main_layout.setSpacing(2)  # Reduce spacing between widgets
+        # Current mouse position for the preview lines, from the last mouse event rather than
+        # a global cursor query per paint; mapped here so it follows zoom and pan changes
+        current_point = self.transform_point_to_scene(self.last_mouse_widget_pos)
         
-        # Add custom title bar
-        title_bar = QWidget()
-        title_bar.setObjectName("titleBar")
-        title_bar_layout = QHBoxLayout(title_bar)
-        title_bar_layout.setContentsMargins(5, 0, 5, 0)
+        # Draw temporary connection line if creating a connection
+        if self.creating_connection and self.connection_source:
+            # Get the start point (center of the start element)
+            start_x = self.connection_source.x + self.connection_source.width / 2
+            start_y = self.connection_source.y + self.connection_source.height / 2
+            start_point = QPoint(int(start_x), int(start_y))
+            
+            # Draw a dashed line
+            painter.setPen(CONNECTION_PREVIEW_PEN)
+            painter.drawLine(start_point, current_point)
         
-        # Add window icon to title bar
-        icon_label = QLabel()
-        icon_pixmap = QPixmap(16, 16)
-        icon_pixmap.fill(Qt.transparent)
-        painter = QPainter(icon_pixmap)
-        painter.setPen(QPen(QColor(220, 220, 220), 1))
-        painter.setBrush(QBrush(QColor(60, 60, 60)))
-        painter.drawRect(2, 2, 12, 12)
-        painter.end()
-        icon_label.setPixmap(icon_pixmap)
-        title_bar_layout.addWidget(icon_label)
+        # Draw temporary nesting line if creating a nesting relationship
+        if self.creating_nesting and self.nesting_parent:
+            # Get the start point (center of the parent element)
+            start_x = self.nesting_parent.x + self.nesting_parent.width / 2
+            start_y = self.nesting_parent.y + self.nesting_parent.height / 2
+            start_point = QPoint(int(start_x), int(start_y))
+            
+            # Draw a dashed line with a different color
+            painter.setPen(NESTING_PREVIEW_PEN)
+            painter.drawLine(start_point, current_point)
         
-        # Add title to title bar
-        title_label = QLabel("D2 Diagram Designer")
-        title_label.setStyleSheet("color: #e0e0e0; font-size: 12px;")
-        title_bar_layout.addWidget(title_label)
-        title_bar_layout.addStretch()
+        # Draw cutting line if in cutting mode
+        if self.cutting and self.cut_start and self.cut_current:
+            painter.setPen(CUT_LINE_PEN)
+            painter.drawLine(self.cut_start, self.cut_current)
         
-        # Add minimize, maximize, and close buttons
-        min_button = QPushButton("—")
-        min_button.setFixedSize(24, 24)
-        min_button.setStyleSheet("""
-            QPushButton {
-                background-color: transparent;
-                color: #e0e0e0;
-                border: none;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #505050;
-            }
-        """)
-        min_button.clicked.connect(self.showMinimized)
+        # Draw selection rectangle if selecting
+        if self.selecting and self.selection_rect is not None:
+            # Transform the selection rectangle to account for zoom and pan
+            transformed_rect = QRect(
+                self.transform_point_from_scene(QPoint(self.selection_rect.left(), self.selection_rect.top())),
+                self.transform_point_from_scene(QPoint(self.selection_rect.right(), self.selection_rect.bottom()))
+            ).normalized()
+            
+            # Draw the selection rectangle
+            painter.setPen(RUBBER_BAND_PEN)
+            painter.setBrush(RUBBER_BAND_COLOR)
+            painter.drawRect(transformed_rect)
+    
+    def _grid_metrics(self):
+        """Return (screen_grid_size, offset_x, offset_y) for the current zoom and pan"""
+        # Calculate the grid size in screen coordinates
+        base_grid_size = 20
+        screen_grid_size = base_grid_size * self.scale_factor
         
-        max_button = QPushButton("□")
-        max_button.setFixedSize(24, 24)
-        max_button.setStyleSheet("""
-            QPushButton {
-                background-color: transparent;
-                color: #e0e0e0;
-                border: none;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #505050;
-            }
-        """)
-        max_button.clicked.connect(self.toggle_maximize)
+        # Adjust grid size based on zoom level for better visibility
+        if self.scale_factor < 0.5:
+            screen_grid_size = base_grid_size * self.scale_factor * 2
+        elif self.scale_factor > 2:
+            screen_grid_size = base_grid_size * self.scale_factor / 2
         
-        close_button = QPushButton("×")
-        close_button.setFixedSize(24, 24)
-        close_button.setStyleSheet("""
-            QPushButton {
-                background-color: transparent;
-                color: #e0e0e0;
-                border: none;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #e04040;
-                color: white;
-            }
-        """)
-        close_button.clicked.connect(self.close)
+        # Ensure grid size is at least 10 pixels and at most 50 pixels
+        screen_grid_size = max(10, min(50, screen_grid_size))
         
-        title_bar_layout.addWidget(min_button)
-        title_bar_layout.addWidget(max_button)
-        title_bar_layout.addWidget(close_button)
+        # Calculate offset for grid alignment based on pan
+        offset_x = self.pan_offset.x() % screen_grid_size
+        offset_y = self.pan_offset.y() % screen_grid_size
+        return screen_grid_size, offset_x, offset_y
+    
+    def _grid_tile(self, screen_grid_size):
+        """Return one grid cell (fill plus its top and left grid lines) as a pixmap,
+        repainted only when the grid spacing or the device pixel ratio changes.
+        Returns None when the cell is not a whole number of logical and device pixels,
+        since such a tile would not repeat at exactly the grid spacing"""
+        ratio = self.devicePixelRatioF()
+        device_size = screen_grid_size * ratio
+        if screen_grid_size != int(screen_grid_size) or abs(device_size - round(device_size)) > 1e-6:
+            return None
+        screen_grid_size = int(screen_grid_size)
+        key = (screen_grid_size, ratio)
+        if self.background_cache is None or self.background_cache[0] != key:
+            tile = QPixmap(round(device_size), round(device_size))
+            tile.setDevicePixelRatio(ratio)
+            tile.fill(CANVAS_BG_COLOR)
+            painter = QPainter(tile)
+            painter.setPen(GRID_PEN)
+            painter.drawLine(0, 0, screen_grid_size, 0)
+            painter.drawLine(0, 0, 0, screen_grid_size)
+            painter.end()
+            self.background_cache = (key, tile)
+        return self.background_cache[1]
+    
+    def draw_background(self, painter, exposed_rect):
+        """Fill the exposed area with the dark background and the grid"""
+        screen_grid_size, offset_x, offset_y = self._grid_metrics()
+        tile = self._grid_tile(screen_grid_size)
+        
+        if tile is not None:
+            # The offset is the point of the tile drawn at the exposed rect's top-left corner,
+            # so grid lines land at offset_x + i * screen_grid_size however the rect is placed
+            size = int(screen_grid_size)
+            painter.drawTiledPixmap(exposed_rect, tile,
+                                    QPoint(int(exposed_rect.x() - offset_x) % size,
+                                           int(exposed_rect.y() - offset_y) % size))
+            return
         
-        # Make title bar draggable
-        title_bar.mousePressEvent = self.title_bar_mouse_press
-        title_bar.mouseMoveEvent = self.title_bar_mouse_move
+        # Fractional spacing: fill and stroke the exposed area directly so the lines stay
+        # on scene multiples of the base grid size
+        painter.fillRect(exposed_rect, CANVAS_BG_COLOR)
+        self.draw_grid(painter, exposed_rect, screen_grid_size, offset_x, offset_y)
+    
+    def draw_grid(self, painter, exposed_rect, screen_grid_size, offset_x, offset_y):
+        # Draw a light grid with dark mode colors, crisp like the cached grid cell
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setPen(GRID_PEN)
+        
+        left = exposed_rect.left()
+        top = exposed_rect.top()
+        right = exposed_rect.right() + 1
+        bottom = exposed_rect.bottom() + 1
+        
+        # Draw vertical grid lines, starting from the first one that can reach the exposed area.
+        # Positions are computed from the line index so partial repaints line up exactly
+        i = max(0, int((left - offset_x) // screen_grid_size))
+        x = offset_x + i * screen_grid_size
+        while x < right:
+            painter.drawLine(int(x), top, int(x), bottom)
+            i += 1
+            x = offset_x + i * screen_grid_size
         
-        main_layout.addWidget(title_bar)
+        # Draw horizontal grid lines
+        i = max(0, int((top - offset_y) // screen_grid_size))
+        y = offset_y + i * screen_grid_size
+        while y < bottom:
+            painter.drawLine(left, int(y), right, int(y))
+            i += 1
+            y = offset_y + i * screen_grid_size
         
-        # Add keyboard shortcuts
-        undo_shortcut = QShortcut(QKeySequence("Ctrl+Z"), self)
-        undo_shortcut.activated.connect(lambda: print("Ctrl+Z shortcut activated") or self.undo_action())
+        painter.restore()
+    
+    def generate_d2_code(self):
+        """Generate D2 code from the current diagram"""
+        # This runs after every diagram change, so the per-item dumps are only built
+        # when debug logging is actually enabled
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Generate D2 code - Elements: %d, Connections: %d", len(self.elements), len(self.connections))
+            
+            # Debug output for all elements
+            for i, element in enumerate(self.elements):
+                logger.debug("  Element %d: %s, Label: %r, Pos: (%s, %s)", i, element.__class__.__name__, element.label, element.x, element.y)
+            
+            # Debug output for all connections
+            for i, connection in enumerate(self.connections):
+                logger.debug("  Connection %d: %s -> %s", i, connection.source.label, connection.target.label)
         
-        redo_shortcut = QShortcut(QKeySequence("Ctrl+Y"), self)
-        redo_shortcut.activated.connect(lambda: print("Ctrl+Y shortcut activated") or self.redo_action())
+        # If no elements, show instructions
+        if len(self.elements) == 0:
+            return "# Create a diagram by dragging elements from the top panel\n# Right-click between elements to create connections"
         
-        # Create splitter for canvas and code panel
-        content_splitter = QSplitter(Qt.Horizontal)
+        # Generate D2 code
+        code_parts = []
         
-        # Middle panel (canvas)
-        self.canvas = DiagramCanvas()
+        # Track elements that have been added to the D2 code
+        added_elements = set()
         
-        # Set status tip for the canvas
-        self.canvas.setStatusTip("Hold Alt + Left Click and drag to cut connections. Right-click to create connections between elements.")
+        # Add only top-level elements (elements that are not children of other elements)
+        for element in self.elements:
+            # Skip elements that are children of other elements
+            if element.parent is not None:
+                if debug:
+                    logger.debug("  Skipping child element: %s (parent: %s)", element.label, element.parent.label)
+                continue
+                
+            try:
+                element_code = element.to_d2()
+                code_parts.append(element_code)
+                added_elements.add(element.label)
+                if debug:
+                    logger.debug("  Added element code: %s", element_code)
+            except Exception:
+                logger.exception("Error generating D2 code for element %s", element.label)
         
-        # Right panel (D2 code)
-        code_panel = QWidget()
-        code_layout = QVBoxLayout(code_panel)
-        code_layout.setContentsMargins(5, 0, 5, 5)  # Remove top margin to extend to top of window
+        # Add all connections
+        for connection in self.connections:
+            try:
+                # Check if both source and target elements are already added
+                if connection.source.label not in added_elements:
+                    source_code = connection.source.to_d2()
+                    code_parts.append(source_code)
+                    added_elements.add(connection.source.label)
+                    if debug:
+                        logger.debug("  Added source element code: %s", source_code)
+                
+                if connection.target.label not in added_elements:
+                    target_code = connection.target.to_d2()
+                    code_parts.append(target_code)
+                    added_elements.add(connection.target.label)
+                    if debug:
+                        logger.debug("  Added target element code: %s", target_code)
+                
+                connection_code = connection.to_d2()
+                code_parts.append(connection_code)
+                if debug:
+                    logger.debug("  Added connection code: %s", connection_code)
+            except Exception:
+                logger.exception("Error generating D2 code for connection")
         
-        # Create the code edit
-        self.code_edit = QTextEdit()
-        self.code_edit.setReadOnly(False)  # Make the code panel editable
-        self.code_edit.setFont(QFont("Courier New", 10))
-        self.code_edit.setMinimumWidth(300)  # Ensure code panel has minimum width
-        self.code_edit.setStyleSheet("background-color: #2d2d2d; color: #e0e0e0; border: 1px solid #3c3c3c;")
+        # Join all code parts
+        result = "\n".join(code_parts)
         
-        # Connect the textChanged signal to update the diagram
-        self.code_edit.textChanged.connect(self.on_code_changed)
+        if debug:
+            logger.debug("Final D2 code (%d parts):\n%s", len(code_parts), result)
         
-        code_layout.addWidget(self.code_edit)
+        return result
+    
+    def delete_selected(self):
+        """Delete the selected elements, their connections and the selected connections"""
+        if not (self.selected_elements or self.selected_connections):
+            return
         
-        # Add copy to clipboard button in a separate layout aligned to the right
-        button_layout = QHBoxLayout()
-        button_layout.addStretch()
+        # Save the current state for undo
+        self.about_to_change.emit()
+        
+        # Sets give O(1) membership tests for the filtering below
+        deleted_elements = set(self.selected_elements)
+        deleted_connections = set(self.selected_connections)
+        
+        for element in deleted_elements:
+            # Remove the element from its parent if it has one
+            self._detach(element)
+            
+            # Detach any children of this element
+            for child in element.children:
+                child.parent = None
+            element.children.clear()
+        
+        # Rebuild the lists in a single pass each instead of calling list.remove() per item,
+        # dropping the selected connections and any connection to/from a deleted element
+        self.connections[:] = [
+            connection for connection in self.connections
+            if connection not in deleted_connections
+            and connection.source not in deleted_elements
+            and connection.target not in deleted_elements
+        ]
+        self.elements[:] = [element for element in self.elements if element not in deleted_elements]
         
-        copy_button = QPushButton("Copy to Clipboard")
-        copy_button.setStyleSheet("""
-            QPushButton {
-                background-color: #505050;
-                color: #e0e0e0;
-                border: 1px solid #646464;
-                border-radius: 4px;
-                padding: 5px 10px;
-            }
-            QPushButton:hover {
-                background-color: #606060;
-            }
-            QPushButton:pressed {
-                background-color: #404040;
-            }
-        """)
-        copy_button.clicked.connect(self.copy_code_to_clipboard)
+        # Clear selection
+        self.selected_elements.clear()
+        self.selected_connections.clear()
         
-        button_layout.addWidget(copy_button)
-        code_layout.addLayout(button_layout)
+        # Emit signal to update D2 code
+        self.diagram_changed.emit()
         
-        # Add panels to splitter
-        content_splitter.addWidget(self.canvas)
-        content_splitter.addWidget(code_panel)
+        # Update the canvas
+        self.update()
+    
+    def keyPressEvent(self, event):
+        # Handle keyboard shortcuts
+        # Delete and X (without Ctrl) both delete the current selection
+        if event.key() == Qt.Key_Delete or (event.key() == Qt.Key_X and not event.modifiers() & Qt.ControlModifier):
+            self.delete_selected()
         
-        # Set initial sizes - make canvas 2/3 and code panel 1/3
-        content_splitter.setSizes([2, 1])
+        # Cancel current operations with Escape key
+        elif event.key() == Qt.Key_Escape:
+            # Cancel connection creation
+            if self.creating_connection:
+                self.creating_connection = False
+                self.connection_source = None
+            
+            # Cancel nesting creation
+            if self.creating_nesting:
+                self.creating_nesting = False
+                self.nesting_parent = None
+                
+            # Cancel cutting mode
+            if self.cutting:
+                self.cutting = False
+                self.cut_start = None
+                self.cut_current = None
+                self.setCursor(Qt.ArrowCursor)
+            
+            # Clear selection, then repaint once for everything above
+            self.selected_elements.clear()
+            self.selected_connections.clear()
+            self.update()
         
-        # Top panel (toolbox) - now horizontal and thinner
-        toolbox = QWidget()
-        toolbox.setMaximumHeight(80)  # Increase the height of the toolbox from 40 to 80
-        toolbox.setStyleSheet("background-color: #3c3c3c;")
+        # Ctrl+D to duplicate selected elements
+        elif event.key() == Qt.Key_D and event.modifiers() & Qt.ControlModifier:
+            if self.selected_elements:
+                # Save the current state for undo
+                self.about_to_change.emit()
+                
+                new_elements = []
+                
+                for element in self.selected_elements:
+                    # Create a new element of the same type
+                    new_element = type(element)(element.x + 20, element.y + 20, element.width, element.height, element.label + " (copy)")
+                    
+                    # Copy properties
+                    new_element.color = QColor(element.color)
+                    new_element.border_color = QColor(element.border_color)
+                    
+                    # Add to canvas
+                    self.elements.append(new_element)
+                    new_elements.append(new_element)
+                
+                # Update selection to the new elements
+                self.selected_elements = new_elements
+                
+                # Emit signal to update D2 code
+                self.diagram_changed.emit()
+                
+                # Update the canvas
+                self.update()
         
-        # Create a horizontal layout for the toolbox
-        toolbox_layout = QHBoxLayout(toolbox)
-        toolbox_layout.setContentsMargins(10, 4, 10, 4)  # Double the margins (from 5,2,5,2 to 10,4,10,4)
-        toolbox_layout.setSpacing(4)  # Double the spacing between items (from 2 to 4)
+        # Ctrl+X to disconnect from parent
+        elif event.key() == Qt.Key_X and event.modifiers() & Qt.ControlModifier:
+            if self.selected_elements:
+                # Save the current state for undo
+                self.about_to_change.emit()
+                
+                # Detach every selected child first, then notify and repaint once
+                detached = False
+                for element in self.selected_elements:
+                    detached |= self._detach(element)
+                
+                if detached:
+                    self.diagram_changed.emit()
+                    self.update()
         
-        # Add toolbox items with icons
-        box_item = ToolboxItem("box", "Box")
-        circle_item = ToolboxItem("circle", "Circle")
-        diamond_item = ToolboxItem("diamond", "Diamond")
-        # triangle_item = ToolboxItem("triangle", "Triangle") - Removed as triangle is not supported in D2
-        hexagon_item = ToolboxItem("hexagon", "Hexagon")
+        # Ctrl+Z/Y/S/O are window shortcuts (DiagramDesigner.SHORTCUTS)
+        else:
+            # Pass the event to the parent class
+            super().keyPressEvent(event)
+    
+    def transform_point_to_scene(self, point):
+        """Transform a point from screen coordinates to scene coordinates"""
+        # Adjust for pan
+        adjusted_point = QPoint(point.x() - self.pan_offset.x(), point.y() - self.pan_offset.y())
+        # Adjust for zoom
+        return QPoint(int(adjusted_point.x() / self.scale_factor), int(adjusted_point.y() / self.scale_factor))
+    
+    def transform_point_from_scene(self, point):
+        """Transform a point from scene coordinates to screen coordinates"""
+        # Adjust for zoom
+        scaled_point = QPoint(int(point.x() * self.scale_factor), int(point.y() * self.scale_factor))
+        # Adjust for pan
+        return QPoint(scaled_point.x() + self.pan_offset.x(), scaled_point.y() + self.pan_offset.y())
+    
+    def wheelEvent(self, event):
+        """Handle mouse wheel events for zooming"""
+        # Store the mouse position in screen coordinates
+        mouse_pos = event.pos()
         
-        # Ensure the toolbox items have a reference to the designer
-        box_item.designer = self
-        circle_item.designer = self
-        diamond_item.designer = self
-        hexagon_item.designer = self
+        # Convert mouse position to scene coordinates before zoom
+        scene_pos = self.transform_point_to_scene(mouse_pos)
         
-        toolbox_layout.addWidget(box_item)
-        toolbox_layout.addWidget(circle_item)
-        toolbox_layout.addWidget(diamond_item)
-        # toolbox_layout.addWidget(triangle_item) - Removed as triangle is not supported in D2
-        toolbox_layout.addWidget(hexagon_item)
+        # Store old scale factor
+        old_scale = self.scale_factor
         
-        # Add a separator
-        separator = QFrame()
-        separator.setFrameShape(QFrame.VLine)
-        separator.setFrameShadow(QFrame.Sunken)
-        separator.setStyleSheet("background-color: #505050;")
-        separator.setMaximumHeight(40)  # Double the separator height (from 20 to 40)
-        toolbox_layout.addWidget(separator)
+        # Calculate zoom factor
+        zoom_factor = 1.15  # Slightly increased for more noticeable zoom
+        if event.angleDelta().y() < 0:
+            # Zoom out
+            self.scale_factor /= zoom_factor
+        else:
+            # Zoom in
+            self.scale_factor *= zoom_factor
         
-        # Add inline properties panel
-        self.properties_panel = InlinePropertiesPanel()
-        self.properties_panel.property_changed.connect(self.on_property_changed)
-        toolbox_layout.addWidget(self.properties_panel)
+        # Clamp scale factor to min/max values
+        self.scale_factor = max(self.min_scale, min(self.max_scale, self.scale_factor))
         
-        # Connect the canvas to the properties panel
-        self.canvas.element_selected.connect(self.show_element_properties)
+        # Already at the zoom limit: nothing moves, so skip the repaint entirely
+        if self.scale_factor == old_scale:
+            event.accept()
+            return
         
-        toolbox_layout.addStretch()
+        # Calculate how the scene point would be positioned after zoom
+        # This is the key to zooming at the mouse position
+        new_screen_x = int(scene_pos.x() * self.scale_factor + self.pan_offset.x())
+        new_screen_y = int(scene_pos.y() * self.scale_factor + self.pan_offset.y())
         
-        # Add New button to the toolbox on the far right
-        new_button = ToolboxItem("new", "New Diagram")
-        new_button.designer = self
-        new_button.createCustomIcon("new")  # This will be overridden below
-        
-        # Create a custom icon for the New button
-        new_icon = QPixmap(40, 40)  # Double size (from 20x20 to 40x40)
-        new_icon.fill(Qt.transparent)
-        painter = QPainter(new_icon)
-        painter.setPen(QPen(QColor(220, 220, 220), 3))  # Double line width (from 2 to 3)
-        painter.drawRect(8, 8, 24, 24)  # Double size (from 4,4,12,12 to 8,8,24,24)
-        painter.drawLine(16, 16, 24, 16)  # Double position
-        painter.drawLine(20, 12, 20, 20)  # Double position
-        painter.end()
+        # Adjust pan offset to keep the point under the cursor fixed
+        delta_x = new_screen_x - mouse_pos.x()
+        delta_y = new_screen_y - mouse_pos.y()
         
-        new_button.setIcon(QIcon(new_icon))
-        new_button.clicked.connect(self.new_diagram)
+        self.pan_offset.setX(self.pan_offset.x() - delta_x)
+        self.pan_offset.setY(self.pan_offset.y() - delta_y)
         
-        # Add save button to the toolbox (now on the right side)
-        save_button = ToolboxItem("save", "Save/Load/Export Diagram")
-        save_button.designer = self
+        # (Re)start the zoom gesture so elements are resampled rather than re-rendered
+        self.zoom_settle_timer.start()
         
-        # Create a custom icon for the Save button
-        save_icon = QPixmap(40, 40)  # Double size (from 20x20 to 40x40)
-        save_icon.fill(Qt.transparent)
-        painter = QPainter(save_icon)
-        painter.setPen(QPen(QColor(220, 220, 220), 3))  # Double line width (from 1.5 to 3)
-        # Draw a floppy disk icon
-        painter.drawRect(6, 6, 28, 28)  # Double size (from 3,3,14,14 to 6,6,28,28)
-        painter.drawRect(24, 6, 10, 10)  # Double size (from 12,3,5,5 to 24,6,10,10)
-        painter.drawLine(12, 20, 28, 20)  # Double position (from 6,10,14,10 to 12,20,28,20)
-        painter.drawLine(12, 26, 28, 26)  # Double position (from 6,13,14,13 to 12,26,28,26)
-        painter.end()
+        # Schedule a repaint; fast wheel scrolling collapses into a single paint
+        self.update()
         
-        save_button.setIcon(QIcon(save_icon))
-        save_button.clicked.connect(self.show_save_load_menu)
+        # Debug print
+        logger.debug("Zoom: %.2f, Pan: (%d, %d)", self.scale_factor, self.pan_offset.x(), self.pan_offset.y())
         
-        # Export button removed - functionality moved to save/load menu
+        # Accept the event to prevent it from being passed to parent widgets
+        event.accept()
+
+    def diagram_bounds(self):
+        """Return (min_x, min_y, max_x, max_y) of all elements in a single pass"""
+        first = self.elements[0]
+        min_x, min_y = first.x, first.y
+        max_x, max_y = first.x + first.width, first.y + first.height
         
-        # Add buttons to the right side of the toolbar
-        toolbox_layout.addWidget(new_button)
-        toolbox_layout.addWidget(save_button)
-        # Export button removed - functionality moved to save/load menu
+        # One loop with plain comparisons instead of four min()/max() generator passes
+        for element in self.elements:
+            if element.x < min_x:
+                min_x = element.x
+            if element.y < min_y:
+                min_y = element.y
+            right = element.x + element.width
+            if right > max_x:
+                max_x = right
+            bottom = element.y + element.height
+            if bottom > max_y:
+                max_y = bottom
         
-        # Add toolbox and content splitter to main layout
-        main_layout.addWidget(toolbox)
-        main_layout.addWidget(content_splitter, 1)  # Give the content splitter a stretch factor
+        return min_x, min_y, max_x, max_y
+    
+    def zoom_to_fit(self):
+        """Zoom to fit the diagram in the canvas"""
+        if not self.elements:
+            # Reset to default view if no elements
+            self.scale_factor = 1.0
+            self.pan_offset = QPoint(0, 0)
+            self.update()
+            return
+            
+        # Find the bounding box of all elements
+        min_x, min_y, max_x, max_y = self.diagram_bounds()
         
-        # IMPORTANT: Connect the signal to update D2 code
-        self.canvas.diagram_changed.connect(self.update_d2_code)
-        print("Connected diagram_changed signal to update_d2_code slot")
+        # Add padding (10% on each side)
+        padding_x = (max_x - min_x) * 0.1
+        padding_y = (max_y - min_y) * 0.1
+        min_x -= padding_x
+        max_x += padding_x
+        min_y -= padding_y
+        max_y += padding_y
         
-        # Force an initial update of the D2 code panel
-        QTimer.singleShot(100, self.update_d2_code)
+        # Calculate dimensions
+        width = max_x - min_x
+        height = max_y - min_y
         
-        # Set the central widget
-        self.setCentralWidget(central_widget)
+        if width <= 0 or height <= 0:
+            return
+            
+        # Calculate scale factor to fit the diagram
+        scale_x = self.width() / width
+        scale_y = self.height() / height
+        self.scale_factor = min(scale_x, scale_y, self.max_scale)  # Limit maximum zoom
         
-        # Set window size
-        self.resize(1200, 800)
-    
-    def show_element_properties(self, element):
-        """Show the properties panel for the selected element"""
-        # Make sure the properties panel has a reference to the canvas
-        self.properties_panel.canvas = self.canvas
-        self.properties_panel.set_element(element)
-    
-    def on_property_changed(self):
-        """Update the D2 code when properties change"""
-        self.update_d2_code()
-    
-    def update_d2_code(self):
-        """Update the D2 code panel with the current diagram"""
-        print("UPDATE_D2_CODE called - Canvas has", len(self.canvas.elements), "elements")
+        # Calculate pan offset to center the diagram
+        center_x = (min_x + max_x) / 2
+        center_y = (min_y + max_y) / 2
         
-        # We don't need to save state here as it's already saved when elements are added/modified
-        # self.save_state()
+        viewport_center_x = self.width() / 2
+        viewport_center_y = self.height() / 2
         
-        # Generate D2 code from the diagram
-        d2_code = self.canvas.generate_d2_code()
+        self.pan_offset.setX(int(viewport_center_x - center_x * self.scale_factor))
+        self.pan_offset.setY(int(viewport_center_y - center_y * self.scale_factor))
         
-        # Temporarily disconnect the textChanged signal to avoid recursion
-        self.code_edit.textChanged.disconnect(self.on_code_changed)
+        self.update()
+        logger.debug("Zoom to fit: scale=%s, pan=(%d, %d)", self.scale_factor, self.pan_offset.x(), self.pan_offset.y())
+
+    def find_intersected_connections(self, start_point, end_point):
+        """Find connections that intersect with the line from start_point to end_point"""
+        intersected_connections = []
         
-        # Update the code panel
-        self.code_edit.setPlainText(d2_code)
+        for connection in self.connections:
+            # Get the source and target points of the connection
+            source_center = QPoint(
+                int(connection.source.x + connection.source.width / 2),
+                int(connection.source.y + connection.source.height / 2)
+            )
+            target_center = QPoint(
+                int(connection.target.x + connection.target.width / 2),
+                int(connection.target.y + connection.target.height / 2)
+            )
+            
+            # Find the actual connection points (where the arrow intersects with the elements)
+            source_point = connection._find_intersection_point(connection.source, target_center, source_center)
+            target_point = connection._find_intersection_point(connection.target, source_center, target_center)
+            
+            # Check if the cutting line intersects with the connection line
+            if self._lines_intersect(start_point, end_point, source_point, target_point):
+                intersected_connections.append(connection)
+                logger.debug("Connection intersected: %s -> %s", connection.source.label, connection.target.label)
         
-        # Reconnect the textChanged signal
-        self.code_edit.textChanged.connect(self.on_code_changed)
+        return intersected_connections
         
-        # Print a sample of the code for debugging
-        print("Code panel updated. Text length:", len(d2_code))
-        if d2_code:
-            print("Code panel text sample:", d2_code.split('\n')[0])
-            if len(d2_code.split('\n')) > 1:
-                print(d2_code.split('\n')[1])
-    
-    def on_code_changed(self):
-        """Handle changes to the D2 code panel"""
-        # This is a placeholder for future implementation
-        # In a full implementation, this would parse the D2 code and update the diagram
-        # For now, we'll just print a message
-        print("Code panel changed - This feature is not fully implemented yet")
+    def _lines_intersect(self, p1, p2, p3, p4):
+        """Check if two line segments (p1-p2 and p3-p4) intersect"""
+        # Convert QPoint to coordinates
+        x1, y1 = p1.x(), p1.y()
+        x2, y2 = p2.x(), p2.y()
+        x3, y3 = p3.x(), p3.y()
+        x4, y4 = p4.x(), p4.y()
         
-        # In a future version, we could implement a D2 parser to update the diagram
-        # based on the code, but that's beyond the scope of this current implementation
-    
-    def new_diagram(self):
-        """Clear the current diagram"""
-        self.canvas.elements.clear()
-        self.canvas.connections.clear()
-        self.canvas.selected_elements.clear()
-        self.canvas.selected_connections.clear()
-        self.properties_panel.set_element(None)  # Hide the properties panel
-        self.canvas.update()
-        self.update_d2_code()
+        # Calculate the direction vectors
+        dx1 = x2 - x1
+        dy1 = y2 - y1
+        dx2 = x4 - x3
+        dy2 = y4 - y3
         
-    def showEvent(self, event):
-        """Called when the window is shown"""
-        super().showEvent(event)
-        # Force an update of the D2 code when the window is shown
-        QTimer.singleShot(500, self.update_d2_code)
+        # Calculate the determinant
+        det = dx1 * dy2 - dy1 * dx2
         
-        # Apply dark mode to the window title bar
-        if hasattr(self, 'winId'):
-            try:
-                hwnd = int(self.winId())
-                set_window_dark_mode(hwnd)
-            except Exception as e:
-                print(f"Failed to set dark mode for title bar: {e}")
-    
-    def copy_code_to_clipboard(self):
-        """Copy the D2 code to the clipboard"""
-        clipboard = QApplication.clipboard()
-        clipboard.setText(self.code_edit.toPlainText())
-        print("D2 code copied to clipboard")
-    
-    def save_diagram(self):
-        """Save the diagram to a file"""
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Diagram", "", "D2 Files (*.d2)")
-        if file_path:
-            # Save the current state for undo
-            self.save_state()
-            
-            # If the user didn't add .d2 extension, add it
-            if not file_path.lower().endswith('.d2'):
-                file_path += '.d2'
-                
-            # Get the D2 code
-            d2_code = self.code_edit.toPlainText()
-            
-            # Write the D2 code to the file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(d2_code)
+        # If determinant is zero, lines are parallel
+        if abs(det) < 1e-10:
+            return False
             
-            QMessageBox.information(self, "Save Successful", f"Diagram saved to {file_path}")
-    
-    def load_diagram(self):
-        """Load a diagram from a .d2 file"""
-        file_path, _ = QFileDialog.getOpenFileName(self, "Load Diagram", "", "D2 Files (*.d2)")
-        if file_path:
-            try:
-                # Read the D2 code from the file
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    d2_code = f.read()
-                
-                # Save the current state for undo
-                self.save_state()
-                
-                # Clear the current diagram
-                self.canvas.elements.clear()
-                self.canvas.connections.clear()
-                self.canvas.selected_elements.clear()
-                self.canvas.selected_connections.clear()
-                
-                # Update the code panel with the loaded code
-                self.code_edit.setPlainText(d2_code)
+        # Calculate parameters for the intersection point
+        t1 = ((x3 - x1) * dy2 - (y3 - y1) * dx2) / det
+        t2 = ((x3 - x1) * dy1 - (y3 - y1) * dx1) / det
+        
+        # Check if the intersection point is within both line segments
+        return 0 <= t1 <= 1 and 0 <= t2 <= 1
+
+    def push_away_elements(self, resized_element, original_width, original_height):
+        """
+        Push away elements that would overlap with the resized element.
+        
+        Args:
+            resized_element: The element that was resized
+            original_width: The original width of the element before resizing
+            original_height: The original height of the element before resizing
+        """
+        # Calculate how much the element has grown in each direction
+        width_increase = resized_element.width - original_width
+        height_increase = resized_element.height - original_height
+        
+        # If the element didn't grow, no need to push anything
+        if width_increase <= 0 and height_increase <= 0:
+            return
+        
+        # Elements that may overlap the resized one: itself, its children and its parent.
+        # Kept in a set so each check below is O(1) instead of scanning the children list
+        exempt = set(resized_element.children)
+        exempt.add(resized_element)
+        if resized_element.parent:
+            exempt.add(resized_element.parent)
+        
+        # Check each element for potential overlap
+        for element in self.elements:
+            # Skip the resized element itself, its children and its parent
+            if element in exempt:
+                continue
                 
-                # Parse the D2 code and create visual elements
-                self.parse_d2_code(d2_code)
+            # Check if the elements now overlap
+            if resized_element.overlaps_with(element, self.ELEMENT_PADDING):
+                # Calculate the center points of both elements
+                resized_center_x = resized_element.x + resized_element.width / 2
+                resized_center_y = resized_element.y + resized_element.height / 2
+                element_center_x = element.x + element.width / 2
+                element_center_y = element.y + element.height / 2
                 
-                # Update the canvas
-                self.canvas.update()
+                # Calculate the direction vector from resized element to the other element
+                dx = element_center_x - resized_center_x
+                dy = element_center_y - resized_center_y
                 
-                QMessageBox.information(self, "Load Successful", f"Diagram loaded from {file_path}")
+                # Normalize the direction vector if it's not zero
+                length = (dx**2 + dy**2)**0.5
+                if length < 0.001:  # Avoid division by zero
+                    # If centers are too close, push directly to the right
+                    dx, dy = 1, 0
+                else:
+                    dx /= length
+                    dy /= length
                 
-            except Exception as e:
-                QMessageBox.critical(self, "Load Error", f"Error loading diagram: {str(e)}")
-    
-    def parse_d2_code(self, d2_code):
-        """Parse D2 code and create visual elements"""
-        try:
-            # Split the code into lines and process each line
-            lines = d2_code.split('\n')
-            
-            # Track elements by their names
-            element_map = {}
-            
-            # Track parent-child relationships
-            parent_child_map = {}
-            
-            # Track connections
-            connections = []
-            
-            # Current parent being processed
-            current_parent = None
-            current_parent_name = None
-            
-            # Process each line
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
+                # Calculate the minimum distance needed to push away
+                # This includes the half-widths/heights of both elements plus padding
+                min_dist_x = (resized_element.width + element.width) / 2 + self.ELEMENT_PADDING
+                min_dist_y = (resized_element.height + element.height) / 2 + self.ELEMENT_PADDING
                 
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    i += 1
-                    continue
+                # Calculate the actual distance between centers
+                actual_dist = length
                 
-                # Check for element definitions (e.g., "Box: {")
-                if ':' in line and '{' in line:
-                    # Extract element name
-                    element_name = line.split(':', 1)[0].strip()
-                    
-                    # Check if this is a child element (indented)
-                    is_child = False
-                    if current_parent and lines[i].startswith('  '):
-                        is_child = True
-                    
-                    # Default properties
-                    shape_type = "box"  # Default shape
-                    label = element_name
-                    x = 100 + len(element_map) * 50  # Stagger elements
-                    y = 100 + len(element_map) * 30
-                    width = 100
-                    height = 60
-                    color = QColor(180, 180, 180)
-                    
-                    # Look ahead for properties
-                    j = i + 1
-                    while j < len(lines) and not lines[j].strip().endswith('}'):
-                        prop_line = lines[j].strip()
-                        
-                        # Check for shape property
-                        if 'shape:' in prop_line:
-                            shape_value = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
-                            if 'circle' in shape_value:
-                                shape_type = "circle"
-                                width = height = 80  # Circles are typically square
-                            elif 'diamond' in shape_value:
-                                shape_type = "diamond"
-                            elif 'hexagon' in shape_value:
-                                shape_type = "hexagon"
-                        
-                        # Check for label property
-                        elif 'label:' in prop_line:
-                            label = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
-                        
-                        # Check for fill color
-                        elif 'style.fill:' in prop_line:
-                            color_str = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
-                            color = QColor(color_str)
-                        
-                        # Check for position information in comments
-                        elif '# position:' in prop_line:
-                            try:
-                                # Extract position data: x,y,width,height
-                                pos_data = prop_line.split('# position:', 1)[1].strip().split(',')
-                                if len(pos_data) == 4:
-                                    x = int(pos_data[0])
-                                    y = int(pos_data[1])
-                                    width = int(pos_data[2])
-                                    height = int(pos_data[3])
-                                    print(f"Found position data for {element_name}: x={x}, y={y}, width={width}, height={height}")
-                            except Exception as e:
-                                print(f"Error parsing position data: {e}")
-                        
-                        j += 1
-                    
-                    # Create the element based on shape type
-                    new_element = None
-                    if shape_type == "box":
-                        new_element = BoxElement(x, y, width, height, label)
-                    elif shape_type == "circle":
-                        new_element = CircleElement(x, y, width, height, label)
-                    elif shape_type == "diamond":
-                        new_element = DiamondElement(x, y, width, height, label)
-                    elif shape_type == "hexagon":
-                        new_element = HexagonElement(x, y, width, height, label)
-                    
-                    if new_element:
-                        new_element.color = color
-                        
-                        # If position was explicitly specified in the file, use those dimensions
-                        # instead of the auto-calculated ones based on text
-                        position_specified = False
-                        for line_j in range(i + 1, j):
-                            if '# position:' in lines[line_j]:
-                                position_specified = True
-                                break
-                                
-                        if position_specified:
-                            new_element.x = x
-                            new_element.y = y
-                            new_element.width = width
-                            new_element.height = height
-                        
-                        self.canvas.elements.append(new_element)
-                        element_map[element_name] = new_element
-                        
-                        # Handle parent-child relationship
-                        if is_child and current_parent:
-                            parent_child_map.setdefault(current_parent_name, []).append(element_name)
-                    
-                    # Check if this element has children (next line has '{')
-                    if j < len(lines) and '{' in lines[j]:
-                        current_parent = new_element
-                        current_parent_name = element_name
-                    
-                    i = j + 1
-                    continue
+                # Calculate how much to push in each direction
+                # We push more in the direction of the larger component (dx or dy)
+                if abs(dx) > abs(dy):
+                    # Pushing horizontally is preferred
+                    push_x = dx * (min_dist_x - actual_dist * abs(dx)) / abs(dx) if abs(dx) > 0.001 else 0
+                    push_y = 0
+                else:
+                    # Pushing vertically is preferred
+                    push_x = 0
+                    push_y = dy * (min_dist_y - actual_dist * abs(dy)) / abs(dy) if abs(dy) > 0.001 else 0
                 
-                # Check for connections (e.g., "Box -> Circle")
-                if '->' in line:
-                    parts = line.split('->')
-                    if len(parts) == 2:
-                        source_name = parts[0].strip()
-                        
-                        # Extract target name and any label
-                        target_part = parts[1].strip()
-                        
-                        # Remove any comments from the target part
-                        if '#' in target_part:
-                            target_part = target_part.split('#')[0].strip()
-                        
-                        # Extract target name and label
-                        if ':' in target_part:
-                            target_name, label = target_part.split(':', 1)
-                            target_name = target_name.strip()
-                            label = label.strip()
-                        else:
-                            target_name = target_part.split(' ')[0].strip()  # Remove any trailing properties
-                            label = ""
-                        
-                        # Check for connection ID information in comments
-                        source_id = None
-                        target_id = None
-                        if '# connection:' in line:
-                            try:
-                                # Extract connection data: source_id,target_id
-                                conn_data = line.split('# connection:', 1)[1].strip().split(',')
-                                if len(conn_data) == 2:
-                                    source_id = int(conn_data[0])
-                                    target_id = int(conn_data[1])
-                                    print(f"Found connection data: source_id={source_id}, target_id={target_id}")
-                            except Exception as e:
-                                print(f"Error parsing connection data: {e}")
-                        
-                        # Store connection to create later when all elements are processed
-                        connections.append((source_name, target_name, label, source_id, target_id))
+                # Apply the push
+                element.move(int(push_x), int(push_y))
                 
-                i += 1
-            
-            # Process parent-child relationships
-            for parent_name, child_names in parent_child_map.items():
-                parent = element_map.get(parent_name)
-                if parent:
-                    for child_name in child_names:
-                        child = element_map.get(child_name)
-                        if child:
-                            child.parent = parent
-                            parent.children.append(child)
-            
-            # Create connections
-            for source_name, target_name, label, source_id, target_id in connections:
-                source = element_map.get(source_name)
-                target = element_map.get(target_name)
-                if source and target:
-                    # Clean up the label to remove any ID information
-                    clean_label = label
-                    if '#' in clean_label:
-                        clean_label = clean_label.split('#')[0].strip()
-                        
-                    connection = ArrowConnection(source, target, clean_label)
-                    self.canvas.connections.append(connection)
-            
-            # Signal that the diagram has changed
-            self.canvas.diagram_changed.emit()
-            
-        except Exception as e:
-            print(f"Error parsing D2 code: {str(e)}")
-            import traceback
-            traceback.print_exc()
+                # Recursively push away any elements that might now overlap with the pushed element
+                self.push_away_elements(element, element.width, element.height)
+
+    def resize_element(self, element, new_width, new_height):
+        """
+        Resize an element and push away other elements if needed.
+        
+        Args:
+            element: The element to resize
+            new_width: The new width for the element
+            new_height: The new height for the element
+        """
+        # Store original dimensions
+        original_width = element.width
+        original_height = element.height
+        
+        # Resize the element using its resize method to respect minimum text size
+        element.resize(new_width, new_height)
+        
+        # Clicking + at the maximum or - at the text minimum leaves the size as it was;
+        # skip the push-away pass, the repaint and the D2 refresh in that case
+        if element.width == original_width and element.height == original_height:
+            return
+        
+        # Push away other elements if needed
+        self.push_away_elements(element, original_width, original_height)
+        
+        # Update the canvas
+        self.update()
+        
+        # Emit signal to update D2 code
+        self.diagram_changed.emit()
+
+
+class ImageSaveSignals(QObject):
+    """Signals for ImageSaveTask; created on the GUI thread so slots run there"""
+    finished = pyqtSignal(object, str, bool)  # task, file path, success
+
+
+class ImageSaveTask(QRunnable):
+    """Encode and write an already rendered QImage on a worker thread"""
+    def __init__(self, image, file_path, image_format, quality=-1):
+        super().__init__()
+        # The designer keeps a reference until finished fires, so Qt must not delete it
+        self.setAutoDelete(False)
+        self.image = image
+        self.file_path = file_path
+        self.image_format = image_format
+        self.quality = quality
+        self.signals = ImageSaveSignals()
     
-    def arrange_elements(self):
-        """Arrange elements to avoid overlaps"""
-        # Simple arrangement - place elements in a grid
-        grid_size = 150
-        cols = 4  # Number of columns in the grid
+    def run(self):
+        # QImage, unlike QPixmap, can be used off the GUI thread
+        success = self.image.save(self.file_path, self.image_format, self.quality)
+        self.signals.finished.emit(self, self.file_path, success)
+
+
+class DiagramDesigner(QMainWindow):
+    """Main application window"""
+    # Window-wide keyboard shortcuts: key sequence -> method name
+    SHORTCUTS = (
+        ("Ctrl+Z", "undo_action"),
+        ("Ctrl+Y", "redo_action"),
+        ("Ctrl+S", "save_diagram"),
+        ("Ctrl+O", "load_diagram"),
+    )
+    
+    # Export formats: name -> (exporter method, file dialog filter, accepted extensions;
+    # the first is added when the chosen path has none of them)
+    EXPORT_FORMATS = {
+        "SVG": ("export_svg", "SVG Files (*.svg)", (".svg",)),
+        "PNG": ("export_png", "PNG Files (*.png)", (".png",)),
+        "JPEG": ("export_jpeg", "JPEG Files (*.jpg *.jpeg)", (".jpg", ".jpeg")),
+        "HTML": ("export_html", "HTML Files (*.html)", (".html",)),
+    }
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("D2 Diagram Designer")
         
-        # Group elements by their parent
-        grouped_elements = {}
-        root_elements = []
+        # Set window flags for a minimal frame
+        self.setWindowFlags(Qt.Window | Qt.FramelessWindowHint)
         
-        for element in self.canvas.elements:
-            if element.parent:
-                parent_id = id(element.parent)
-                grouped_elements.setdefault(parent_id, []).append(element)
-            else:
-                root_elements.append(element)
+        # Create and set a box icon for the window
+        icon = QIcon()
+        pixmap = QPixmap(32, 32)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(QColor(220, 220, 220), 2))
+        painter.setBrush(QBrush(QColor(60, 60, 60)))
+        painter.drawRect(4, 4, 24, 24)
+        painter.end()
+        icon.addPixmap(pixmap)
+        self.setWindowIcon(icon)
         
-        # Arrange root elements in a grid
-        for i, element in enumerate(root_elements):
-            row = i // cols
-            col = i % cols
-            element.x = 50 + col * grid_size
-            element.y = 50 + row * grid_size
+        # Initialize undo and redo stacks; bounded deques drop the oldest state in O(1)
+        self.max_undo_steps = 20  # Maximum number of undo steps
+        self.undo_stack = deque(maxlen=self.max_undo_steps)
+        self.redo_stack = deque(maxlen=self.max_undo_steps)
         
-        # Arrange child elements around their parents
-        for parent_id, children in grouped_elements.items():
-            parent = next((e for e in self.canvas.elements if id(e) == parent_id), None)
-            if parent:
-                # Arrange children in a circle around the parent
-                radius = max(parent.width, parent.height) + 100
-                angle_step = 2 * math.pi / len(children)
-                
-                for i, child in enumerate(children):
-                    angle = i * angle_step
-                    child.x = parent.x + parent.width/2 + radius * math.cos(angle) - child.width/2
-                    child.y = parent.y + parent.height/2 + radius * math.sin(angle) - child.height/2
+        # Set while a D2 code refresh is queued, so bursts of changes regenerate once
+        self._d2_update_pending = False
         
-        # Update the canvas
-        self.canvas.update()
+        # Same for the properties panel: the last selection reported before it refreshes
+        self._properties_update_pending = False
+        self._pending_properties_element = None
+        
+        # Offset of the cursor from the window corner while dragging the title bar
+        self._drag_pos = None
+        
+        # Image exports still being encoded on the thread pool
+        self._image_save_tasks = set()
+        
+        # Last SVG rendered for each export padding: padding -> (diagram fingerprint, bytes)
+        self._svg_cache = {}
+        
+        # Apply dark mode to the application
+        self.setup_dark_mode()
+        self.setup_ui()
     
-    def show_save_load_menu(self):
-        """Show a popup menu with save, load, and export options"""
-        save_load_menu = QMenu(self)
+    def setup_dark_mode(self):
+        """Apply dark mode styling to the application"""
+        # Set the application style to dark mode
+        app = QApplication.instance()
         
-        # Save option
-        save_action = QAction('Save Diagram', self)
-        save_action.triggered.connect(self.save_diagram)
-        save_load_menu.addAction(save_action)
+        # Set dark palette for the application
+        dark_palette = QPalette()
+        dark_palette.setColor(QPalette.Window, DARK_BG)
+        dark_palette.setColor(QPalette.WindowText, QColor(220, 220, 220))  # Keep UI text light
+        dark_palette.setColor(QPalette.Base, DARK_WIDGET_BG)
+        dark_palette.setColor(QPalette.AlternateBase, DARK_BG)
+        dark_palette.setColor(QPalette.ToolTipBase, DARK_WIDGET_BG)  # Dark background for tooltips
+        dark_palette.setColor(QPalette.ToolTipText, QColor(240, 240, 240))  # White text for tooltips
+        dark_palette.setColor(QPalette.Text, QColor(220, 220, 220))  # Keep input text light
+        dark_palette.setColor(QPalette.Button, DARK_WIDGET_BG)
+        dark_palette.setColor(QPalette.ButtonText, QColor(220, 220, 220))  # Keep button text light
+        dark_palette.setColor(QPalette.BrightText, Qt.red)
+        dark_palette.setColor(QPalette.Link, QColor(42, 130, 218))
+        dark_palette.setColor(QPalette.Highlight, DARK_SELECTION)
+        dark_palette.setColor(QPalette.HighlightedText, Qt.white)
         
-        # Load option
-        load_action = QAction('Load Diagram', self)
-        load_action.triggered.connect(self.load_diagram)
-        save_load_menu.addAction(load_action)
+        # Apply the palette
+        app.setPalette(dark_palette)
+        
+        # Set stylesheet for additional customization
+        QApplication.setStyle("Fusion")  # Use Fusion style for better dark mode support
+        
+        # Apply stylesheet for scrollbars and other elements
+        # The stylesheet is built once at import time; only hand it to Qt (which re-parses
+        # every rule) when the application doesn't already use it
+        if app.styleSheet() != APP_STYLESHEET:
+            app.setStyleSheet(APP_STYLESHEET)
+    
+    def setup_ui(self):
+        # Create the central widget
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        # Create main layout
+        main_layout = QVBoxLayout(central_widget)
+        main_layout.setContentsMargins(5, 2, 5, 5)  # Reduce margins
+        main_layout.setSpacing(2)  # Reduce spacing between widgets
+        
+        # Add custom title bar
+        title_bar = QWidget()
+        title_bar.setObjectName("titleBar")
+        title_bar_layout = QHBoxLayout(title_bar)
+        title_bar_layout.setContentsMargins(5, 0, 5, 0)
+        
+        # Add window icon to title bar
+        icon_label = QLabel()
+        icon_pixmap = QPixmap(16, 16)
+        icon_pixmap.fill(Qt.transparent)
+        painter = QPainter(icon_pixmap)
+        painter.setPen(QPen(QColor(220, 220, 220), 1))
+        painter.setBrush(QBrush(QColor(60, 60, 60)))
+        painter.drawRect(2, 2, 12, 12)
+        painter.end()
+        icon_label.setPixmap(icon_pixmap)
+        title_bar_layout.addWidget(icon_label)
+        
+        # Add title to title bar
+        title_label = QLabel("D2 Diagram Designer")
+        title_label.setStyleSheet("color: #e0e0e0; font-size: 12px;")
+        title_bar_layout.addWidget(title_label)
+        title_bar_layout.addStretch()
+        
+        # Add minimize, maximize, and close buttons (styled by objectName in APP_STYLESHEET)
+        min_button = QPushButton("—")
+        min_button.setObjectName("titleMinButton")
+        min_button.setFixedSize(24, 24)
+        min_button.clicked.connect(self.showMinimized)
+        
+        max_button = QPushButton("□")
+        max_button.setObjectName("titleMaxButton")
+        max_button.setFixedSize(24, 24)
+        max_button.clicked.connect(self.toggle_maximize)
+        
+        close_button = QPushButton("×")
+        close_button.setObjectName("titleCloseButton")
+        close_button.setFixedSize(24, 24)
+        close_button.clicked.connect(self.close)
+        
+        title_bar_layout.addWidget(min_button)
+        title_bar_layout.addWidget(max_button)
+        title_bar_layout.addWidget(close_button)
+        
+        # Make title bar draggable
+        title_bar.mousePressEvent = self.title_bar_mouse_press
+        title_bar.mouseMoveEvent = self.title_bar_mouse_move
+        
+        main_layout.addWidget(title_bar)
+        
+        # Add keyboard shortcuts
+        for keys, method in self.SHORTCUTS:
+            shortcut = QShortcut(QKeySequence(keys), self)
+            shortcut.activated.connect(getattr(self, method))
+        
+        # Create splitter for canvas and code panel
+        content_splitter = QSplitter(Qt.Horizontal)
+        
+        # Middle panel (canvas)
+        self.canvas = DiagramCanvas()
+        
+        # Set status tip for the canvas
+        self.canvas.setStatusTip("Hold Alt + Left Click and drag to cut connections. Right-click to create connections between elements.")
+        
+        # Right panel (D2 code)
+        code_panel = QWidget()
+        code_layout = QVBoxLayout(code_panel)
+        code_layout.setContentsMargins(5, 0, 5, 5)  # Remove top margin to extend to top of window
+        
+        # Create the code edit
+        self.code_edit = QTextEdit()
+        self.code_edit.setReadOnly(False)  # Make the code panel editable
+        self.code_edit.setFont(QFont("Courier New", 10))
+        self.code_edit.setMinimumWidth(300)  # Ensure code panel has minimum width
+        self.code_edit.setStyleSheet("background-color: #2d2d2d; color: #e0e0e0; border: 1px solid #3c3c3c;")
+        
+        # Connect the textChanged signal to update the diagram
+        self.code_edit.textChanged.connect(self.on_code_changed)
+        
+        code_layout.addWidget(self.code_edit)
+        
+        # Add copy to clipboard button in a separate layout aligned to the right
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        
+        copy_button = QPushButton("Copy to Clipboard")
+        copy_button.setStyleSheet("""
+            QPushButton {
+                background-color: #505050;
+                color: #e0e0e0;
+                border: 1px solid #646464;
+                border-radius: 4px;
+                padding: 5px 10px;
+            }
+            QPushButton:hover {
+                background-color: #606060;
+            }
+            QPushButton:pressed {
+                background-color: #404040;
+            }
+        """)
+        copy_button.clicked.connect(self.copy_code_to_clipboard)
+        
+        button_layout.addWidget(copy_button)
+        code_layout.addLayout(button_layout)
+        
+        # Add panels to splitter
+        content_splitter.addWidget(self.canvas)
+        content_splitter.addWidget(code_panel)
+        
+        # Set initial sizes - make canvas 2/3 and code panel 1/3
+        content_splitter.setSizes([2, 1])
+        
+        # Top panel (toolbox) - now horizontal and thinner
+        toolbox = QWidget()
+        toolbox.setMaximumHeight(80)  # Increase the height of the toolbox from 40 to 80
+        toolbox.setStyleSheet("background-color: #3c3c3c;")
+        
+        # Create a horizontal layout for the toolbox
+        toolbox_layout = QHBoxLayout(toolbox)
+        toolbox_layout.setContentsMargins(10, 4, 10, 4)  # Double the margins (from 5,2,5,2 to 10,4,10,4)
+        toolbox_layout.setSpacing(4)  # Double the spacing between items (from 2 to 4)
+        
+        # Add toolbox items with icons
+        box_item = ToolboxItem("box", "Box")
+        circle_item = ToolboxItem("circle", "Circle")
+        diamond_item = ToolboxItem("diamond", "Diamond")
+        # triangle_item = ToolboxItem("triangle", "Triangle") - Removed as triangle is not supported in D2
+        hexagon_item = ToolboxItem("hexagon", "Hexagon")
+        
+        # Ensure the toolbox items have a reference to the designer
+        box_item.designer = self
+        circle_item.designer = self
+        diamond_item.designer = self
+        hexagon_item.designer = self
+        
+        toolbox_layout.addWidget(box_item)
+        toolbox_layout.addWidget(circle_item)
+        toolbox_layout.addWidget(diamond_item)
+        # toolbox_layout.addWidget(triangle_item) - Removed as triangle is not supported in D2
+        toolbox_layout.addWidget(hexagon_item)
+        
+        # Add a separator
+        separator = QFrame()
+        separator.setFrameShape(QFrame.VLine)
+        separator.setFrameShadow(QFrame.Sunken)
+        separator.setStyleSheet("background-color: #505050;")
+        separator.setMaximumHeight(40)  # Double the separator height (from 20 to 40)
+        toolbox_layout.addWidget(separator)
+        
+        # Add inline properties panel
+        self.properties_panel = InlinePropertiesPanel()
+        self.properties_panel.canvas = self.canvas  # Stored once instead of looked up per selection
+        self.properties_panel.property_changed.connect(self.on_property_changed)
+        toolbox_layout.addWidget(self.properties_panel)
+        
+        # Connect the canvas to the properties panel
+        self.canvas.element_selected.connect(self.show_element_properties)
+        
+        toolbox_layout.addStretch()
+        
+        # Add New button to the toolbox on the far right
+        new_button = ToolboxItem("new", "New Diagram")
+        new_button.designer = self
+        new_button.clicked.connect(self.new_diagram)
+        
+        # Add save button to the toolbox (now on the right side)
+        save_button = ToolboxItem("save", "Save/Load/Export Diagram")
+        save_button.designer = self
+        save_button.clicked.connect(self.show_save_load_menu)
         
-        # Add a separator
-        save_load_menu.addSeparator()
+        # Export button removed - functionality moved to save/load menu
         
-        # Add Export submenu
-        export_submenu = QMenu('Export', self)
+        # Add buttons to the right side of the toolbar
+        toolbox_layout.addWidget(new_button)
+        toolbox_layout.addWidget(save_button)
+        # Export button removed - functionality moved to save/load menu
         
-        # Export as SVG
-        svg_action = QAction('Export as SVG', self)
-        svg_action.triggered.connect(self.export_svg)
-        export_submenu.addAction(svg_action)
+        # Add toolbox and content splitter to main layout
+        main_layout.addWidget(toolbox)
+        main_layout.addWidget(content_splitter, 1)  # Give the content splitter a stretch factor
         
-        # Export as PNG
-        png_action = QAction('Export as PNG', self)
-        png_action.triggered.connect(self.export_png)
-        export_submenu.addAction(png_action)
+        # Snapshot the diagram for undo whenever the canvas is about to change it
+        self.canvas.about_to_change.connect(self.save_state)
         
-        # Export as JPEG
-        jpeg_action = QAction('Export as JPEG', self)
-        jpeg_action.triggered.connect(self.export_jpeg)
-        export_submenu.addAction(jpeg_action)
+        # IMPORTANT: Connect the signal to update D2 code
+        self.canvas.diagram_changed.connect(self.schedule_d2_update)
+        logger.debug("Connected diagram_changed signal to schedule_d2_update slot")
         
-        # Export as HTML
-        html_action = QAction('Export as HTML', self)
-        html_action.triggered.connect(self.export_html)
-        export_submenu.addAction(html_action)
+        # Force an initial update of the D2 code panel
+        QTimer.singleShot(100, self.update_d2_code)
         
-        # Add the export submenu to the main menu
-        save_load_menu.addMenu(export_submenu)
+        # Set the central widget
+        self.setCentralWidget(central_widget)
         
-        # Show the menu at the position of the save button
-        save_load_menu.exec_(self.sender().mapToGlobal(QPoint(0, self.sender().height())))
+        # Set window size
+        self.resize(1200, 800)
     
-    def show_export_menu(self):
-        """Show a popup menu with export options (kept for backward compatibility)
-        Export functionality is now primarily accessed through the Save/Load menu"""
-        export_menu = QMenu(self)
-        
-        # Export as SVG
-        svg_action = QAction('Export as SVG', self)
-        svg_action.triggered.connect(self.export_svg)
-        export_menu.addAction(svg_action)
+    def show_element_properties(self, element):
+        """Queue showing the properties panel for the selected element"""
+        # A single gesture can report several selections (e.g. clear on press, then the
+        # rubber-band result); only the last one queued before the event loop runs is shown
+        self._pending_properties_element = element
+        if self._properties_update_pending:
+            return
+        self._properties_update_pending = True
+        QTimer.singleShot(0, self._flush_element_properties)
+    
+    def _flush_element_properties(self):
+        """Show the most recently selected element in the properties panel"""
+        self._properties_update_pending = False
+        element = self._pending_properties_element
+        self._pending_properties_element = None
+        
+        # Re-selecting the element already being edited needs no panel refresh
+        if element is not None and element is self.properties_panel.element and self.properties_panel.isVisible():
+            return
+        self.properties_panel.set_element(element)
+    
+    def on_property_changed(self):
+        """Update the D2 code when properties change"""
+        # Typing in the label field or clicking +/- fires this together with
+        # diagram_changed; queue one shared refresh instead of regenerating per signal
+        self.schedule_d2_update()
+        self.canvas.update()
+    
+    def schedule_d2_update(self):
+        """Queue a D2 code refresh for when control returns to the event loop"""
+        # A single user action can emit diagram_changed several times (e.g. resize
+        # plus push-away); coalesce them into one regeneration of the code panel
+        if self._d2_update_pending:
+            return
+        self._d2_update_pending = True
+        QTimer.singleShot(0, self._flush_d2_update)
+    
+    def _flush_d2_update(self):
+        """Run the queued D2 code refresh"""
+        self._d2_update_pending = False
+        self.update_d2_code()
+    
+    def update_d2_code(self):
+        """Update the D2 code panel with the current diagram"""
+        logger.debug("update_d2_code called - canvas has %d elements", len(self.canvas.elements))
         
-        # Export as PNG
-        png_action = QAction('Export as PNG', self)
-        png_action.triggered.connect(self.export_png)
-        export_menu.addAction(png_action)
+        # We don't need to save state here as it's already saved when elements are added/modified
+        # self.save_state()
         
-        # Export as JPEG
-        jpeg_action = QAction('Export as JPEG', self)
-        jpeg_action.triggered.connect(self.export_jpeg)
-        export_menu.addAction(jpeg_action)
+        # Generate D2 code from the diagram
+        d2_code = self.canvas.generate_d2_code()
         
-        # Export as HTML
-        html_action = QAction('Export as HTML', self)
-        html_action.triggered.connect(self.export_html)
-        export_menu.addAction(html_action)
+        # Update the code panel without triggering on_code_changed
+        self.set_code_text(d2_code)
         
-        # Show the menu at the position of the export button
-        export_menu.exec_(self.sender().mapToGlobal(QPoint(0, self.sender().height())))
+        # Log a sample of the code for debugging; splitting the text is only worth it when shown
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Code panel updated. Text length: %d", len(d2_code))
+            if d2_code:
+                logger.debug("Code panel text sample:\n%s", "\n".join(d2_code.split('\n', 2)[:2]))
     
-    def export_svg(self):
-        """Export the diagram as SVG"""
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export SVG", "", "SVG Files (*.svg)")
-        if file_path:
-            # If the user didn't add .svg extension, add it
-            if not file_path.lower().endswith('.svg'):
-                file_path += '.svg'
-                
-            # Create a QSvgGenerator to render the diagram
-            generator = QSvgGenerator()
-            generator.setFileName(file_path)
-            
-            # Calculate the diagram bounds
-            min_x, min_y, max_x, max_y = self._calculate_diagram_bounds()
-            
-            # Add some padding
-            padding = 50
-            width = max(max_x - min_x + 2 * padding, 100)
-            height = max(max_y - min_y + 2 * padding, 100)
-            
-            # Set the size and viewbox
-            generator.setSize(QSize(width, height))
-            generator.setViewBox(QRect(-padding, -padding, width, height))
-            generator.setTitle("D2 Diagram")
-            generator.setDescription("Generated from D2 Diagram Designer")
-            
-            # Create a painter to paint on the SVG
-            painter = QPainter()
-            painter.begin(generator)
-            
-            # Enable antialiasing for smoother shapes
-            painter.setRenderHint(QPainter.Antialiasing, True)
-            painter.setRenderHint(QPainter.TextAntialiasing, True)
-            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
-            
-            # Set the font to ensure it's embedded in the SVG
-            font = QFont("Arial", 10)
-            painter.setFont(font)
-            
-            # Translate to center the diagram
-            painter.translate(-min_x + padding, -min_y + padding)
-            
-            # Draw a background matching the canvas color
-            painter.fillRect(QRect(min_x - padding, min_y - padding, width, height), DARK_WIDGET_BG)
-            
-            # Draw the diagram elements
-            for element in self.canvas.elements:
-                # Draw containers first
-                if element.children:
-                    # Calculate container bounds
-                    container_min_x = element.x
-                    container_min_y = element.y
-                    container_max_x = element.x + element.width
-                    container_max_y = element.y + element.height
-                    
-                    for child in element.children:
-                        container_min_x = min(container_min_x, child.x)
-                        container_min_y = min(container_min_y, child.y)
-                        container_max_x = max(container_max_x, child.x + child.width)
-                        container_max_y = max(container_max_y, child.y + child.height)
-                    
-                    # Add padding
-                    container_padding = 20
-                    container_min_x -= container_padding
-                    container_min_y -= container_padding
-                    container_max_x += container_padding
-                    container_max_y += container_padding
-                    
-                    # Draw container rectangle
-                    container_rect = QRectF(container_min_x, container_min_y, 
-                                          container_max_x - container_min_x, 
-                                          container_max_y - container_min_y)
-                    
-                    # Use a light gray fill for containers
-                    painter.setPen(QPen(QColor(100, 150, 100), 1.5))
-                    painter.setBrush(QBrush(QColor(240, 245, 240)))
-                    painter.drawRoundedRect(container_rect, 10, 10)
-                    
-                    # Draw container header
-                    header_height = 30
-                    header_rect = QRectF(container_min_x, container_min_y, 
-                                       container_max_x - container_min_x, header_height)
-                    painter.setBrush(QBrush(QColor(200, 220, 200)))
-                    painter.drawRoundedRect(header_rect, 10, 10)
-                    
-                    # Draw container title
-                    container_text = element.container_title if element.container_title else f"{element.label} Container"
-                    painter.setPen(QPen(QColor(0, 0, 0)))
-                    
-                    # Use a bold font for the container title
-                    title_font = QFont(font)
-                    title_font.setBold(True)
-                    title_font.setPointSize(11)
-                    painter.setFont(title_font)
-                    
-                    # Draw the title text
-                    text_rect = QRectF(container_min_x + 10, container_min_y, 
-                                     container_max_x - container_min_x - 20, header_height)
-                    painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, container_text)
-                    
-                    # Reset font
-                    painter.setFont(font)
-            
-            # Draw connections
-            for connection in self.canvas.connections:
-                # Calculate connection points
-                source_center = QPoint(connection.source.x + connection.source.width//2, 
-                                     connection.source.y + connection.source.height//2)
-                target_center = QPoint(connection.target.x + connection.target.width//2, 
-                                     connection.target.y + connection.target.height//2)
-                
-                # Find intersection points with shape boundaries
-                source_edge = connection._find_intersection_point(connection.source, source_center, target_center)
-                target_edge = connection._find_intersection_point(connection.target, target_center, source_center)
-                
-                if source_edge and target_edge:
-                    # Draw the connection line
-                    painter.setPen(QPen(ARROW_COLOR, 1.5))
-                    painter.drawLine(source_edge, target_edge)
-                    
-                    # Draw arrowhead
-                    angle = connection._calculate_angle(source_edge, target_edge)
-                    connection._draw_arrow_head(painter, target_edge, angle)
-                    
-                    # Draw label
-                    if connection.label:
-                        mid_point = QPoint((source_edge.x() + target_edge.x()) // 2,
-                                         (source_edge.y() + target_edge.y()) // 2)
-                        
-                        # Set text color
-                        painter.setPen(QPen(DARK_TEXT))
-                        
-                        # Use a standard font for connection labels
-                        label_font = QFont(font)
-                        label_font.setPointSize(9)
-                        painter.setFont(label_font)
-                        
-                        # Calculate text rectangle for positioning
-                        text_rect = painter.fontMetrics().boundingRect(connection.label)
-                        text_rect.moveCenter(mid_point)
-                        
-                        # Add a small background for better readability
-                        bg_rect = QRectF(text_rect)
-                        bg_rect.adjust(-5, -2, 5, 2)
-                        painter.fillRect(bg_rect, QColor(60, 60, 60, 220))
-                        
-                        # Draw text directly without background
-                        painter.drawText(text_rect, Qt.AlignCenter, connection.label)
-                        
-                        # Reset font
-                        painter.setFont(font)
-            
-            # Draw elements on top
-            for element in self.canvas.elements:
-                # Set pen based on element properties
-                painter.setPen(QPen(element.border_color, 1))
-                painter.setBrush(QBrush(element.color))
-                
-                # Draw the appropriate shape based on element type
-                if isinstance(element, BoxElement):
-                    painter.drawRect(element.x, element.y, element.width, element.height)
-                elif isinstance(element, CircleElement):
-                    painter.drawEllipse(element.x, element.y, element.width, element.height)
-                elif isinstance(element, DiamondElement):
-                    # Create a diamond shape using a polygon
-                    points = [
-                        QPoint(element.x + element.width // 2, element.y),  # Top
-                        QPoint(element.x + element.width, element.y + element.height // 2),  # Right
-                        QPoint(element.x + element.width // 2, element.y + element.height),  # Bottom
-                        QPoint(element.x, element.y + element.height // 2)  # Left
-                    ]
-                    painter.drawPolygon(QPolygon(points))
-                elif isinstance(element, HexagonElement):
-                    # Create a hexagon shape using a polygon
-                    w, h = element.width, element.height
-                    points = [
-                        QPoint(element.x + w // 4, element.y),  # Top left
-                        QPoint(element.x + w * 3 // 4, element.y),  # Top right
-                        QPoint(element.x + w, element.y + h // 2),  # Right
-                        QPoint(element.x + w * 3 // 4, element.y + h),  # Bottom right
-                        QPoint(element.x + w // 4, element.y + h),  # Bottom left
-                        QPoint(element.x, element.y + h // 2)  # Left
-                    ]
-                    painter.drawPolygon(QPolygon(points))
-                
-                # Draw element label
-                painter.setPen(QPen(ELEMENT_TEXT_COLOR))
-                
-                # Use a specific font for element labels
-                element_font = QFont(font)
-                element_font.setPointSize(10)
-                painter.setFont(element_font)
-                
-                # Draw the text centered in the element
-                painter.drawText(QRect(element.x, element.y, element.width, element.height), 
-                               Qt.AlignCenter, element.label)
-                
-                # Reset font
-                painter.setFont(font)
-            
-            # End painting
-            painter.end()
-            
-            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
+    def set_code_text(self, d2_code):
+        """Replace the code panel text without emitting textChanged"""
+        with signals_blocked(self.code_edit):
+            self.code_edit.setPlainText(d2_code)
     
-    def _calculate_diagram_bounds(self):
-        """Calculate the bounds of the entire diagram"""
-        if not self.canvas.elements:
-            return 0, 0, 800, 600  # Default size if no elements
+    def on_code_changed(self):
+        """Handle changes to the D2 code panel"""
+        # This is a placeholder for future implementation
+        # In a full implementation, this would parse the D2 code and update the diagram
+        # For now, we'll just print a message
+        logger.debug("Code panel changed - this feature is not fully implemented yet")
         
-        # Start with the first element's bounds
-        min_x = self.canvas.elements[0].x
-        min_y = self.canvas.elements[0].y
-        max_x = self.canvas.elements[0].x + self.canvas.elements[0].width
-        max_y = self.canvas.elements[0].y + self.canvas.elements[0].height
+        # In a future version, we could implement a D2 parser to update the diagram
+        # based on the code, but that's beyond the scope of this current implementation
+    
+    def new_diagram(self):
+        """Clear the current diagram"""
+        with updates_suspended(self):
+            self.canvas.elements.clear()
+            self.canvas.connections.clear()
+            self.canvas.selected_elements.clear()
+            self.canvas.selected_connections.clear()
+            self.properties_panel.set_element(None)  # Hide the properties panel
+            self.canvas.update()
+            self.update_d2_code()
         
-        # Check all elements
-        for element in self.canvas.elements:
-            min_x = min(min_x, element.x)
-            min_y = min(min_y, element.y)
-            max_x = max(max_x, element.x + element.width)
-            max_y = max(max_y, element.y + element.height)
+    def showEvent(self, event):
+        """Called when the window is shown"""
+        super().showEvent(event)
+        # Force an update of the D2 code when the window is shown
+        QTimer.singleShot(500, self.update_d2_code)
         
-        return min_x, min_y, max_x, max_y
+        # Apply dark mode to the window title bar
+        if hasattr(self, 'winId'):
+            try:
+                hwnd = int(self.winId())
+                set_window_dark_mode(hwnd)
+            except Exception as e:
+                logger.warning("Failed to set dark mode for title bar: %s", e)
     
-    def export_png(self):
-        """Export the diagram as PNG"""
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export PNG", "", "PNG Files (*.png)")
-        if file_path:
-            # If the user didn't add .png extension, add it
-            if not file_path.lower().endswith('.png'):
-                file_path += '.png'
-                
-            # Create a pixmap to render the diagram
-            pixmap = QPixmap(self.canvas.size())
-            pixmap.fill(Qt.transparent)
-            
-            # Create a painter to paint on the pixmap
-            painter = QPainter(pixmap)
-            
-            # Render the canvas to the pixmap
-            self.canvas.render(painter)
-            
-            # End painting
-            painter.end()
-            
-            # Save the pixmap as PNG
-            pixmap.save(file_path, "PNG")
-            
-            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
+    def copy_code_to_clipboard(self):
+        """Copy the D2 code to the clipboard"""
+        clipboard = QApplication.clipboard()
+        clipboard.setText(self.code_edit.toPlainText())
+        logger.debug("D2 code copied to clipboard")
     
-    def export_jpeg(self):
-        """Export the diagram as JPEG"""
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export JPEG", "", "JPEG Files (*.jpg *.jpeg)")
+    def save_diagram(self):
+        """Save the diagram to a file"""
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Diagram", "", "D2 Files (*.d2)")
         if file_path:
-            # If the user didn't add .jpg extension, add it
-            if not (file_path.lower().endswith('.jpg') or file_path.lower().endswith('.jpeg')):
-                file_path += '.jpg'
-                
-            # Create a pixmap to render the diagram
-            pixmap = QPixmap(self.canvas.size())
-            pixmap.fill(QColor(40, 40, 40))  # Fill with dark background
-            
-            # Create a painter to paint on the pixmap
-            painter = QPainter(pixmap)
-            
-            # Render the canvas to the pixmap
-            self.canvas.render(painter)
-            
-            # End painting
-            painter.end()
-            
-            # Save the pixmap as JPEG
-            pixmap.save(file_path, "JPEG", 90)  # 90 is the quality (0-100)
-            
-            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
-    
-    def export_html(self):
-        """Export the diagram as HTML with embedded SVG"""
-        # Check if there are any elements to export
-        if not self.canvas.elements and not self.canvas.connections:
-            QMessageBox.warning(self, "Empty Diagram", "There are no elements to export. Please create a diagram first.")
-            return
+            # Save the current state for undo
+            self.save_state()
             
-        file_path, _ = QFileDialog.getSaveFileName(self, "Export HTML", "", "HTML Files (*.html)")
-        if file_path:
-            # If the user didn't add .html extension, add it
-            if not file_path.lower().endswith('.html'):
-                file_path += '.html'
+            # If the user didn't add .d2 extension, add it
+            if not file_path.lower().endswith('.d2'):
+                file_path += '.d2'
                 
             # Get the D2 code
             d2_code = self.code_edit.toPlainText()
             
-            # Generate SVG content with proper zoom to fit
-            svg_content = self._generate_svg_for_html(ensure_fit=True)
+            # Write the D2 code to the file
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(d2_code)
             
-            # Create HTML content with embedded SVG
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>D2 Diagram</title>
-    <meta charset="utf-8">
-    <style>
-        body {{ background-color: #2d2d2d; color: #e0e0e0; font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
-        body.fullscreen {{ padding: 0; }}
-        .container {{ display: flex; flex-direction: column; max-width: 1200px; margin: 0 auto; }}
-        .container.fullscreen {{ max-width: 100%; height: 100vh; margin: 0; }}
-        .diagram-container {{ background-color: #3c3c3c; padding: 20px; border-radius: 5px; margin-bottom: 20px; min-height: 400px; position: relative; overflow: hidden; }}
-        .container.fullscreen .diagram-container {{ height: 100%; margin-bottom: 0; border-radius: 0; }}
-        .diagram-controls {{ position: absolute; top: 10px; right: 10px; z-index: 10; background-color: rgba(60, 60, 60, 0.7); padding: 5px; border-radius: 5px; }}
-        .diagram-controls button {{ background-color: #555; color: white; border: none; border-radius: 3px; margin: 2px; padding: 5px 10px; cursor: pointer; display: flex; align-items: center; justify-content: center; }}
-        .diagram-controls button:hover {{ background-color: #666; }}
-        .diagram-controls button svg {{ width: 16px; height: 16px; }}
-        .diagram-controls button svg path {{ fill: #e0e0e0; }}
-        .diagram-wrapper {{ width: 100%; height: 100%; overflow: hidden; position: relative; }}
-        .diagram {{ position: relative; transform-origin: 0 0; }}
-        .code-container {{ background-color: #1e1e1e; padding: 20px; border-radius: 5px; position: relative; }}
-        .container.fullscreen .code-container {{ display: none; }}
-        .code {{ white-space: pre-wrap; font-family: monospace; margin: 0; }}
-        .copy-button {{ position: absolute; top: 10px; right: 10px; background-color: #555; border: none; border-radius: 3px; width: 32px; height: 32px; cursor: pointer; display: flex; align-items: center; justify-content: center; padding: 0; z-index: 5; }}
-        .copy-button:hover {{ background-color: #666; }}
-        .copy-button svg {{ width: 16px; height: 16px; }}
-        .copy-button svg path {{ fill: #e0e0e0; }}
-        .copy-tooltip {{ position: absolute; top: 15px; right: 50px; background-color: #333; color: white; padding: 5px 10px; border-radius: 3px; display: none; font-size: 12px; }}
-        h1, h2 {{ color: #e0e0e0; }}
-        .container.fullscreen h1 {{ display: none; }}
-        .container.fullscreen h2 {{ display: none; }}
-        svg {{ max-width: 100%; height: auto; display: block; }}
-    </style>
-</head>
-<body>
-    <div class="container" id="main-container">
-        <h1>D2 Diagram</h1>
-        <div class="diagram-container">
-            <div class="diagram-controls">
-                <button id="zoom-in" title="Zoom In">
-                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
-                        <path d="M19 13h-6v6h-2v-6H5v-2h6V5h2v6h6v2z"/>
-                    </svg>
-                </button>
-                <button id="zoom-out" title="Zoom Out">
-                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
-                        <path d="M19 13H5v-2h14v2z"/>
-                    </svg>
-                </button>
-                <button id="zoom-fit" title="Zoom to Fit">
-                    <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
-                        <path d="M18 4H6c-1.1 0-2 .9-2 2v12c0 1.1.9 2 2 2h12c1.1 0 2-.9 2-2V6c0-1.1-.9-2-2-2zm0 14H6V6h12v12z"/>
-                    </svg>
-                </button>
-                <button id="fullscreen" title="Toggle Fullscreen">
-                    <svg id="fullscreen-icon" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
-                        <path d="M7 14H5v5h5v-2H7v-3zm-2-4h2V7h3V5H5v5zm12 7h-3v2h5v-5h-2v3zM14 5v2h3v3h2V5h-5z"/>
-                    </svg>
-                    <svg id="exit-fullscreen-icon" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg" style="display: none;">
-                        <path d="M5 16h3v3h2v-5H5v2zm3-8H5v2h5V5H8v3zm6 11h2v-3h3v-2h-5v5zm2-11V5h-2v5h5V8h-3z"/>
-                    </svg>
-                </button>
-            </div>
-            <div class="diagram-wrapper">
-                <div class="diagram" id="diagram">
-                    {svg_content}
-                </div>
-            </div>
-        </div>
-        <h2>D2 Code</h2>
-        <div class="code-container">
-            <button class="copy-button" id="copy-button" title="Copy to clipboard">
-                <svg viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
-                    <path d="M16 1H4C2.9 1 2 1.9 2 3v14h2V3h12V1zm3 4H8C6.9 5 6 5.9 6 7v14c0 1.1.9 2 2 2h11c1.1 0 2-.9 2-2V7c0-1.1-.9-2-2-2zm0 16H8V7h11v14z"/>
-                </svg>
-            </button>
-            <div class="copy-tooltip" id="copy-tooltip">Copied!</div>
-            <pre class="code" id="d2-code">{d2_code.replace('<', '&lt;').replace('>', '&gt;')}</pre>
-        </div>
-    </div>
+            QMessageBox.information(self, "Save Successful", f"Diagram saved to {file_path}")
+    
+    def load_diagram(self):
+        """Load a diagram from a .d2 file"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Diagram", "", "D2 Files (*.d2)")
+        if file_path:
+            try:
+                # Read the D2 code from the file
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    d2_code = f.read()
+                
+                # Save the current state for undo
+                self.save_state()
+                
+                # Rebuild the window contents with repaints held back until the end
+                with updates_suspended(self):
+                    # Clear the current diagram
+                    self.canvas.elements.clear()
+                    self.canvas.connections.clear()
+                    self.canvas.selected_elements.clear()
+                    self.canvas.selected_connections.clear()
+                    
+                    # Parse the D2 code and create visual elements, with the canvas's
+                    # change signals held back so the code panel is refreshed once below
+                    with signals_blocked(self.canvas):
+                        self.parse_d2_code(d2_code)
+                    
+                    # Update the canvas
+                    self.canvas.update()
+                    
+                    # Show the code regenerated from the loaded diagram (what the queued
+                    # refresh used to replace the raw file text with a moment later)
+                    self.set_code_text(self.canvas.generate_d2_code())
+                
+                QMessageBox.information(self, "Load Successful", f"Diagram loaded from {file_path}")
+                
+            except Exception as e:
+                QMessageBox.critical(self, "Load Error", f"Error loading diagram: {str(e)}")
     
-    <script>
-        // Pan and zoom functionality
-        (function() {{
-            const container = document.getElementById('main-container');
-            const diagramContainer = document.querySelector('.diagram-container');
-            const diagramWrapper = document.querySelector('.diagram-wrapper');
-            const diagram = document.getElementById('diagram');
-            const zoomInBtn = document.getElementById('zoom-in');
-            const zoomOutBtn = document.getElementById('zoom-out');
-            const zoomFitBtn = document.getElementById('zoom-fit');
-            const fullscreenBtn = document.getElementById('fullscreen');
-            const fullscreenIcon = document.getElementById('fullscreen-icon');
-            const exitFullscreenIcon = document.getElementById('exit-fullscreen-icon');
+    def parse_d2_code(self, d2_code):
+        """Parse D2 code and create visual elements"""
+        try:
+            # Split the code into lines and process each line
+            lines = d2_code.split('\n')
             
-            let scale = 1;
-            let translateX = 0;
-            let translateY = 0;
-            let isDragging = false;
-            let startX, startY;
-            let lastTranslateX = 0;
-            let lastTranslateY = 0;
-            let isFullscreen = false;
+            # Track elements by their names, and by the ids saved with them
+            element_map = {}
+            element_by_id = {}
             
-            // Apply transform
-            function applyTransform() {{
-                diagram.style.transform = `translate(${{translateX}}px, ${{translateY}}px) scale(${{scale}})`;
-            }}
+            # Track connections
+            connections = []
             
-            // Reset transform
-            function resetTransform() {{
-                scale = 1;
-                translateX = 0;
-                translateY = 0;
-                applyTransform();
-            }}
+            # Current parent being processed
+            current_parent = None
             
-            // Zoom to fit
-            function zoomToFit() {{
-                const svgElement = diagram.querySelector('svg');
-                if (svgElement) {{
-                    // Get container dimensions
-                    const containerWidth = diagramWrapper.clientWidth;
-                    const containerHeight = diagramWrapper.clientHeight;
-                    
-                    // Find diagram bounds by examining actual elements
-                    // This is more precise than using SVG dimensions which may have empty space
-                    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
-                    
-                    // Check all diagram elements (shapes, text, etc)
-                    const elements = svgElement.querySelectorAll('rect, circle, ellipse, polygon, path, text, g');
-                    elements.forEach(el => {{
-                        // Try to get element bounding box
-                        try {{
-                            const bbox = el.getBBox();
-                            minX = Math.min(minX, bbox.x);
-                            minY = Math.min(minY, bbox.y);
-                            maxX = Math.max(maxX, bbox.x + bbox.width);
-                            maxY = Math.max(maxY, bbox.y + bbox.height);
-                        }} catch (e) {{
-                            // Some elements might not have bbox, ignore them
-                        }}
-                    }});
+            # Process each line
+            i = 0
+            while i < len(lines):
+                line = lines[i].strip()
+                
+                # Skip empty lines and comments
+                if not line or line.startswith('#'):
+                    i += 1
+                    continue
+                
+                # Check for element definitions (e.g., "Box: {")
+                if ':' in line and '{' in line:
+                    # Extract element name
+                    element_name = line.split(':', 1)[0].strip()
                     
-                    // Fallback to SVG dimensions if we couldn't find elements
-                    if (minX === Infinity || maxX === -Infinity) {{
-                        minX = 0;
-                        minY = 0;
-                        maxX = svgElement.width.baseVal.value;
-                        maxY = svgElement.height.baseVal.value;
-                    }}
+                    # Check if this is a child element (indented)
+                    is_child = False
+                    if current_parent and lines[i].startswith('  '):
+                        is_child = True
                     
-                    // Calculate the actual content width and height
-                    const contentWidth = maxX - minX;
-                    const contentHeight = maxY - minY;
+                    # Default properties
+                    shape_type = "box"  # Default shape
+                    label = element_name
+                    x = 100 + len(element_map) * 50  # Stagger elements
+                    y = 100 + len(element_map) * 30
+                    width = 100
+                    height = 60
+                    color = QColor(180, 180, 180)
+                    element_id = None
                     
-                    // Add padding (5% on each side)
-                    const padding = 0.1;
-                    const paddedWidth = contentWidth * (1 + padding);
-                    const paddedHeight = contentHeight * (1 + padding);
+                    # Look ahead for properties
+                    position_specified = False
+                    j = i + 1
+                    while j < len(lines) and not lines[j].strip().endswith('}'):
+                        prop_line = lines[j].strip()
+                        
+                        # Check for shape property
+                        if 'shape:' in prop_line:
+                            shape_value = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
+                            if 'circle' in shape_value:
+                                shape_type = "circle"
+                                width = height = 80  # Circles are typically square
+                            elif 'diamond' in shape_value:
+                                shape_type = "diamond"
+                            elif 'hexagon' in shape_value:
+                                shape_type = "hexagon"
+                        
+                        # Check for label property
+                        elif 'label:' in prop_line:
+                            label = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
+                        
+                        # Check for fill color
+                        elif 'style.fill:' in prop_line:
+                            color_str = prop_line.split(':', 1)[1].strip().replace('"', '').replace("'", "")
+                            color = color_from_name(color_str)
+                        
+                        # Check for position information in comments
+                        elif '# position:' in prop_line:
+                            position_specified = True
+                            try:
+                                # Extract position data: x,y,width,height
+                                pos_data = prop_line.split('# position:', 1)[1].strip().split(',')
+                                if len(pos_data) == 4:
+                                    x = int(pos_data[0])
+                                    y = int(pos_data[1])
+                                    width = int(pos_data[2])
+                                    height = int(pos_data[3])
+                                    logger.debug("Found position data for %s: x=%d, y=%d, width=%d, height=%d", element_name, x, y, width, height)
+                            except Exception as e:
+                                logger.warning("Error parsing position data: %s", e)
+                        
+                        # Check for the saved element id; the element's own id comes
+                        # before any nested child block, so the first one wins
+                        elif '# id:' in prop_line:
+                            if element_id is None:
+                                element_id = prop_line.split('# id:', 1)[1].strip() or None
+                        
+                        j += 1
                     
-                    // Calculate scale to fit the padded content
-                    const scaleX = containerWidth / paddedWidth;
-                    const scaleY = containerHeight / paddedHeight;
-                    scale = Math.min(scaleX, scaleY);
+                    # Create the element based on shape type
+                    new_element = None
+                    if shape_type == "box":
+                        new_element = BoxElement(x, y, width, height, label)
+                    elif shape_type == "circle":
+                        new_element = CircleElement(x, y, width, height, label)
+                    elif shape_type == "diamond":
+                        new_element = DiamondElement(x, y, width, height, label)
+                    elif shape_type == "hexagon":
+                        new_element = HexagonElement(x, y, width, height, label)
                     
-                    // Calculate center of content
-                    const contentCenterX = minX + contentWidth / 2;
-                    const contentCenterY = minY + contentHeight / 2;
+                    if new_element:
+                        new_element.color = color
+                        
+                        # Keep the saved id unless another element already took it
+                        # (e.g. a hand-edited file with a copied block)
+                        if element_id and element_id not in element_by_id:
+                            new_element.id = element_id
+                        element_by_id[new_element.id] = new_element
+                        
+                        # If position was explicitly specified in the file (noted during the
+                        # look-ahead above), use those dimensions instead of the
+                        # auto-calculated ones based on text
+                        if position_specified:
+                            new_element.x = x
+                            new_element.y = y
+                            new_element.width = width
+                            new_element.height = height
+                        
+                        self.canvas.elements.append(new_element)
+                        element_map[element_name] = new_element
+                        
+                        # Handle parent-child relationship; the parent was created before
+                        # its children, so they can be linked right away
+                        if is_child and current_parent:
+                            new_element.parent = current_parent
+                            current_parent.children.append(new_element)
                     
-                    // Center the diagram - translate to container center, then offset by scaled content center
-                    translateX = containerWidth / 2 - contentCenterX * scale;
-                    translateY = containerHeight / 2 - contentCenterY * scale;
+                    # Check if this element has children (next line has '{')
+                    if j < len(lines) and '{' in lines[j]:
+                        current_parent = new_element
                     
-                    applyTransform();
-                }}
-            }}
-            
-            // Toggle fullscreen
-            function toggleFullscreen() {{
-                isFullscreen = !isFullscreen;
-                
-                if (isFullscreen) {{
-                    container.classList.add('fullscreen');
-                    document.body.classList.add('fullscreen');
-                    fullscreenIcon.style.display = 'none';
-                    exitFullscreenIcon.style.display = 'block';
-                }} else {{
-                    container.classList.remove('fullscreen');
-                    document.body.classList.remove('fullscreen');
-                    fullscreenIcon.style.display = 'block';
-                    exitFullscreenIcon.style.display = 'none';
-                }}
+                    i = j + 1
+                    continue
                 
-                // Adjust view when toggling fullscreen
-                setTimeout(zoomToFit, 100);
-            }}
-            
-            // Zoom in
-            zoomInBtn.addEventListener('click', function() {{
-                scale += 0.1;
-                applyTransform();
-            }});
-            
-            // Zoom out
-            zoomOutBtn.addEventListener('click', function() {{
-                if (scale > 0.2) {{
-                    scale -= 0.1;
-                    applyTransform();
-                }}
-            }});
-            
-            // Zoom to fit
-            zoomFitBtn.addEventListener('click', zoomToFit);
+                # Check for connections (e.g., "Box -> Circle")
+                if '->' in line:
+                    parts = line.split('->')
+                    if len(parts) == 2:
+                        source_name = parts[0].strip()
+                        
+                        # Extract target name and any label
+                        target_part = parts[1].strip()
+                        
+                        # Remove any comments from the target part
+                        if '#' in target_part:
+                            target_part = target_part.split('#')[0].strip()
+                        
+                        # Extract target name and label
+                        if ':' in target_part:
+                            target_name, label = target_part.split(':', 1)
+                            target_name = target_name.strip()
+                            label = label.strip()
+                        else:
+                            target_name = target_part.split(' ')[0].strip()  # Remove any trailing properties
+                            label = ""
+                        
+                        # Check for connection ID information in comments
+                        source_id = None
+                        target_id = None
+                        if '# connection:' in line:
+                            try:
+                                # Extract connection data: source_id,target_id
+                                conn_data = line.split('# connection:', 1)[1].strip().split(',')
+                                if len(conn_data) == 2:
+                                    # Hex UUIDs, or the numeric ids written by older versions
+                                    source_id = conn_data[0].strip() or None
+                                    target_id = conn_data[1].strip() or None
+                                    logger.debug("Found connection data: source_id=%s, target_id=%s", source_id, target_id)
+                            except Exception as e:
+                                logger.warning("Error parsing connection data: %s", e)
+                        
+                        # Store connection to create later when all elements are processed
+                        connections.append((source_name, target_name, label, source_id, target_id))
+                
+                i += 1
             
-            // Fullscreen
-            fullscreenBtn.addEventListener('click', toggleFullscreen);
+            # Create connections
+            for source_name, target_name, label, source_id, target_id in connections:
+                # Resolve endpoints by their saved ids first, so connections between
+                # elements with duplicate labels attach to the right ones; files without
+                # element ids fall back to the names
+                source = element_by_id.get(source_id) or element_map.get(source_name)
+                target = element_by_id.get(target_id) or element_map.get(target_name)
+                if source and target:
+                    # Clean up the label to remove any ID information
+                    clean_label = label
+                    if '#' in clean_label:
+                        clean_label = clean_label.split('#')[0].strip()
+                    
+                    connection = ArrowConnection(source, target, clean_label)
+                    self.canvas.connections.append(connection)
             
-            // Keyboard shortcuts
-            document.addEventListener('keydown', function(e) {{
-                if (e.key === 'f' || e.key === 'F') {{
-                    toggleFullscreen();
-                }} else if (e.key === '0') {{
-                    zoomToFit();
-                }} else if (e.key === 'Escape' && isFullscreen) {{
-                    toggleFullscreen();
-                }}
-            }});
+            # Signal that the diagram has changed
+            self.canvas.diagram_changed.emit()
             
-            // Mouse wheel zoom
-            diagramContainer.addEventListener('wheel', function(e) {{
-                e.preventDefault();
-                
-                // Get mouse position relative to diagram
-                const rect = diagramWrapper.getBoundingClientRect();
-                const mouseX = e.clientX - rect.left;
-                const mouseY = e.clientY - rect.top;
-                
-                // Calculate zoom
-                const delta = e.deltaY > 0 ? -0.1 : 0.1;
-                const newScale = Math.max(0.2, scale + delta);
-                
-                // Calculate new translate to zoom at mouse position
-                const scaleRatio = newScale / scale;
-                const newTranslateX = mouseX - (mouseX - translateX) * scaleRatio;
-                const newTranslateY = mouseY - (mouseY - translateY) * scaleRatio;
-                
-                // Apply new values
-                scale = newScale;
-                translateX = newTranslateX;
-                translateY = newTranslateY;
-                
-                applyTransform();
-            }});
+        except Exception:
+            logger.exception("Error parsing D2 code")
+    
+    def arrange_elements(self):
+        """Arrange elements to avoid overlaps"""
+        # Simple arrangement - place elements in a grid
+        grid_size = 150
+        cols = 4  # Number of columns in the grid
+        
+        # Root elements are the ones without a parent
+        root_elements = [element for element in self.canvas.elements if not element.parent]
+        
+        # Arrange root elements in a grid
+        for i, element in enumerate(root_elements):
+            row, col = divmod(i, cols)
+            element.x = 50 + col * grid_size
+            element.y = 50 + row * grid_size
+        
+        # Arrange child elements around their parents, using each container's own
+        # children list rather than grouping by id() and searching for the parent again
+        for parent in self.canvas.elements:
+            children = parent.children
+            if not children:
+                continue
             
-            // Mouse drag
-            diagramContainer.addEventListener('mousedown', function(e) {{
-                if (e.button === 0) {{ // Left mouse button
-                    isDragging = true;
-                    startX = e.clientX;
-                    startY = e.clientY;
-                    lastTranslateX = translateX;
-                    lastTranslateY = translateY;
-                    diagramContainer.style.cursor = 'grabbing';
-                }}
-            }});
+            # Arrange children in a circle around the parent; the centre, radius and
+            # trig functions are loop-invariant, so look them up once per parent
+            radius = max(parent.width, parent.height) + 100
+            angle_step = 2 * math.pi / len(children)
+            center_x = parent.x + parent.width / 2
+            center_y = parent.y + parent.height / 2
+            cos, sin = math.cos, math.sin
             
-            document.addEventListener('mousemove', function(e) {{
-                if (isDragging) {{
-                    translateX = lastTranslateX + (e.clientX - startX);
-                    translateY = lastTranslateY + (e.clientY - startY);
-                    applyTransform();
-                }}
-            }});
+            for i, child in enumerate(children):
+                angle = i * angle_step
+                child.x = center_x + radius * cos(angle) - child.width / 2
+                child.y = center_y + radius * sin(angle) - child.height / 2
+        
+        # Update the canvas
+        self.canvas.update()
+    
+    def show_save_load_menu(self):
+        """Show a popup menu with save, load, and export options"""
+        save_load_menu = QMenu(self)
+        
+        # Save option
+        save_action = QAction('Save Diagram', self)
+        save_action.triggered.connect(self.save_diagram)
+        save_load_menu.addAction(save_action)
+        
+        # Load option
+        load_action = QAction('Load Diagram', self)
+        load_action.triggered.connect(self.load_diagram)
+        save_load_menu.addAction(load_action)
+        
+        # Add a separator
+        save_load_menu.addSeparator()
+        
+        # Add Export submenu
+        export_submenu = QMenu('Export', self)
+        
+        # One action per export format
+        self._add_export_actions(export_submenu)
+        
+        # Add the export submenu to the main menu
+        save_load_menu.addMenu(export_submenu)
+        
+        # Show the menu at the position of the save button
+        save_load_menu.exec_(self.sender().mapToGlobal(QPoint(0, self.sender().height())))
+    
+    def show_export_menu(self):
+        """Show a popup menu with export options (kept for backward compatibility)
+        Export functionality is now primarily accessed through the Save/Load menu"""
+        export_menu = QMenu(self)
+        
+        # One action per export format
+        self._add_export_actions(export_menu)
+        
+        # Show the menu at the position of the export button
+        export_menu.exec_(self.sender().mapToGlobal(QPoint(0, self.sender().height())))
+    
+    def _add_export_actions(self, menu):
+        """Add an 'Export as ...' action to menu for each export format"""
+        for name, (method, _, _) in self.EXPORT_FORMATS.items():
+            action = QAction(f'Export as {name}', self)
+            action.triggered.connect(getattr(self, method))
+            menu.addAction(action)
+    
+    def _export_file_path(self, name):
+        """Ask for an export path for the named format, adding its default extension
+        if the user left it off; returns an empty string if the dialog was cancelled"""
+        _, file_filter, extensions = self.EXPORT_FORMATS[name]
+        file_path, _ = QFileDialog.getSaveFileName(self, f"Export {name}", "", file_filter)
+        if file_path and os.path.splitext(file_path)[1].lower() not in extensions:
+            file_path += extensions[0]
+        return file_path
+    
+    def export_svg(self):
+        """Export the diagram as SVG"""
+        file_path = self._export_file_path("SVG")
+        if file_path:
+            # Render (or reuse) the SVG and write it out
+            with open(file_path, 'wb') as f:
+                f.write(self._svg_bytes(padding=50))
             
-            document.addEventListener('mouseup', function() {{
-                isDragging = false;
-                diagramContainer.style.cursor = 'default';
-            }});
+            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
+    
+    def _calculate_diagram_bounds(self):
+        """Calculate the bounds of the entire diagram"""
+        if not self.canvas.elements:
+            return 0, 0, 800, 600  # Default size if no elements
+        
+        return self.canvas.diagram_bounds()
+    
+    def _render_canvas_image(self):
+        """Render the canvas into a new QImage"""
+        # The canvas paints its opaque background over every pixel, so the image needs no
+        # alpha channel; RGB32 is also the format QPainter fills and blends fastest, and
+        # what JPEG would reduce the image to anyway
+        image = QImage(self.canvas.size(), QImage.Format_RGB32)
+        
+        # Pre-filling the image would be a wasted full-frame write while the canvas is an
+        # opaque-paint widget; only fill if that ever stops being true
+        if not self.canvas.testAttribute(Qt.WA_OpaquePaintEvent):
+            image.fill(CANVAS_BG_COLOR)
+        
+        # Render the canvas to the image (widgets can only be rendered on the GUI thread)
+        painter = QPainter(image)
+        self.canvas.render(painter)
+        painter.end()
+        return image
+    
+    def export_png(self):
+        """Export the diagram as PNG"""
+        file_path = self._export_file_path("PNG")
+        if file_path:
+            image = self._render_canvas_image()
             
-            // Touch support for mobile devices
-            diagramContainer.addEventListener('touchstart', function(e) {{
-                if (e.touches.length === 1) {{
-                    isDragging = true;
-                    startX = e.touches[0].clientX;
-                    startY = e.touches[0].clientY;
-                    lastTranslateX = translateX;
-                    lastTranslateY = translateY;
-                    e.preventDefault();
-                }}
-            }});
+            # Compress and write the PNG in the background. For PNG, Qt maps quality to
+            # zlib level (100 - quality) * 9 / 91, so 80 gives level 1: several times
+            # faster than the default level 6 for a few percent larger files
+            self.save_image_in_background(image, file_path, "PNG", 80)
+    
+    def export_jpeg(self):
+        """Export the diagram as JPEG"""
+        file_path = self._export_file_path("JPEG")
+        if file_path:
+            image = self._render_canvas_image()
             
-            diagramContainer.addEventListener('touchmove', function(e) {{
-                if (isDragging && e.touches.length === 1) {{
-                    translateX = lastTranslateX + (e.touches[0].clientX - startX);
-                    translateY = lastTranslateY + (e.touches[0].clientY - startY);
-                    applyTransform();
-                    e.preventDefault();
-                }}
-            }});
+            # Encode and write the JPEG in the background
+            self.save_image_in_background(image, file_path, "JPEG", 90)  # 90 is the quality (0-100)
+    
+    def save_image_in_background(self, image, file_path, image_format, quality=-1):
+        """Hand a rendered image to the thread pool to be encoded and written"""
+        task = ImageSaveTask(image, file_path, image_format, quality)
+        task.signals.finished.connect(self._on_image_saved)
+        self._image_save_tasks.add(task)
+        QThreadPool.globalInstance().start(task)
+    
+    def _on_image_saved(self, task, file_path, success):
+        """Report the result of a background image export"""
+        self._image_save_tasks.discard(task)
+        if success:
+            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
+        else:
+            logger.warning("Could not write image to %s", file_path)
+            QMessageBox.warning(self, "Export Failed", f"Could not write {file_path}")
+    
+    def export_html(self):
+        """Export the diagram as HTML with embedded SVG"""
+        # Check if there are any elements to export
+        if not self.canvas.elements and not self.canvas.connections:
+            QMessageBox.warning(self, "Empty Diagram", "There are no elements to export. Please create a diagram first.")
+            return
             
-            diagramContainer.addEventListener('touchend', function() {{
-                isDragging = false;
-            }});
+        file_path = self._export_file_path("HTML")
+        if file_path:
+            # Get the D2 code
+            d2_code = self.code_edit.toPlainText()
             
-            // Initialize with a slight delay to ensure SVG is loaded
-            setTimeout(zoomToFit, 100);
-        }})();
-        
-        // Copy to clipboard functionality
-        (function() {{
-            const copyButton = document.getElementById('copy-button');
-            const codeElement = document.getElementById('d2-code');
-            const tooltip = document.getElementById('copy-tooltip');
+            # Generate SVG content with proper zoom to fit
+            svg_content = self._generate_svg_for_html(ensure_fit=True)
             
-            copyButton.addEventListener('click', function() {{
-                // Create a temporary textarea element to copy the text
-                const textarea = document.createElement('textarea');
-                textarea.value = codeElement.textContent;
-                document.body.appendChild(textarea);
-                textarea.select();
-                
-                try {{
-                    // Execute the copy command
-                    const successful = document.execCommand('copy');
-                    
-                    // Show the tooltip
-                    if (successful) {{
-                        tooltip.style.display = 'block';
-                        
-                        // Hide the tooltip after 2 seconds
-                        setTimeout(function() {{
-                            tooltip.style.display = 'none';
-                        }}, 2000);
-                    }}
-                }} catch (err) {{
-                    console.error('Unable to copy', err);
-                }}
-                
-                // Remove the temporary textarea
-                document.body.removeChild(textarea);
-            }});
-        }})();
-    </script>
-</body>
-</html>"""
+            # Create HTML content with embedded SVG
+            html_content = HTML_EXPORT_TEMPLATE.format(
+                svg_content=svg_content,
+                d2_code=d2_code.replace('<', '&lt;').replace('>', '&gt;'))
             
             # Write the HTML content to the file
             with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            
-            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
-    
-    def _generate_svg_for_html(self, ensure_fit=False):
-        """Generate SVG content for embedding in HTML
-        
-        Args:
-            ensure_fit: If True, ensures the diagram is properly scaled to fit all elements
-        """
-        # Create a QSvgGenerator to render the diagram to a string
-        svg_bytes = QByteArray()
-        buffer = QBuffer(svg_bytes)
-        buffer.open(QIODevice.WriteOnly)
-        
-        generator = QSvgGenerator()
-        generator.setOutputDevice(buffer)
+                f.write(html_content)
+            
+            QMessageBox.information(self, "Export Successful", f"Diagram exported to {file_path}")
+    
+    def _render_svg(self, generator, padding):
+        """Paint the diagram into an SVG generator, with padding around its bounds
         
+        Shared by the SVG file export and the HTML export so both draw identically.
+        """
         # Calculate the diagram bounds
         min_x, min_y, max_x, max_y = self._calculate_diagram_bounds()
         
-        # Add generous padding
-        padding = 80
         width = max(max_x - min_x + 2 * padding, 100)
         height = max(max_y - min_y + 2 * padding, 100)
         
@@ -4509,6 +4465,16 @@ class DiagramDesigner(QMainWindow):
         font = QFont("Arial", 10)
         painter.setFont(font)
         
+        # Derived fonts for container titles, connection labels and element labels, built once
+        # here instead of for every container, connection and element drawn below
+        title_font = QFont(font)
+        title_font.setBold(True)
+        title_font.setPointSize(11)
+        label_font = QFont(font)
+        label_font.setPointSize(9)
+        element_font = QFont(font)
+        element_font.setPointSize(10)
+        
         # Translate to center the diagram
         painter.translate(-min_x + padding, -min_y + padding)
         
@@ -4518,25 +4484,9 @@ class DiagramDesigner(QMainWindow):
         # Draw the diagram elements
         for element in self.canvas.elements:
             # Draw containers first
-            if hasattr(element, 'children') and element.children:
-                # Calculate container bounds
-                container_min_x = element.x
-                container_min_y = element.y
-                container_max_x = element.x + element.width
-                container_max_y = element.y + element.height
-                
-                for child in element.children:
-                    container_min_x = min(container_min_x, child.x)
-                    container_min_y = min(container_min_y, child.y)
-                    container_max_x = max(container_max_x, child.x + child.width)
-                    container_max_y = max(container_max_y, child.y + child.height)
-                
-                # Add padding
-                container_padding = 20
-                container_min_x -= container_padding
-                container_min_y -= container_padding
-                container_max_x += container_padding
-                container_max_y += container_padding
+            if element.children:
+                # Calculate container bounds (padded)
+                container_min_x, container_min_y, container_max_x, container_max_y = element.container_bounds()
                 
                 # Draw container rectangle
                 container_rect = QRectF(container_min_x, container_min_y, 
@@ -4556,13 +4506,10 @@ class DiagramDesigner(QMainWindow):
                 painter.drawRoundedRect(header_rect, 10, 10)
                 
                 # Draw container title
-                container_text = element.container_title if hasattr(element, 'container_title') and element.container_title else f"{element.label} Container"
+                container_text = element.container_title if element.container_title else f"{element.label} Container"
                 painter.setPen(QPen(QColor(0, 0, 0)))
                 
                 # Use a bold font for the container title
-                title_font = QFont(font)
-                title_font.setBold(True)
-                title_font.setPointSize(11)
                 painter.setFont(title_font)
                 
                 # Draw the title text
@@ -4575,15 +4522,8 @@ class DiagramDesigner(QMainWindow):
         
         # Draw connections
         for connection in self.canvas.connections:
-            # Calculate connection points
-            source_center = QPoint(connection.source.x + connection.source.width//2, 
-                                 connection.source.y + connection.source.height//2)
-            target_center = QPoint(connection.target.x + connection.target.width//2, 
-                                 connection.target.y + connection.target.height//2)
-            
-            # Find intersection points with shape boundaries
-            source_edge = connection._find_intersection_point(connection.source, source_center, target_center)
-            target_edge = connection._find_intersection_point(connection.target, target_center, source_center)
+            # Edge points and arrow head, shared with the canvas rendering
+            source_edge, target_edge, arrow_head = connection._edge_geometry()
             
             if source_edge and target_edge:
                 # Draw the connection line
@@ -4591,8 +4531,8 @@ class DiagramDesigner(QMainWindow):
                 painter.drawLine(source_edge, target_edge)
                 
                 # Draw arrowhead
-                angle = connection._calculate_angle(source_edge, target_edge)
-                connection._draw_arrow_head(painter, target_edge, angle)
+                painter.setBrush(ARROW_COLOR)
+                painter.drawPolygon(arrow_head)
                 
                 # Draw label
                 if connection.label:
@@ -4603,8 +4543,6 @@ class DiagramDesigner(QMainWindow):
                     painter.setPen(QPen(DARK_TEXT))
                     
                     # Use a standard font for connection labels
-                    label_font = QFont(font)
-                    label_font.setPointSize(9)
                     painter.setFont(label_font)
                     
                     # Calculate text rectangle for positioning
@@ -4659,8 +4597,6 @@ class DiagramDesigner(QMainWindow):
             painter.setPen(QPen(ELEMENT_TEXT_COLOR))
             
             # Use a specific font for element labels
-            element_font = QFont(font)
-            element_font.setPointSize(10)
             painter.setFont(element_font)
             
             # Draw the text centered in the element
@@ -4672,316 +4608,216 @@ class DiagramDesigner(QMainWindow):
         
         # End painting
         painter.end()
+
+    def _generate_svg_for_html(self, ensure_fit=False):
+        """Generate SVG content for embedding in HTML
+        
+        Args:
+            ensure_fit: If True, ensures the diagram is properly scaled to fit all elements
+        """
+        # Generous padding around the diagram
+        return self._svg_bytes(padding=80).decode('utf-8')
+    
+    def _svg_fingerprint(self):
+        """Everything _render_svg draws, as a comparable tuple"""
+        elements = self.canvas.elements
+        index = {element: i for i, element in enumerate(elements)}
+        return (
+            tuple((type(element), element.x, element.y, element.width, element.height,
+                   element.label, element.color.rgba(), element.border_color.rgba(),
+                   element.container_title, tuple(index.get(child) for child in element.children))
+                  for element in elements),
+            tuple((index.get(connection.source), index.get(connection.target), connection.label)
+                  for connection in self.canvas.connections),
+        )
+    
+    def _svg_bytes(self, padding):
+        """Return the diagram as SVG, re-rendering only if it changed since the last
+        export with the same padding"""
+        fingerprint = self._svg_fingerprint()
+        cached = self._svg_cache.get(padding)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        
+        # QtSvg is only needed for SVG/HTML export, so it is loaded on first use
+        from PyQt5.QtSvg import QSvgGenerator
+        
+        # Render the diagram into an in-memory buffer
+        svg_bytes = QByteArray()
+        buffer = QBuffer(svg_bytes)
+        buffer.open(QIODevice.WriteOnly)
+        
+        generator = QSvgGenerator()
+        generator.setOutputDevice(buffer)
+        self._render_svg(generator, padding)
         buffer.close()
         
-        # Convert the SVG bytes to a string and return
-        svg_string = str(svg_bytes.data(), 'utf-8')
-        return svg_string
+        data = bytes(svg_bytes.data())
+        self._svg_cache[padding] = (fingerprint, data)
+        return data
         
     def _draw_grid_for_svg(self, painter, x, y, width, height):
         """Draw a grid similar to the canvas grid for SVG export"""
         # Grid is now hidden in exports
         pass
         
-    def save_state(self):
-        """Save the current state of the diagram for undo functionality"""
-        print("SAVE_STATE called - Elements:", len(self.canvas.elements), "Connections:", len(self.canvas.connections))
-        
-        # Don't save state if there are no elements or connections
-        if not self.canvas.elements and not self.canvas.connections:
-            print("Not saving empty state")
-            return
-        
-        # Create a deep copy of the current state
-        state = {
-            'elements': [],
-            'connections': []
-        }
-        
-        # Save elements
-        for element in self.canvas.elements:
-            element_data = {
+    def _capture_state(self):
+        """Snapshot the diagram as plain data for the undo/redo stacks"""
+        # This runs before every change, so each element is captured in a single flat
+        # pass. Nesting and connection endpoints are stored as positions in the element
+        # list, so restoring them is plain list indexing; children are rebuilt from
+        # parent_index. Colors are RGBA ints, cheaper to take and restore than names
+        elements = self.canvas.elements
+        index = {element: i for i, element in enumerate(elements)}
+        return {
+            'elements': [{
                 'type': type(element).__name__,
                 'x': element.x,
                 'y': element.y,
                 'width': element.width,
                 'height': element.height,
                 'label': element.label,
-                'color': element.color.name(),
-                'border_color': element.border_color.name(),
+                'color': element.color.rgba(),
+                'border_color': element.border_color.rgba(),
                 'id': element.id,
-                'parent_id': element.parent.id if element.parent else None,
-                'children_ids': [child.id for child in element.children],
+                'parent_index': index.get(element.parent),
                 'container_title': element.container_title
-            }
-            state['elements'].append(element_data)
-        
-        # Save connections
-        for connection in self.canvas.connections:
-            connection_data = {
-                'source_id': connection.source.id,
-                'target_id': connection.target.id,
+            } for element in elements],
+            'connections': [{
+                'source_index': index.get(connection.source),
+                'target_index': index.get(connection.target),
                 'label': connection.label
-            }
-            state['connections'].append(connection_data)
-        
-        # Add to undo stack
-        self.undo_stack.append(state)
-        print("Added state to undo stack - Stack size:", len(self.undo_stack))
-        
-        # Clear redo stack when a new action is performed
-        if self.redo_stack:
-            self.redo_stack.clear()
-            print("Cleared redo stack")
-        
-        # Limit the size of the undo stack
-        if len(self.undo_stack) > self.max_undo_steps:
-            self.undo_stack.pop(0)
-            print("Removed oldest state from undo stack - Stack size:", len(self.undo_stack))
-    
-    def undo_action(self):
-        """Undo the last action"""
-        print("UNDO_ACTION called - Undo stack size:", len(self.undo_stack))
-        
-        if not self.undo_stack:
-            print("Nothing to undo - undo stack is empty")
-            return  # Nothing to undo
-        
-        # Save current state to redo stack
-        current_state = {
-            'elements': [],
-            'connections': []
+            } for connection in self.canvas.connections]
         }
-        
-        # Save current elements
-        for element in self.canvas.elements:
-            element_data = {
-                'type': type(element).__name__,
-                'x': element.x,
-                'y': element.y,
-                'width': element.width,
-                'height': element.height,
-                'label': element.label,
-                'color': element.color.name(),
-                'border_color': element.border_color.name(),
-                'id': element.id,
-                'parent_id': element.parent.id if element.parent else None,
-                'children_ids': [child.id for child in element.children],
-                'container_title': element.container_title
-            }
-            current_state['elements'].append(element_data)
-        
-        # Save current connections
-        for connection in self.canvas.connections:
-            connection_data = {
-                'source_id': connection.source.id,
-                'target_id': connection.target.id,
-                'label': connection.label
-            }
-            current_state['connections'].append(connection_data)
-        
-        # Add current state to redo stack
-        self.redo_stack.append(current_state)
-        print("Added current state to redo stack - Redo stack size:", len(self.redo_stack))
-        
-        # Get the previous state
-        previous_state = self.undo_stack.pop()
-        print("Popped state from undo stack - Elements:", len(previous_state['elements']), "Connections:", len(previous_state['connections']))
-        
-        # Temporarily disconnect the diagram_changed signal to avoid recursion
-        self.canvas.diagram_changed.disconnect(self.update_d2_code)
-        
+    
+    def _restore_state(self, state):
+        """Rebuild the canvas from a snapshot taken by _capture_state"""
+        with updates_suspended(self):
+            # Keep the canvas quiet while it is rebuilt; the code panel is refreshed below
+            with signals_blocked(self.canvas):
+                self._rebuild_canvas(state)
+            
+            # Update the canvas
+            self.canvas.update()
+            
+            # Regenerate the D2 code without triggering on_code_changed
+            self.set_code_text(self.canvas.generate_d2_code())
+    
+    def _rebuild_canvas(self, state):
+        """Replace the canvas contents with the elements and connections in a snapshot"""
         # Clear current canvas
         self.canvas.elements.clear()
         self.canvas.connections.clear()
         self.canvas.selected_elements.clear()
         self.canvas.selected_connections.clear()
         
-        # Create a mapping from old IDs to new elements
-        id_to_element = {}
+        # Recreated elements by their position in the snapshot (None for skipped ones)
+        restored = []
+        
+        # Map saved type names to element classes
+        element_classes = {
+            'BoxElement': BoxElement,
+            'CircleElement': CircleElement,
+            'DiamondElement': DiamondElement,
+            'HexagonElement': HexagonElement
+        }
         
-        # Recreate elements from the previous state
-        for element_data in previous_state['elements']:
+        # Recreate elements from the state
+        for element_data in state['elements']:
             # Create the element based on its type
-            element_type = element_data['type']
-            if element_type == 'BoxElement':
-                element = BoxElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'CircleElement':
-                element = CircleElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'DiamondElement':
-                element = DiamondElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'HexagonElement':
-                element = HexagonElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            else:
-                continue  # Skip unknown element types
+            element_class = element_classes.get(element_data['type'])
+            if element_class is None:
+                restored.append(None)  # Skip unknown element types
+                continue
+            element = element_class(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
             
             # Set properties
             element.id = element_data['id']
-            element.color = QColor(element_data['color'])
-            element.border_color = QColor(element_data['border_color'])
+            element.color = QColor.fromRgba(element_data['color'])
+            element.border_color = QColor.fromRgba(element_data['border_color'])
             element.container_title = element_data['container_title']
             
             # Add to canvas
             self.canvas.elements.append(element)
-            
-            # Store in mapping
-            id_to_element[element.id] = element
+            restored.append(element)
         
         # Restore parent-child relationships
-        for element_data in previous_state['elements']:
-            if element_data['parent_id'] is not None and element_data['id'] in id_to_element and element_data['parent_id'] in id_to_element:
-                child = id_to_element[element_data['id']]
-                parent = id_to_element[element_data['parent_id']]
+        for child, element_data in zip(restored, state['elements']):
+            parent_index = element_data['parent_index']
+            if child is not None and parent_index is not None and restored[parent_index] is not None:
+                parent = restored[parent_index]
                 child.parent = parent
                 parent.children.append(child)
         
         # Recreate connections
-        for connection_data in previous_state['connections']:
-            if connection_data['source_id'] in id_to_element and connection_data['target_id'] in id_to_element:
-                source = id_to_element[connection_data['source_id']]
-                target = id_to_element[connection_data['target_id']]
+        for connection_data in state['connections']:
+            source_index = connection_data['source_index']
+            target_index = connection_data['target_index']
+            if source_index is None or target_index is None:
+                continue
+            source = restored[source_index]
+            target = restored[target_index]
+            if source is not None and target is not None:
                 connection = ArrowConnection(source, target, connection_data['label'])
                 self.canvas.connections.append(connection)
+    
+    def save_state(self):
+        """Save the current state of the diagram for undo functionality"""
+        logger.debug("save_state called - elements: %d, connections: %d", len(self.canvas.elements), len(self.canvas.connections))
         
-        # Update the canvas
-        self.canvas.update()
+        # Don't save state if there are no elements or connections
+        if not self.canvas.elements and not self.canvas.connections:
+            logger.debug("Not saving empty state")
+            return
         
-        # Generate D2 code from the diagram
-        d2_code = self.canvas.generate_d2_code()
+        # Add to undo stack; the deque's maxlen discards the oldest state
+        self.undo_stack.append(self._capture_state())
+        logger.debug("Added state to undo stack - stack size: %d", len(self.undo_stack))
+        
+        # Clear redo stack when a new action is performed
+        if self.redo_stack:
+            self.redo_stack.clear()
+            logger.debug("Cleared redo stack")
+    
+    def undo_action(self):
+        """Undo the last action"""
+        logger.debug("undo_action called - undo stack size: %d", len(self.undo_stack))
+        
+        if not self.undo_stack:
+            logger.debug("Nothing to undo - undo stack is empty")
+            return  # Nothing to undo
         
-        # Temporarily disconnect the textChanged signal to avoid recursion
-        self.code_edit.textChanged.disconnect(self.on_code_changed)
+        # Save current state to redo stack
+        self.redo_stack.append(self._capture_state())
+        logger.debug("Added current state to redo stack - redo stack size: %d", len(self.redo_stack))
         
-        # Update the code panel
-        self.code_edit.setPlainText(d2_code)
+        # Get the previous state
+        previous_state = self.undo_stack.pop()
+        logger.debug("Popped state from undo stack - elements: %d, connections: %d", len(previous_state['elements']), len(previous_state['connections']))
         
-        # Reconnect the signals
-        self.code_edit.textChanged.connect(self.on_code_changed)
-        self.canvas.diagram_changed.connect(self.update_d2_code)
+        self._restore_state(previous_state)
         
-        print("Undo completed - Canvas now has", len(self.canvas.elements), "elements and", len(self.canvas.connections), "connections")
+        logger.debug("Undo completed - canvas now has %d elements and %d connections", len(self.canvas.elements), len(self.canvas.connections))
 
     def redo_action(self):
         """Redo the last undone action"""
-        print("REDO_ACTION called - Redo stack size:", len(self.redo_stack))
+        logger.debug("redo_action called - redo stack size: %d", len(self.redo_stack))
         
         if not self.redo_stack:
-            print("Nothing to redo - redo stack is empty")
+            logger.debug("Nothing to redo - redo stack is empty")
             return  # Nothing to redo
         
         # Save current state to undo stack
-        current_state = {
-            'elements': [],
-            'connections': []
-        }
-        
-        # Save current elements
-        for element in self.canvas.elements:
-            element_data = {
-                'type': type(element).__name__,
-                'x': element.x,
-                'y': element.y,
-                'width': element.width,
-                'height': element.height,
-                'label': element.label,
-                'color': element.color.name(),
-                'border_color': element.border_color.name(),
-                'id': element.id,
-                'parent_id': element.parent.id if element.parent else None,
-                'children_ids': [child.id for child in element.children],
-                'container_title': element.container_title
-            }
-            current_state['elements'].append(element_data)
-        
-        # Save current connections
-        for connection in self.canvas.connections:
-            connection_data = {
-                'source_id': connection.source.id,
-                'target_id': connection.target.id,
-                'label': connection.label
-            }
-            current_state['connections'].append(connection_data)
-        
-        # Add current state to undo stack
-        self.undo_stack.append(current_state)
-        print("Added current state to undo stack - Undo stack size:", len(self.undo_stack))
+        self.undo_stack.append(self._capture_state())
+        logger.debug("Added current state to undo stack - undo stack size: %d", len(self.undo_stack))
         
         # Get the next state from redo stack
         next_state = self.redo_stack.pop()
-        print("Popped state from redo stack - Elements:", len(next_state['elements']), "Connections:", len(next_state['connections']))
-        
-        # Temporarily disconnect the diagram_changed signal to avoid recursion
-        self.canvas.diagram_changed.disconnect(self.update_d2_code)
-        
-        # Clear current canvas
-        self.canvas.elements.clear()
-        self.canvas.connections.clear()
-        self.canvas.selected_elements.clear()
-        self.canvas.selected_connections.clear()
-        
-        # Create a mapping from old IDs to new elements
-        id_to_element = {}
-        
-        # Recreate elements from the next state
-        for element_data in next_state['elements']:
-            # Create the element based on its type
-            element_type = element_data['type']
-            if element_type == 'BoxElement':
-                element = BoxElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'CircleElement':
-                element = CircleElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'DiamondElement':
-                element = DiamondElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            elif element_type == 'HexagonElement':
-                element = HexagonElement(element_data['x'], element_data['y'], element_data['width'], element_data['height'], element_data['label'])
-            else:
-                continue  # Skip unknown element types
-            
-            # Set properties
-            element.id = element_data['id']
-            element.color = QColor(element_data['color'])
-            element.border_color = QColor(element_data['border_color'])
-            element.container_title = element_data['container_title']
-            
-            # Add to canvas
-            self.canvas.elements.append(element)
-            
-            # Store in mapping
-            id_to_element[element.id] = element
-        
-        # Restore parent-child relationships
-        for element_data in next_state['elements']:
-            if element_data['parent_id'] is not None and element_data['id'] in id_to_element and element_data['parent_id'] in id_to_element:
-                child = id_to_element[element_data['id']]
-                parent = id_to_element[element_data['parent_id']]
-                child.parent = parent
-                parent.children.append(child)
-        
-        # Recreate connections
-        for connection_data in next_state['connections']:
-            if connection_data['source_id'] in id_to_element and connection_data['target_id'] in id_to_element:
-                source = id_to_element[connection_data['source_id']]
-                target = id_to_element[connection_data['target_id']]
-                connection = ArrowConnection(source, target, connection_data['label'])
-                self.canvas.connections.append(connection)
-        
-        # Update the canvas
-        self.canvas.update()
-        
-        # Generate D2 code from the diagram
-        d2_code = self.canvas.generate_d2_code()
-        
-        # Temporarily disconnect the textChanged signal to avoid recursion
-        self.code_edit.textChanged.disconnect(self.on_code_changed)
-        
-        # Update the code panel
-        self.code_edit.setPlainText(d2_code)
+        logger.debug("Popped state from redo stack - elements: %d, connections: %d", len(next_state['elements']), len(next_state['connections']))
         
-        # Reconnect the signals
-        self.code_edit.textChanged.connect(self.on_code_changed)
-        self.canvas.diagram_changed.connect(self.update_d2_code)
+        self._restore_state(next_state)
         
-        print("Redo completed - Canvas now has", len(self.canvas.elements), "elements and", len(self.canvas.connections), "connections")
+        logger.debug("Redo completed - canvas now has %d elements and %d connections", len(self.canvas.elements), len(self.canvas.connections))
 
     def title_bar_mouse_press(self, event):
         """Handle mouse press events on the title bar for window dragging"""
@@ -4991,7 +4827,7 @@ class DiagramDesigner(QMainWindow):
     
     def title_bar_mouse_move(self, event):
         """Handle mouse move events on the title bar for window dragging"""
-        if event.buttons() == Qt.LeftButton and hasattr(self, '_drag_pos'):
+        if event.buttons() == Qt.LeftButton and self._drag_pos is not None:
             self.move(event.globalPos() - self._drag_pos)
             event.accept()
     
@@ -5010,7 +4846,8 @@ class InlinePropertiesPanel(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.element = None
-        self.canvas = None  # Reference to the canvas
+        self.canvas = None  # Reference to the canvas, set once by the designer
+        self._label_apply_pending = False
         self.setup_ui()
         self.setVisible(False)  # Hidden by default
     
@@ -5038,7 +4875,7 @@ class InlinePropertiesPanel(QWidget):
                 max-height: 20px;
             }
         """)
-        self.label_edit.textChanged.connect(self.apply_changes)
+        self.label_edit.textChanged.connect(self.schedule_label_apply)
         label_layout.addWidget(label_label)
         label_layout.addWidget(self.label_edit)
         layout.addLayout(label_layout)
@@ -5062,39 +4899,8 @@ class InlinePropertiesPanel(QWidget):
         self.width_value.setStyleSheet("color: #e0e0e0; font-size: 11px; min-width: 25px; background: transparent;")
         self.width_value.setAlignment(Qt.AlignCenter)
         
-        width_minus_btn = QPushButton("-")
-        width_minus_btn.setFixedSize(20, 20)
-        width_minus_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3c3c3c;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-                border-radius: 2px;
-                font-size: 11px;
-                font-weight: bold;
-                padding: 0px;
-            }
-            QPushButton:hover { background-color: #505050; }
-            QPushButton:pressed { background-color: #2a2a2a; }
-        """)
-        width_minus_btn.clicked.connect(self.decrease_width)
-        
-        width_plus_btn = QPushButton("+")
-        width_plus_btn.setFixedSize(20, 20)
-        width_plus_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3c3c3c;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-                border-radius: 2px;
-                font-size: 11px;
-                font-weight: bold;
-                padding: 0px;
-            }
-            QPushButton:hover { background-color: #505050; }
-            QPushButton:pressed { background-color: #2a2a2a; }
-        """)
-        width_plus_btn.clicked.connect(self.increase_width)
+        width_minus_btn = self._make_step_button("-", self.decrease_width)
+        width_plus_btn = self._make_step_button("+", self.increase_width)
         
         size_layout.addWidget(width_label)
         size_layout.addWidget(width_minus_btn)
@@ -5108,39 +4914,8 @@ class InlinePropertiesPanel(QWidget):
         self.height_value.setStyleSheet("color: #e0e0e0; font-size: 11px; min-width: 25px; background: transparent;")
         self.height_value.setAlignment(Qt.AlignCenter)
         
-        height_minus_btn = QPushButton("-")
-        height_minus_btn.setFixedSize(20, 20)
-        height_minus_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3c3c3c;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-                border-radius: 2px;
-                font-size: 11px;
-                font-weight: bold;
-                padding: 0px;
-            }
-            QPushButton:hover { background-color: #505050; }
-            QPushButton:pressed { background-color: #2a2a2a; }
-        """)
-        height_minus_btn.clicked.connect(self.decrease_height)
-        
-        height_plus_btn = QPushButton("+")
-        height_plus_btn.setFixedSize(20, 20)
-        height_plus_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3c3c3c;
-                color: #e0e0e0;
-                border: 1px solid #505050;
-                border-radius: 2px;
-                font-size: 11px;
-                font-weight: bold;
-                padding: 0px;
-            }
-            QPushButton:hover { background-color: #505050; }
-            QPushButton:pressed { background-color: #2a2a2a; }
-        """)
-        height_plus_btn.clicked.connect(self.increase_height)
+        height_minus_btn = self._make_step_button("-", self.decrease_height)
+        height_plus_btn = self._make_step_button("+", self.increase_height)
         
         size_layout.addWidget(height_label)
         size_layout.addWidget(height_minus_btn)
@@ -5188,22 +4963,56 @@ class InlinePropertiesPanel(QWidget):
         
         # Set the layout
         self.setLayout(layout)
-        self.setStyleSheet("background-color: #333333; border-radius: 3px;")
+        # One sheet for the panel and its +/- buttons, instead of one parsed per button
+        self.setStyleSheet("""
+            * { background-color: #333333; border-radius: 3px; }
+            QPushButton#stepButton {
+                background-color: #3c3c3c;
+                color: #e0e0e0;
+                border: 1px solid #505050;
+                border-radius: 2px;
+                font-size: 11px;
+                font-weight: bold;
+                padding: 0px;
+            }
+            QPushButton#stepButton:hover { background-color: #505050; }
+            QPushButton#stepButton:pressed { background-color: #2a2a2a; }
+        """)
+    
+    def _make_step_button(self, text, slot):
+        """Create one of the small +/- size buttons, styled by the panel's stylesheet"""
+        button = QPushButton(text)
+        button.setObjectName("stepButton")
+        button.setFixedSize(20, 20)
+        button.clicked.connect(slot)
+        return button
+    
+    def schedule_label_apply(self):
+        """Queue applying the label field for when control returns to the event loop"""
+        # Each keystroke fires textChanged; a burst of them (typing fast, pasting, undo in
+        # the field) is applied once, with one text measurement and one property_changed
+        if self._label_apply_pending:
+            return
+        self._label_apply_pending = True
+        QTimer.singleShot(0, self._flush_label_apply)
+    
+    def _flush_label_apply(self):
+        """Apply the queued label edit, if it was not already flushed"""
+        if not self._label_apply_pending:
+            return
+        self._label_apply_pending = False
+        self.apply_changes()
     
     def set_element(self, element):
         """Set the element to edit and update the UI"""
+        # A queued edit belongs to the element being edited until now
+        self._flush_label_apply()
         self.element = element
         
-        # Find the canvas in the parent hierarchy
-        parent = self.parent()
-        while parent and not isinstance(parent, DiagramDesigner):
-            parent = parent.parent()
-        
-        if parent and isinstance(parent, DiagramDesigner):
-            self.canvas = parent.canvas
-        
         if element:
-            self.label_edit.setText(element.label)
+            # Filling the field is not an edit, so it must not queue an apply
+            with signals_blocked(self.label_edit):
+                self.label_edit.setText(element.label)
             self.width_value.setText(str(element.width))
             self.height_value.setText(str(element.height))
             self.update_color_buttons()
@@ -5226,9 +5035,9 @@ class InlinePropertiesPanel(QWidget):
                 closest_distance = distance
                 closest_color = color
         
-        # Update button styles
+        # Update button selection states
         for i, color in enumerate(self.colors):
-            self.color_buttons[i].updateStyleSheet(color == closest_color)
+            self.color_buttons[i].setSelected(color == closest_color)
     
     def color_distance(self, color1, color2):
         """Calculate the distance between two colors in RGB space"""
@@ -5236,16 +5045,22 @@ class InlinePropertiesPanel(QWidget):
                (color1.green() - color2.green())**2 + \
                (color1.blue() - color2.blue())**2
     
+    # The +/- handlers go through canvas.resize_element(), which already repaints and
+    # emits diagram_changed, so there is no need to run apply_changes() (and a second
+    # property_changed round) after them. Label edits are applied on the event loop,
+    # so each handler first flushes a queued one: the minimum size depends on the label.
+    
     def increase_width(self):
         """Increase the element width by 10px"""
+        self._flush_label_apply()
         if self.element and self.canvas:
             new_width = min(500, self.element.width + 10)  # Increased max width to 500px
             self.canvas.resize_element(self.element, new_width, self.element.height)
             self.width_value.setText(str(self.element.width))
-            self.apply_changes()
     
     def decrease_width(self):
         """Decrease the element width by 10px"""
+        self._flush_label_apply()
         if self.element and self.canvas:
             # Calculate the minimum width based on text content
             min_width, _ = self.element._calculate_min_size_for_text(self.element.label)
@@ -5255,18 +5070,18 @@ class InlinePropertiesPanel(QWidget):
             
             self.canvas.resize_element(self.element, new_width, self.element.height)
             self.width_value.setText(str(self.element.width))
-            self.apply_changes()
     
     def increase_height(self):
         """Increase the element height by 10px"""
+        self._flush_label_apply()
         if self.element and self.canvas:
             new_height = min(500, self.element.height + 10)  # Increased max height to 500px
             self.canvas.resize_element(self.element, self.element.width, new_height)
             self.height_value.setText(str(self.element.height))
-            self.apply_changes()
     
     def decrease_height(self):
         """Decrease the element height by 10px"""
+        self._flush_label_apply()
         if self.element and self.canvas:
             # Calculate the minimum height based on text content
             _, min_height = self.element._calculate_min_size_for_text(self.element.label)
@@ -5276,7 +5091,6 @@ class InlinePropertiesPanel(QWidget):
             
             self.canvas.resize_element(self.element, self.element.width, new_height)
             self.height_value.setText(str(self.element.height))
-            self.apply_changes()
     
     def set_color(self, color):
         """Set the element color"""
@@ -5319,6 +5133,7 @@ class InlinePropertiesPanel(QWidget):
     
     def hide_panel(self):
         """Hide the panel"""
+        self._flush_label_apply()
         self.setVisible(False)
         self.element = None
 
@@ -5334,22 +5149,29 @@ class ColorButton(QPushButton):
         self.long_press_timer = None
         self.pressed = False
         self.setFixedSize(16, 16)
-        self.updateStyleSheet()
-        
-    def updateStyleSheet(self, selected=False):
-        """Update the button style based on selection state"""
-        border = "2px solid #00FFFF" if selected else "1px solid #646464"
-        hover = "" if selected else "QPushButton:hover { border: 1px solid #e0e0e0; }"
-        
+        # The sheet is set once; selection is a dynamic property that its selectors
+        # react to, so toggling it does not rebuild and re-parse the sheet
+        self.setProperty("selected", False)
         self.setStyleSheet(f"""
             QPushButton {{
                 background-color: rgb({self.base_color.red()}, {self.base_color.green()}, {self.base_color.blue()});
-                border: {border};
+                border: 1px solid #646464;
                 border-radius: 2px;
                 padding: 0px;
             }}
-            {hover}
+            QPushButton[selected="false"]:hover {{ border: 1px solid #e0e0e0; }}
+            QPushButton[selected="true"] {{ border: 2px solid #00FFFF; }}
         """)
+        
+    def setSelected(self, selected):
+        """Mark the button as the selected palette color"""
+        if self.property("selected") == selected:
+            return
+        self.setProperty("selected", selected)
+        # Re-polish so the style engine picks up the new property value
+        self.style().unpolish(self)
+        self.style().polish(self)
+        self.update()
     
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -5393,6 +5215,37 @@ class ColorButton(QPushButton):
         self.shade_popup = None
 
 
+@lru_cache(maxsize=64)
+def shade_table(rgba, num_shades=5):
+    """Return a tuple of darker shades, the base color and lighter tints for an RGBA value"""
+    base_color = QColor.fromRgba(rgba)
+    shades = []
+    
+    # Get HSL values to manipulate
+    hue = base_color.hue()
+    saturation = base_color.saturation()
+    lightness = base_color.lightness()
+    
+    # Create darker shades (lower lightness)
+    for i in range(1, num_shades):
+        new_lightness = max(0, lightness - (i * 25))
+        color = QColor()
+        color.setHsl(hue, saturation, new_lightness)
+        shades.append(color)
+    
+    # Add original color
+    shades.append(base_color)
+    
+    # Create lighter tints (higher lightness)
+    for i in range(1, num_shades):
+        new_lightness = min(255, lightness + (i * 25))
+        color = QColor()
+        color.setHsl(hue, saturation, new_lightness)
+        shades.append(color)
+    
+    return tuple(shades)
+
+
 class ColorShadePopup(QWidget):
     """Custom popup widget for displaying and selecting color shades"""
     colorSelected = pyqtSignal(QColor)
@@ -5412,40 +5265,29 @@ class ColorShadePopup(QWidget):
         
     def generateShades(self, base_color, num_shades=5):
         """Generate various shades and tints of the base color"""
-        shades = []
-        
-        # Get HSL values to manipulate
-        hue = base_color.hue()
-        saturation = base_color.saturation()
-        lightness = base_color.lightness()
-        
-        # Create darker shades (lower lightness)
-        for i in range(1, num_shades):
-            new_lightness = max(0, lightness - (i * 25))
-            color = QColor()
-            color.setHsl(hue, saturation, new_lightness)
-            shades.append(color)
-        
-        # Add original color
-        shades.append(base_color)
-        
-        # Create lighter tints (higher lightness)
-        for i in range(1, num_shades):
-            new_lightness = min(255, lightness + (i * 25))
-            color = QColor()
-            color.setHsl(hue, saturation, new_lightness)
-            shades.append(color)
-        
-        return shades
+        # The shades only depend on the base color, so each palette color's table
+        # is computed once and reused every time its popup opens
+        return list(shade_table(base_color.rgba(), num_shades))
+    
+    def swatchRect(self, index):
+        """Return the rectangle of the swatch at index"""
+        return QRect(2, index * 22 + 2, self.width() - 4, 20)
+    
+    def updateSwatch(self, index):
+        """Schedule a repaint of a single swatch, including its hover border"""
+        if 0 <= index < len(self.shades):
+            self.update(self.swatchRect(index).adjusted(-2, -2, 2, 2))
     
     def paintEvent(self, event):
         """Draw the color shade swatches"""
         painter = QPainter(self)
-        width = self.width()
+        exposed_rect = event.rect()
         
-        # Draw each color swatch
+        # Draw each color swatch that needs repainting
         for i, shade in enumerate(self.shades):
-            rect = QRect(2, i * 22 + 2, width - 4, 20)
+            rect = self.swatchRect(i)
+            if not rect.adjusted(-2, -2, 2, 2).intersects(exposed_rect):
+                continue
             
             # Set border based on hover state
             if i == self.hoveredIndex:
@@ -5463,14 +5305,15 @@ class ColorShadePopup(QWidget):
         index = int(y / 22)
         
         # Ensure index is in bounds
-        if 0 <= index < len(self.shades):
-            if index != self.hoveredIndex:
-                self.hoveredIndex = index
-                self.update()  # Repaint to show highlight
-        else:
-            if self.hoveredIndex != -1:
-                self.hoveredIndex = -1
-                self.update()
+        if not 0 <= index < len(self.shades):
+            index = -1
+        
+        # Repaint only the swatches whose highlight changed
+        if index != self.hoveredIndex:
+            previous_index = self.hoveredIndex
+            self.hoveredIndex = index
+            self.updateSwatch(previous_index)
+            self.updateSwatch(index)
     
     def mouseReleaseEvent(self, event):
         """Select the color on mouse release"""
@@ -5495,8 +5338,14 @@ def exception_hook(exctype, value, traceback):
 
 
 if __name__ == "__main__":
+    # Only warnings and errors by default; switch to logging.DEBUG for diagnostic output
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    
     app = QApplication(sys.argv)
     
+    if PIXMAP_CACHE_LIMIT_KB is not None:
+        QPixmapCache.setCacheLimit(PIXMAP_CACHE_LIMIT_KB)
+    
     # Set up exception hook to print detailed exceptions
     sys.excepthook = exception_hook
     